@@ -0,0 +1,144 @@
+"""
+Statistiques du tableau de bord administrateur.
+Tous les agrégats (totaux, annonces par type, annonces par jour sur 30 jours,
+utilisateurs et administrateurs) sont lus en un seul aller-retour (UNION ALL).
+Un instantané optionnel (table stats_snapshot) évite de recalculer à chaque
+affichage sur les grosses tables.
+"""
+
+import json
+import logging
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, literal, null, select, union_all
+
+from models import db, User, PropertyListing, StatsSnapshot
+
+logger = logging.getLogger(__name__)
+
+# Période de l'histogramme quotidien
+DAILY_WINDOW_DAYS = 30
+
+SNAPSHOT_KEY = 'admin_dashboard'
+
+
+def compute_dashboard_stats():
+    """
+    Calcule tous les agrégats du tableau de bord en une seule requête.
+
+    :return: Dict {total_listings, total_users, total_admins, by_type, per_day, computed_at}
+    """
+    since = datetime.now(timezone.utc) - timedelta(days=DAILY_WINDOW_DAYS - 1)
+    since = since.replace(hour=0, minute=0, second=0, microsecond=0)
+    day = func.date(PropertyListing.created_at)
+
+    by_type = select(
+        literal('type').label('kind'),
+        PropertyListing.property_type.label('bucket'),
+        func.count().label('n')
+    ).group_by(PropertyListing.property_type)
+
+    per_day = select(
+        literal('day').label('kind'),
+        func.cast(day, db.String).label('bucket'),
+        func.count().label('n')
+    ).where(PropertyListing.created_at >= since).group_by(day)
+
+    users = select(
+        literal('users').label('kind'),
+        null().label('bucket'),
+        func.count().label('n')
+    ).select_from(User)
+
+    admins = select(
+        literal('admins').label('kind'),
+        null().label('bucket'),
+        func.count().label('n')
+    ).select_from(User).where(User.is_admin.is_(True))
+
+    rows = db.session.execute(union_all(by_type, per_day, users, admins)).all()
+
+    stats = {
+        'total_listings': 0,
+        'total_users': 0,
+        'total_admins': 0,
+        'by_type': {},
+        'per_day': {},
+    }
+    for kind, bucket, n in rows:
+        if kind == 'type':
+            stats['by_type'][bucket] = n
+            stats['total_listings'] += n
+        elif kind == 'day':
+            stats['per_day'][str(bucket)[:10]] = n
+        elif kind == 'users':
+            stats['total_users'] = n
+        elif kind == 'admins':
+            stats['total_admins'] = n
+
+    # Histogramme complet, jours sans annonce compris
+    first_day = since.date()
+    stats['per_day'] = [
+        ((first_day + timedelta(days=offset)).isoformat(),
+         stats['per_day'].get((first_day + timedelta(days=offset)).isoformat(), 0))
+        for offset in range(DAILY_WINDOW_DAYS)
+    ]
+    stats['computed_at'] = datetime.now(timezone.utc).isoformat()
+    return stats
+
+
+def refresh_snapshot():
+    """Recalcule et enregistre l'instantané des statistiques"""
+    stats = compute_dashboard_stats()
+    snapshot = db.session.get(StatsSnapshot, SNAPSHOT_KEY)
+    if snapshot is None:
+        snapshot = StatsSnapshot(key=SNAPSHOT_KEY)
+        db.session.add(snapshot)
+    snapshot.payload = json.dumps(stats)
+    snapshot.computed_at = datetime.now(timezone.utc)
+    db.session.commit()
+    return stats
+
+
+def get_dashboard_stats(max_age=0):
+    """
+    Retourne les statistiques du tableau de bord.
+
+    :param max_age: Âge maximal de l'instantané en secondes (0 = calcul direct)
+    """
+    if not max_age:
+        return compute_dashboard_stats()
+
+    snapshot = db.session.get(StatsSnapshot, SNAPSHOT_KEY)
+    if snapshot is not None and snapshot.computed_at is not None:
+        computed_at = snapshot.computed_at
+        if computed_at.tzinfo is None:
+            computed_at = computed_at.replace(tzinfo=timezone.utc)
+        if datetime.now(timezone.utc) - computed_at < timedelta(seconds=max_age):
+            return json.loads(snapshot.payload)
+
+    try:
+        return refresh_snapshot()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Impossible d'enregistrer l'instantané des statistiques : {e}")
+        return compute_dashboard_stats()
+
+
+def recent_users_with_counts(limit=5):
+    """
+    Derniers utilisateurs inscrits avec leur nombre d'annonces, en une requête.
+    Le comptage corrélé n'est évalué que pour les lignes retenues (index user_id).
+
+    :return: Liste de tuples (User, nombre d'annonces)
+    """
+    listing_count = (
+        select(func.count(PropertyListing.id))
+        .where(PropertyListing.user_id == User.id)
+        .correlate(User)
+        .scalar_subquery()
+        .label('listing_count')
+    )
+    return db.session.query(User, listing_count) \
+        .order_by(User.id.desc()) \
+        .limit(limit).all()
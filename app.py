@@ -5,7 +5,7 @@ Optimisée pour le déploiement sur Render avec Supabase et Cloudinary
 
 import os
 import logging
-from flask import Flask, render_template, redirect, url_for
+from flask import Flask, render_template, redirect, url_for, make_response, request, jsonify
 from flask_login import LoginManager
 from config import config
 import cloudinary
@@ -33,9 +33,45 @@ def create_app():
         logging.basicConfig(level=logging.INFO)
         app.logger.setLevel(logging.INFO)
 
-    # Initialisation de la base de données
+    # Initialisation de la base de données (pool dimensionné selon l'environnement)
     from models import db
+    from db_pool import configure_pool, register_pool_events
+    from db_routing import configure_replica, replica_router, REPLICA_BIND_KEY
+    configure_pool(app)
+    configure_replica(app)
     db.init_app(app)
+    with app.app_context():
+        for engine in db.engines.values():
+            register_pool_events(app, engine)
+        replica_router.init_app(app, db.engines.get(REPLICA_BIND_KEY))
+
+    # Instrumentation des requêtes (optionnelle : PROFILING_ENABLED)
+    from profiling import profiler
+    with app.app_context():
+        profiler.init_app(app, engines=list(db.engines.values()))
+
+    # Métriques Prometheus (/metrics), agrégées entre workers si METRICS_MULTIPROC_DIR
+    from metrics import metrics, register_listing_events
+    with app.app_context():
+        metrics.init_app(app, engines={key or 'primary': engine for key, engine in db.engines.items()})
+    register_listing_events(db.session)
+
+    # Surveillance des requêtes N+1 (développement/tests)
+    from query_profiles import register_lazy_load_guard
+    register_lazy_load_guard(app, db.session)
+
+    # Cache des pages publiques, invalidé après chaque commit
+    from cache import page_cache, register_cache_invalidation
+    page_cache.init_app(app)
+    register_cache_invalidation(page_cache, db.session)
+
+    # File d'upload asynchrone des médias
+    from upload_queue import upload_queue
+    upload_queue.init_app(app)
+
+    # Suppression des fichiers Cloudinary en arrière-plan
+    from media_cleanup import media_outbox
+    media_outbox.init_app(app)
 
     # === 🔧 FLASK-MIGRATE : ACTIVÉ DANS TOUS LES ENVIRONNEMENTS ===
     try:
@@ -50,11 +86,22 @@ def create_app():
     # Initialisation de Flask-Login
     login_manager.init_app(app)
 
+    # Politique de hachage des mots de passe (pool de threads borné)
+    from passwords import password_hasher
+    password_hasher.init_app(app)
+
+    # Limitation de débit des routes d'authentification
+    from rate_limit import rate_limiter
+    rate_limiter.init_app(app)
+
+    # Instantanés des utilisateurs connectés (évite une requête par page)
+    from user_cache import user_cache
+    user_cache.init_app(app)
+
     @login_manager.user_loader
     def load_user(user_id):
-        from models import User
         try:
-            return User.query.get(int(user_id))
+            return user_cache.load(int(user_id))
         except Exception as e:
             app.logger.error(f"Erreur chargement utilisateur {user_id}: {e}")
             return None
@@ -62,9 +109,17 @@ def create_app():
     # Configuration Cloudinary
     configure_cloudinary(app)
 
+    # Backend de stockage des médias (Cloudinary ou substitut hors ligne)
+    from media_storage import media_storage
+    media_storage.init_app(app)
+
     # Enregistrement des blueprints
     register_blueprints(app)
 
+    # Filtres Jinja des URLs d'images redimensionnées
+    from media_urls import register_media_helpers
+    register_media_helpers(app)
+
     # Gestionnaires d'erreurs
     register_error_handlers(app)
 
@@ -74,6 +129,8 @@ def create_app():
         with app.app_context():
             try:
                 db.create_all()
+                from search import ensure_search_index
+                ensure_search_index(db.engine)
                 app.logger.info("🔧 Tables créées (mode développement)")
             except Exception as e:
                 app.logger.error(f"❌ Erreur création tables : {e}")
@@ -151,6 +208,18 @@ def register_error_handlers(app):
     def forbidden_error(error):
         return render_template('errors/403.html'), 403
 
+    @app.errorhandler(429)
+    def too_many_requests_error(error):
+        # Endpoints JSON (signature d'upload direct...) : réponse lisible par le script appelant
+        if request.is_json or request.accept_mimetypes.best == 'application/json':
+            response = make_response(jsonify(error="Trop de requêtes, veuillez réessayer plus tard.",
+                                             retry_after=error.retry_after), 429)
+        else:
+            response = make_response(render_template('errors/429.html', retry_after=error.retry_after), 429)
+        if error.retry_after:
+            response.headers['Retry-After'] = str(error.retry_after)
+        return response
+
 
 # Instance de l'application
 app = create_app()
@@ -0,0 +1,370 @@
+"""
+Cache des pages publiques (flux et détail d'annonce) et de fragments.
+Deux backends : LRU en mémoire (par worker) ou fichiers locaux partagés entre
+les workers gunicorn (CACHE_DIR, éventuellement sous /dev/shm).
+L'invalidation est précise : chaque entrée porte des tags ('feed', 'listing:<id>')
+dont la génération change après chaque commit qui modifie une annonce ou un média.
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import request, session, make_response
+from flask_login import current_user
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# En-têtes conservés avec le corps d'une page en cache
+CACHED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Cache-Control', 'Vary')
+
+
+class MemoryBackend:
+    """
+    LRU en mémoire, borné en nombre d'entrées, avec TTL.
+    Les générations de tags sont aussi bornées (LRU) : une génération oubliée est
+    remplacée par un plancher au moins aussi récent, ce qui invalide les entrées
+    des tags inconnus au lieu de ressusciter d'anciennes versions.
+    """
+
+    def __init__(self, max_entries=512, max_generations=None):
+        self.max_entries = max_entries
+        self.max_generations = max_generations or max_entries * 4
+        self._entries = OrderedDict()
+        self._generations = OrderedDict()
+        self._generation_floor = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def get_generation(self, tag):
+        return self._generations.get(tag, self._generation_floor)
+
+    def bump_generation(self, tag):
+        with self._lock:
+            self._generations[tag] = time.time_ns()
+            self._generations.move_to_end(tag)
+            while len(self._generations) > self.max_generations:
+                _, generation = self._generations.popitem(last=False)
+                self._generation_floor = max(self._generation_floor, generation)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generations.clear()
+            self._generation_floor = 0
+
+
+def private_directory(path):
+    """
+    Crée (ou vérifie) un répertoire réservé à l'utilisateur courant : les entrées du
+    cache sont désérialisées avec pickle, un fichier déposé par un autre utilisateur
+    permettrait d'exécuter du code.
+
+    :raises PermissionError: Répertoire appartenant à un autre utilisateur, ou lien symbolique
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.lstat(path)
+    if os.path.islink(path) or (hasattr(os, 'getuid') and info.st_uid != os.getuid()):
+        raise PermissionError(f"Répertoire de cache non sûr (autre propriétaire ou lien) : {path}")
+    if info.st_mode & 0o077:
+        # Répertoire existant trop permissif : le restreindre
+        os.chmod(path, 0o700)
+    return path
+
+
+class FileSystemBackend:
+    """
+    Cache sur disque local partagé par tous les workers d'une même machine.
+    Les écritures sont atomiques (fichier temporaire + os.replace) ; le répertoire
+    est privé (0700, propriétaire vérifié) car les entrées sont sérialisées avec pickle.
+    """
+
+    # Nombre d'écritures entre deux purges du répertoire
+    PRUNE_INTERVAL = 64
+
+    def __init__(self, directory, max_entries=2048):
+        self.max_entries = max_entries
+        private_directory(directory)
+        self._entries_dir = private_directory(os.path.join(directory, 'entries'))
+        self._generations_dir = private_directory(os.path.join(directory, 'generations'))
+        self._writes = 0
+
+    @staticmethod
+    def _filename(key):
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def _write(self, path, payload):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+        except OSError:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def get(self, key):
+        path = os.path.join(self._entries_dir, self._filename(key))
+        try:
+            with open(path, 'rb') as f:
+                expires_at, value = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+            return None
+        if expires_at < time.time():
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            return None
+        return value
+
+    def set(self, key, value, ttl):
+        path = os.path.join(self._entries_dir, self._filename(key))
+        self._write(path, pickle.dumps((time.time() + ttl, value), pickle.HIGHEST_PROTOCOL))
+        self._writes += 1
+        if self._writes % self.PRUNE_INTERVAL == 0:
+            self._prune()
+
+    def _prune(self):
+        """Supprime les entrées expirées puis les plus anciennes au-delà de max_entries"""
+        try:
+            entries = [e for e in os.scandir(self._entries_dir) if e.is_file()]
+        except OSError:
+            return
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        for entry in entries[:len(entries) - self.max_entries]:
+            try:
+                os.unlink(entry.path)
+            except OSError:
+                pass
+
+    def get_generation(self, tag):
+        path = os.path.join(self._generations_dir, self._filename(tag))
+        try:
+            with open(path, 'rb') as f:
+                return int(f.read() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def bump_generation(self, tag):
+        path = os.path.join(self._generations_dir, self._filename(tag))
+        self._write(path, str(time.time_ns()).encode('ascii'))
+
+    def clear(self):
+        for directory in (self._entries_dir, self._generations_dir):
+            for entry in os.scandir(directory):
+                try:
+                    os.unlink(entry.path)
+                except OSError:
+                    pass
+
+
+class ResponseCache:
+    """Extension Flask : cache de pages et de fragments avec invalidation par tags"""
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.default_ttl = 60
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = app.config.get('CACHE_BACKEND', 'memory')
+        max_entries = app.config.get('CACHE_MAX_ENTRIES', 512)
+        self.default_ttl = app.config.get('CACHE_DEFAULT_TTL', 60)
+
+        if backend == 'memory':
+            self.backend = MemoryBackend(max_entries=max_entries)
+        elif backend == 'filesystem':
+            # Répertoire par défaut propre à l'utilisateur (jamais partagé avec un autre compte)
+            directory = app.config.get('CACHE_DIR') or os.path.join(
+                tempfile.gettempdir(), f"immo-cache-{os.getuid() if hasattr(os, 'getuid') else 'app'}")
+            self.backend = FileSystemBackend(directory, max_entries=max_entries)
+        else:
+            self.backend = None
+
+        app.extensions['response_cache'] = self
+        app.logger.info(f"🗄️ Cache de réponses : {backend if self.backend else 'désactivé'}")
+
+    @property
+    def enabled(self):
+        return self.backend is not None
+
+    def _count(self, hit):
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        """Compteurs de succès/échecs du worker courant"""
+        total = self.hits + self.misses
+        return {
+            'backend': type(self.backend).__name__ if self.backend else None,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+        }
+
+    def _versioned_key(self, key, tags):
+        generations = ','.join(f"{tag}={self.backend.get_generation(tag)}" for tag in sorted(tags))
+        return f"{key}|{generations}"
+
+    def get_or_set(self, key, tags, producer, ttl=None):
+        """
+        Retourne une valeur en cache ou la calcule avec producer().
+
+        :param key: Clé du fragment
+        :param tags: Tags d'invalidation de l'entrée
+        :param producer: Fonction sans argument produisant la valeur
+        """
+        if not self.enabled:
+            return producer()
+        full_key = self._versioned_key(f"fragment:{key}", tags)
+        value = self.backend.get(full_key)
+        self._count(value is not None)
+        if value is None:
+            value = producer()
+            self.backend.set(full_key, value, ttl or self.default_ttl)
+        return value
+
+    def invalidate(self, *tags):
+        """Invalide toutes les entrées portant l'un des tags"""
+        if not self.enabled:
+            return
+        for tag in tags:
+            try:
+                self.backend.bump_generation(tag)
+            except OSError as e:
+                logger.error(f"Impossible d'invalider le tag {tag} : {e}")
+
+    def clear(self):
+        if self.enabled:
+            self.backend.clear()
+
+    @staticmethod
+    def _page_key():
+        """Clé de page : chemin, paramètres triés et état d'authentification"""
+        args = '&'.join(f"{k}={v}" for k, v in sorted(request.args.items(multi=True)))
+        viewer = f"user:{current_user.get_id()}" if current_user.is_authenticated else 'anon'
+        return f"page:{request.path}?{args}|{viewer}"
+
+    def cached_page(self, tags, ttl=None):
+        """
+        Décorateur de vue : met en cache les réponses 200 des requêtes GET/HEAD.
+
+        :param tags: Fonction recevant les arguments de la vue et retournant les tags
+        :param ttl: Durée de vie en secondes (CACHE_DEFAULT_TTL par défaut)
+        """
+        def decorator(f):
+            @wraps(f)
+            def decorated_function(*args, **kwargs):
+                # Pas de cache si des messages flash attendent d'être affichés
+                if not self.enabled or request.method not in ('GET', 'HEAD') \
+                        or session.get('_flashes'):
+                    return f(*args, **kwargs)
+
+                key = self._versioned_key(self._page_key(), tags(*args, **kwargs))
+                cached = self.backend.get(key)
+                if cached is not None:
+                    self._count(True)
+                    body, status, headers = cached
+                    response = make_response(body, status, headers)
+                    response.headers['X-Cache'] = 'HIT'
+                    # Répondre 304 si le client a déjà cette version
+                    return response.make_conditional(request)
+
+                self._count(False)
+                response = make_response(f(*args, **kwargs))
+                if response.status_code == 200 and not response.direct_passthrough:
+                    headers = {name: response.headers[name] for name in CACHED_HEADERS
+                               if name in response.headers}
+                    try:
+                        self.backend.set(key, (response.get_data(), 200, headers), ttl or self.default_ttl)
+                    except OSError as e:
+                        logger.error(f"Écriture du cache impossible : {e}")
+                response.headers['X-Cache'] = 'MISS'
+                return response
+            return decorated_function
+        return decorator
+
+
+def listing_tags(listing_id):
+    """Tags d'invalidation d'une annonce (page de détail)"""
+    return (f"listing:{listing_id}",)
+
+
+def register_cache_invalidation(cache, session):
+    """
+    Invalide le cache après chaque commit modifiant une annonce ou un média.
+    Les tags sont collectés au flush puis appliqués uniquement si le commit réussit.
+    """
+    from models import User, PropertyListing, Media
+
+    @event.listens_for(session, 'after_flush')
+    def _collect_tags(db_session, flush_context):
+        tags = db_session.info.setdefault('cache_tags', set())
+        for obj in list(db_session.new) + list(db_session.dirty) + list(db_session.deleted):
+            if isinstance(obj, PropertyListing):
+                tags.add('feed')
+                if obj.id is not None:
+                    tags.update(listing_tags(obj.id))
+            elif isinstance(obj, Media):
+                tags.add('feed')
+                if obj.listing_id is not None:
+                    tags.update(listing_tags(obj.listing_id))
+            elif isinstance(obj, User):
+                # Le nom de l'auteur apparaît sur les cartes du flux
+                tags.add('feed')
+
+    @event.listens_for(session, 'after_commit')
+    def _invalidate(db_session):
+        tags = db_session.info.pop('cache_tags', None)
+        if tags:
+            cache.invalidate(*tags)
+
+    @event.listens_for(session, 'after_rollback')
+    def _discard(db_session):
+        db_session.info.pop('cache_tags', None)
+
+
+# Instance partagée, initialisée dans create_app()
+page_cache = ResponseCache()
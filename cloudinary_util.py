@@ -2,12 +2,20 @@
 Utilitaires pour l'intégration de Cloudinary.
 Permet d'uploader, supprimer et gérer des fichiers (images, vidéos) dans le cloud.
 Utilise les upload presets : immo_upload (images) et immo_upload_video (vidéos).
+Les appels passent par le backend de stockage configuré (media_storage.py) :
+Cloudinary en production, substitut local ou en mémoire hors ligne.
 """
 
 import cloudinary
-import cloudinary.uploader
+import cloudinary.utils
+import hmac
 import os
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from profiling import profiler
+from metrics import track_cloudinary
+from media_storage import media_storage, StorageError
 
 # Configuration du logger
 logger = logging.getLogger(__name__)
@@ -20,6 +28,19 @@ PRESET_VIDEO = "immo_upload_video"
 FOLDER_IMAGE = "annonces/images"
 FOLDER_VIDEO = "annonces/videos"
 
+# Nombre maximal d'uploads simultanés
+MAX_PARALLEL_UPLOADS = 4
+
+# Limite de l'API d'administration pour une suppression groupée
+DELETE_BATCH_SIZE = 100
+
+# API d'upload (remplaçable par un bouchon local pour les tests)
+DEFAULT_UPLOAD_API_URL = "https://api.cloudinary.com/v1_1"
+
+
+class DirectUploadError(ValueError):
+    """Réponse d'upload direct invalide, expirée ou non signée par Cloudinary"""
+
 
 def init_cloudinary():
     """
@@ -54,6 +75,23 @@ def init_cloudinary():
         raise RuntimeError("Impossible d'initialiser Cloudinary.") from e
 
 
+def upload_destination(resource_type):
+    """Upload preset et dossier d'un type de ressource : (preset, dossier), ou (None, None) pour 'raw'"""
+    if resource_type == 'image':
+        return PRESET_IMAGE, FOLDER_IMAGE
+    if resource_type == 'video':
+        return PRESET_VIDEO, FOLDER_VIDEO
+    return None, None
+
+
+def is_configured():
+    """Identifiants Cloudinary complets (nécessaires pour signer les uploads directs)"""
+    config = cloudinary.config()
+    return bool(config.cloud_name and config.api_key and config.api_secret)
+
+
+@profiler.track_external
+@track_cloudinary('upload')
 def upload_file(file, resource_type='image'):
     """
     Téléverse un fichier vers Cloudinary en utilisant le bon upload preset.
@@ -67,44 +105,61 @@ def upload_file(file, resource_type='image'):
         return None
 
     # Déterminer le preset et le dossier
-    if resource_type == 'image':
-        preset = PRESET_IMAGE
-        folder = FOLDER_IMAGE
-    elif resource_type == 'video':
-        preset = PRESET_VIDEO
-        folder = FOLDER_VIDEO
-    else:
-        preset = None
-        folder = None
-
-    upload_options = {
-        'resource_type': resource_type,
-        'preset': preset,           # Utilise le preset Cloudinary
-        'folder': folder,           # Organise dans un dossier
-        'use_filename': True,       # Garde le nom original
-        'unique_filename': True,    # Génère un ID unique si conflit
-        'overwrite': False,         # Ne remplace pas les fichiers
-        'timeout': 10,
-    }
+    preset, folder = upload_destination(resource_type)
 
     try:
-        result = cloudinary.uploader.upload(file, **upload_options)
-        logger.info(f"Fichier uploadé : {result['public_id']} ({result['secure_url']})")
-        return {
-            'public_id': result['public_id'],
-            'url': result['secure_url'],
-            'type': resource_type
-        }
-    except Exception as e:
-        logger.error(f"[Cloudinary] Échec de l'upload : {str(e)}", exc_info=True)
+        result = media_storage.backend.upload(file, resource_type, folder=folder, preset=preset)
+        logger.info(f"Fichier uploadé : {result['public_id']} ({result['url']})")
+        return result
+    except StorageError as e:
+        logger.error(f"[Cloudinary] Échec de l'upload : {str(e)}")
         return None
 
 
-def delete_file(public_id):
+@profiler.track_external
+def upload_files(files, max_workers=MAX_PARALLEL_UPLOADS):
+    """
+    Téléverse plusieurs fichiers en parallèle (pool de threads borné).
+    Si un seul upload échoue, les fichiers déjà envoyés sont supprimés.
+
+    :param files: Liste de tuples (fichier, resource_type)
+    :param max_workers: Nombre maximal d'uploads simultanés
+    :return: Liste des résultats de upload_file dans l'ordre d'entrée, ou None en cas d'échec
+    """
+    if not files:
+        return []
+
+    workers = max(1, min(max_workers, len(files)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='cloudinary') as executor:
+        futures = [executor.submit(upload_file, file, resource_type) for file, resource_type in files]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                logger.error(f"[Cloudinary] Upload parallèle interrompu : {str(e)}", exc_info=True)
+                results.append(None)
+
+    if all(results):
+        return results
+
+    # Échec partiel : ne pas laisser d'assets orphelins
+    uploaded = [result for result in results if result]
+    logger.warning(f"[Cloudinary] {len(files) - len(uploaded)} upload(s) en échec, "
+                   f"suppression de {len(uploaded)} fichier(s) déjà envoyé(s)")
+    for result in uploaded:
+        delete_file(result['public_id'], result['type'])
+    return None
+
+
+@profiler.track_external
+@track_cloudinary('delete')
+def delete_file(public_id, resource_type='image'):
     """
     Supprime un fichier sur Cloudinary.
 
     :param public_id: Identifiant du fichier
+    :param resource_type: 'image', 'video' ou 'raw' (Cloudinary ne trouve pas une vidéo sans ce type)
     :return: True si supprimé, False sinon
     """
     if not public_id:
@@ -112,18 +167,108 @@ def delete_file(public_id):
         return False
 
     try:
-        result = cloudinary.uploader.destroy(public_id)
-        success = result.get('result') == 'ok'
+        success = media_storage.backend.delete(public_id, resource_type)
         if success:
             logger.info(f"Fichier supprimé : {public_id}")
         else:
             logger.warning(f"Échec de suppression (pas trouvé ou déjà supprimé) : {public_id}")
         return success
-    except Exception as e:
-        logger.error(f"[Cloudinary] Impossible de supprimer {public_id} : {str(e)}", exc_info=True)
+    except StorageError as e:
+        logger.error(f"[Cloudinary] Impossible de supprimer {public_id} : {str(e)}")
         return False
 
 
+@profiler.track_external
+@track_cloudinary('bulk_delete', succeeded=lambda outcome: all(outcome.values()))
+def delete_files(public_ids, resource_type='image'):
+    """
+    Supprime plusieurs fichiers sur Cloudinary par lots (API d'administration).
+    Un appel par tranche de DELETE_BATCH_SIZE identifiants.
+
+    :param public_ids: Identifiants des fichiers, tous du même resource_type
+    :param resource_type: 'image', 'video' ou 'raw'
+    :return: Dict {public_id: True si supprimé ou déjà absent, False sinon}
+    """
+    outcome = {}
+    public_ids = [public_id for public_id in public_ids if public_id]
+
+    for start in range(0, len(public_ids), DELETE_BATCH_SIZE):
+        chunk = public_ids[start:start + DELETE_BATCH_SIZE]
+        try:
+            outcome.update(media_storage.backend.delete_many(chunk, resource_type))
+            logger.info(f"Suppression groupée : {sum(outcome[p] for p in chunk)}/{len(chunk)} fichier(s) {resource_type}")
+        except StorageError as e:
+            logger.error(f"[Cloudinary] Échec de la suppression groupée ({len(chunk)} fichiers) : {str(e)}")
+            outcome.update({public_id: False for public_id in chunk})
+
+    return outcome
+
+
+def sign_direct_upload(resource_type, api_url=DEFAULT_UPLOAD_API_URL):
+    """
+    Paramètres signés permettant au navigateur d'envoyer un fichier directement à Cloudinary.
+    Le preset et le dossier sont imposés par la signature ; Cloudinary refuse une
+    signature de plus d'une heure.
+
+    :param resource_type: 'image' ou 'video'
+    :param api_url: Base de l'API d'upload
+    :return: Dict des champs à joindre au formulaire d'upload, plus 'upload_url'
+    """
+    if resource_type not in ('image', 'video'):
+        raise DirectUploadError(f"Type de ressource invalide : {resource_type}")
+    if not is_configured():
+        raise RuntimeError("Cloudinary non configuré : upload direct impossible")
+
+    config = cloudinary.config()
+    preset, folder = upload_destination(resource_type)
+    params = {'timestamp': int(time.time()), 'folder': folder, 'upload_preset': preset}
+    signature = cloudinary.utils.api_sign_request(params, config.api_secret)
+    return dict(
+        params,
+        signature=signature,
+        api_key=config.api_key,
+        resource_type=resource_type,
+        upload_url=f"{api_url.rstrip('/')}/{config.cloud_name}/{resource_type}/upload",
+    )
+
+
+def verify_direct_upload(data, max_age):
+    """
+    Vérifie la réponse d'un upload direct transmise par le navigateur.
+
+    :param data: Dict avec public_id, version, signature, resource_type et secure_url
+    :param max_age: Âge maximal de l'upload en secondes (la version est son horodatage)
+    :raises DirectUploadError: Réponse incomplète, expirée, hors dossier ou mal signée
+    :return: Dict avec 'public_id', 'url', 'type' (comme upload_file)
+    """
+    try:
+        resource_type = str(data['resource_type'])
+        public_id = str(data['public_id'])
+        version = int(data['version'])
+        signature = str(data['signature'])
+        url = str(data['secure_url'])
+    except (KeyError, TypeError, ValueError):
+        raise DirectUploadError("Réponse d'upload incomplète") from None
+
+    _, folder = upload_destination(resource_type)
+    if resource_type not in ('image', 'video') or not public_id.startswith(f"{folder}/"):
+        raise DirectUploadError(f"Fichier hors du dossier attendu : {public_id}")
+    age = time.time() - version
+    if age > max_age or age < -60:
+        raise DirectUploadError(f"Upload expiré : {public_id}")
+
+    config = cloudinary.config()
+    expected = cloudinary.utils.api_sign_request({'public_id': public_id, 'version': version},
+                                                 config.api_secret)
+    if not hmac.compare_digest(expected, signature):
+        raise DirectUploadError(f"Signature Cloudinary invalide : {public_id}")
+
+    delivery_prefix = f"https://res.cloudinary.com/{config.cloud_name}/{resource_type}/upload/"
+    if not url.startswith(delivery_prefix) or f"/{public_id}." not in url:
+        raise DirectUploadError(f"URL de livraison inattendue : {url}")
+    return {'public_id': public_id, 'url': url, 'type': resource_type}
+
+
 def detect_resource_type(filename):
     """
     Détecte le type de ressource à partir de l'extension du fichier.
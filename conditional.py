@@ -0,0 +1,87 @@
+"""
+Requêtes HTTP conditionnelles (ETag / Last-Modified) et en-têtes Cache-Control.
+Les validateurs sont calculés à partir de updated_at avant le rendu du template,
+ce qui permet de répondre 304 sans rendre la page.
+"""
+
+import hashlib
+from datetime import timezone
+
+from flask import current_app, make_response, request, session
+from flask_login import current_user
+
+
+def make_etag(*parts):
+    """Construit une valeur d'ETag forte à partir d'éléments sérialisables"""
+    digest = hashlib.sha1('|'.join(str(part) for part in parts).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _as_utc(value):
+    """Les dates sont stockées sans fuseau : elles sont en UTC"""
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.replace(microsecond=0)
+
+
+def _is_public():
+    """Une réponse n'est partageable (CDN) que pour un visiteur anonyme sans message flash"""
+    return not current_user.is_authenticated and not session.get('_flashes')
+
+
+def viewer_key():
+    """Identifie la variante de page servie (anonyme ou utilisateur connecté)"""
+    return f"user:{current_user.get_id()}" if current_user.is_authenticated else 'anon'
+
+
+def _set_validators(response, etag, last_modified, max_age):
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    if _is_public():
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+    else:
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+    response.vary.add('Cookie')
+    return response
+
+
+def not_modified(etag, last_modified=None, max_age=None):
+    """
+    Retourne une réponse 304 si le client possède déjà cette version, sinon None.
+    If-None-Match est prioritaire sur If-Modified-Since (RFC 9110).
+
+    :param etag: Valeur produite par make_etag
+    :param last_modified: Date de dernière modification (naïve = UTC)
+    :param max_age: Durée de fraîcheur publique en secondes
+    """
+    # Des messages flash doivent être affichés : rendu complet obligatoire
+    if session.get('_flashes'):
+        return None
+
+    last_modified = _as_utc(last_modified)
+    if request.if_none_match:
+        matched = request.if_none_match.contains(etag)
+    elif request.if_modified_since and last_modified is not None:
+        matched = last_modified <= request.if_modified_since
+    else:
+        matched = False
+
+    if not matched:
+        return None
+    response = make_response('', 304)
+    return _set_validators(response, etag, last_modified, _max_age(max_age))
+
+
+def with_validators(response, etag, last_modified=None, max_age=None):
+    """Ajoute ETag, Last-Modified, Cache-Control et Vary à une réponse rendue"""
+    response = make_response(response)
+    return _set_validators(response, etag, _as_utc(last_modified), _max_age(max_age))
+
+
+def _max_age(max_age):
+    return current_app.config['HTTP_CACHE_MAX_AGE'] if max_age is None else max_age
@@ -13,10 +13,32 @@ class Config:
     SQLALCHEMY_ENGINE_OPTIONS = {
         'pool_pre_ping': True,
         'pool_recycle': 300,
-        'pool_timeout': 20,
-        'max_overflow': 0
     }
     
+    # Pool de connexions PostgreSQL : taille calculée par db_pool.pool_options()
+    # (surchargeable par DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_MAX_CONNECTIONS)
+    DB_POOL_TIMEOUT = 5  # secondes d'attente maximale d'une connexion
+    DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 15000))  # 0 = désactivé
+    DB_PGBOUNCER = os.environ.get('DB_PGBOUNCER', 'false').lower() in ('1', 'true', 'yes')
+    
+    # Instrumentation : temps SQL/templates/Cloudinary, Server-Timing, /admin/perf
+    PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+    PROFILING_SLOW_QUERY_MS = int(os.environ.get('PROFILING_SLOW_QUERY_MS', 200))
+    PROFILING_SERVER_TIMING = os.environ.get('PROFILING_SERVER_TIMING', 'true').lower() in ('1', 'true', 'yes')
+    
+    # Métriques Prometheus (/metrics) : jeton Bearer ou adresses autorisées (IP ou réseaux CIDR)
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    METRICS_ALLOWED_IPS = [ip for ip in os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',') if ip.strip()]
+    METRICS_MULTIPROC_DIR = os.environ.get('METRICS_MULTIPROC_DIR')  # ex: /dev/shm/immo-metrics avec plusieurs workers
+    METRICS_FLUSH_INTERVAL = int(os.environ.get('METRICS_FLUSH_INTERVAL', 10))  # secondes
+    
+    # Réplica de lecture (optionnel) : lectures GET des blueprints de consultation
+    READ_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL')
+    READ_REPLICA_BLUEPRINTS = ('main', 'listings')
+    READ_REPLICA_STICKY_SECONDS = int(os.environ.get('READ_REPLICA_STICKY_SECONDS', 5))
+    READ_REPLICA_MAX_LAG = int(os.environ.get('READ_REPLICA_MAX_LAG', 10))  # secondes
+    
     # Configuration des sessions
     PERMANENT_SESSION_LIFETIME = timedelta(days=7)
     SESSION_COOKIE_HTTPONLY = True
@@ -25,14 +47,101 @@ class Config:
     # Upload de fichiers
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max
     
+    # Budgets par type et réduction locale des photos (media_preprocess.py, Pillow optionnel)
+    UPLOAD_MAX_IMAGE_BYTES = int(os.environ.get('UPLOAD_MAX_IMAGE_BYTES', 8 * 1024 * 1024))
+    UPLOAD_MAX_VIDEO_BYTES = int(os.environ.get('UPLOAD_MAX_VIDEO_BYTES', 15 * 1024 * 1024))
+    UPLOAD_MAX_IMAGE_PIXELS = int(os.environ.get('UPLOAD_MAX_IMAGE_PIXELS', 50_000_000))
+    UPLOAD_DOWNSCALE = os.environ.get('UPLOAD_DOWNSCALE', 'true').lower() in ('1', 'true', 'yes')
+    UPLOAD_IMAGE_MAX_EDGE = int(os.environ.get('UPLOAD_IMAGE_MAX_EDGE', 2400))  # pixels, plus grand côté
+    UPLOAD_IMAGE_QUALITY = int(os.environ.get('UPLOAD_IMAGE_QUALITY', 85))
+    
+    # Stockage des médias : 'cloudinary', 'local' (disque, servi sous MEDIA_STORAGE_URL) ou 'memory'
+    MEDIA_STORAGE_BACKEND = os.environ.get('MEDIA_STORAGE_BACKEND', 'cloudinary')
+    MEDIA_STORAGE_DIR = os.environ.get('MEDIA_STORAGE_DIR')  # Par défaut static/media
+    MEDIA_STORAGE_URL = os.environ.get('MEDIA_STORAGE_URL', '/static/media')
+    MEDIA_STORAGE_FAKE_LATENCY_MS = int(os.environ.get('MEDIA_STORAGE_FAKE_LATENCY_MS', 0))  # tests de charge
+    MEDIA_STORAGE_TIMEOUT = int(os.environ.get('MEDIA_STORAGE_TIMEOUT', 10))  # secondes (lecture)
+    MEDIA_STORAGE_CONNECT_TIMEOUT = int(os.environ.get('MEDIA_STORAGE_CONNECT_TIMEOUT', 3))
+    MEDIA_STORAGE_RETRIES = int(os.environ.get('MEDIA_STORAGE_RETRIES', 2))
+    MEDIA_STORAGE_RETRY_BACKOFF = float(os.environ.get('MEDIA_STORAGE_RETRY_BACKOFF', 0.5))
+    MEDIA_STORAGE_POOL_SIZE = int(os.environ.get('MEDIA_STORAGE_POOL_SIZE', 8))
+    MEDIA_STORAGE_BREAKER_THRESHOLD = int(os.environ.get('MEDIA_STORAGE_BREAKER_THRESHOLD', 5))
+    MEDIA_STORAGE_BREAKER_RESET = int(os.environ.get('MEDIA_STORAGE_BREAKER_RESET', 30))  # secondes
+    
+    # Upload direct navigateur → Cloudinary (signé), sans transiter par le worker
+    UPLOAD_DIRECT = os.environ.get('UPLOAD_DIRECT', 'true').lower() in ('1', 'true', 'yes')
+    UPLOAD_DIRECT_MAX_AGE = int(os.environ.get('UPLOAD_DIRECT_MAX_AGE', 900))  # secondes entre upload et confirmation
+    CLOUDINARY_UPLOAD_API_URL = os.environ.get('CLOUDINARY_UPLOAD_API_URL', 'https://api.cloudinary.com/v1_1')
+    
     # WTF-Forms
     WTF_CSRF_TIME_LIMIT = None
+    
+    # Pagination du flux d'annonces
+    LISTINGS_PER_PAGE = int(os.environ.get('LISTINGS_PER_PAGE', 24))
+    
+    # Surveillance des chargements paresseux (N+1) : 'log', 'raise' ou vide
+    LAZY_LOAD_GUARD = os.environ.get('LAZY_LOAD_GUARD')
+    
+    # Cache des pages publiques : 'memory' (par worker), 'filesystem' (partagé) ou 'null'
+    CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memory')
+    CACHE_DIR = os.environ.get('CACHE_DIR')  # ex: /dev/shm/immo-cache pour un cache en RAM partagé
+    CACHE_DEFAULT_TTL = int(os.environ.get('CACHE_DEFAULT_TTL', 60))
+    CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 512))
+    
+    # Cache HTTP (navigateurs/CDN) des pages publiques, en secondes
+    HTTP_CACHE_MAX_AGE = int(os.environ.get('HTTP_CACHE_MAX_AGE', 60))
+    HTTP_CACHE_DETAIL_MAX_AGE = int(os.environ.get('HTTP_CACHE_DETAIL_MAX_AGE', 300))
+    
+    # Upload asynchrone des médias (file d'attente UploadJob)
+    UPLOAD_ASYNC = os.environ.get('UPLOAD_ASYNC', 'true').lower() in ('1', 'true', 'yes')
+    UPLOAD_SPOOL_DIR = os.environ.get('UPLOAD_SPOOL_DIR')  # Répertoire local des fichiers en attente
+    UPLOAD_WORKERS = int(os.environ.get('UPLOAD_WORKERS', 2))
+    UPLOAD_MAX_ATTEMPTS = int(os.environ.get('UPLOAD_MAX_ATTEMPTS', 5))
+    UPLOAD_RETRY_BASE = int(os.environ.get('UPLOAD_RETRY_BASE', 5))  # secondes, doublé à chaque échec
+    UPLOAD_POLL_INTERVAL = int(os.environ.get('UPLOAD_POLL_INTERVAL', 15))
+    
+    # Suppression différée des fichiers Cloudinary (outbox media_deletion)
+    MEDIA_DELETION_ASYNC = os.environ.get('MEDIA_DELETION_ASYNC', 'true').lower() in ('1', 'true', 'yes')
+    MEDIA_DELETION_BATCH_SIZE = int(os.environ.get('MEDIA_DELETION_BATCH_SIZE', 500))
+    MEDIA_DELETION_POLL_INTERVAL = int(os.environ.get('MEDIA_DELETION_POLL_INTERVAL', 60))
+    
+    # Hachage des mots de passe : scrypt ou pbkdf2 ; sans coût imposé,
+    # le coût est choisi par un banc d'essai pour tenir dans PASSWORD_HASH_TARGET_MS
+    PASSWORD_HASH_ALGORITHM = os.environ.get('PASSWORD_HASH_ALGORITHM', 'scrypt')
+    PASSWORD_HASH_COST = int(os.environ['PASSWORD_HASH_COST']) if os.environ.get('PASSWORD_HASH_COST') else None
+    PASSWORD_HASH_TARGET_MS = int(os.environ.get('PASSWORD_HASH_TARGET_MS', 250))
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_QUEUE_SIZE = int(os.environ.get('PASSWORD_HASH_QUEUE_SIZE', 8))
+    # Mémoire maximale des hachages scrypt simultanés (64 Mo : coût 15 avec 2 workers)
+    PASSWORD_HASH_MAX_MEMORY = int(os.environ.get('PASSWORD_HASH_MAX_MEMORY', 64 * 1_048_576))
+    
+    # Limitation de débit (connexion / inscription) : 'memory' (par worker) ou 'filesystem' (partagé)
+    RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    RATE_LIMIT_STORAGE = os.environ.get('RATE_LIMIT_STORAGE', 'memory')
+    RATE_LIMIT_DIR = os.environ.get('RATE_LIMIT_DIR')  # Par défaut /dev/shm/immo-ratelimit
+    RATE_LIMIT_PROXY_COUNT = int(os.environ.get('RATE_LIMIT_PROXY_COUNT', 0))  # 1 derrière le proxy Render
+    RATE_LIMITS = {
+        'login': {'ip': '20/minute', 'username': '5/5minutes'},
+        'register': {'ip': '5/hour'},
+        'upload_sign': {'ip': '60/minute'},
+    }
+    
+    # Cache des utilisateurs connectés (user_loader) : durée de vie en secondes (0 = désactivé)
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 60))
+    USER_CACHE_MAX_ENTRIES = int(os.environ.get('USER_CACHE_MAX_ENTRIES', 1024))
+    
+    # Import en masse d'annonces (CSV / JSON Lines)
+    IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', 500))
+    
+    # Statistiques du tableau de bord : âge maximal de l'instantané (0 = calcul à chaque affichage)
+    ADMIN_STATS_SNAPSHOT_TTL = int(os.environ.get('ADMIN_STATS_SNAPSHOT_TTL', 300))
 
 
 class DevelopmentConfig(Config):
     """Configuration pour le développement local"""
     DEBUG = True
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///app.db'
+    LAZY_LOAD_GUARD = os.environ.get('LAZY_LOAD_GUARD', 'log')
     
     # Moins strict en développement
     SESSION_COOKIE_SECURE = False
@@ -53,13 +162,10 @@ class ProductionConfig(Config):
     SESSION_COOKIE_SECURE = True
     REMEMBER_COOKIE_SECURE = True
     
-    # Configuration pour Render
+    # Configuration pour Render (taille du pool : voir db_pool.py)
     SQLALCHEMY_ENGINE_OPTIONS = {
         'pool_pre_ping': True,
         'pool_recycle': 280,  # Render timeout à 300s
-        'pool_timeout': 20,
-        'max_overflow': 0,
-        'pool_size': 5
     }
 
 
@@ -69,6 +175,14 @@ class TestingConfig(Config):
     DEBUG = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///test.db'
     WTF_CSRF_ENABLED = False
+    LAZY_LOAD_GUARD = 'raise'
+    CACHE_BACKEND = 'null'
+    UPLOAD_ASYNC = False
+    MEDIA_DELETION_ASYNC = False
+    ADMIN_STATS_SNAPSHOT_TTL = 0
+    PASSWORD_HASH_BENCHMARK = False
+    RATE_LIMIT_ENABLED = False
+    MEDIA_STORAGE_BACKEND = 'memory'
     SESSION_COOKIE_SECURE = False
     REMEMBER_COOKIE_SECURE = False
 
@@ -8,7 +8,7 @@ import os
 import sys
 from app import create_app
 from models import db, User
-from werkzeug.security import generate_password_hash
+from passwords import password_hasher
 from sqlalchemy import inspect
 
 
@@ -60,7 +60,7 @@ def create_admin():
                 new_admin = User(
                     username=ADMIN_USERNAME,
                     phone=ADMIN_PHONE,
-                    password=generate_password_hash(ADMIN_PASSWORD),
+                    password=password_hasher.hash(ADMIN_PASSWORD),
                     is_admin=True
                 )
                 db.session.add(new_admin)
@@ -0,0 +1,240 @@
+"""
+Dimensionnement et instrumentation du pool de connexions SQLAlchemy.
+La taille du pool découle du nombre de threads qui utilisent la base dans un
+worker (threads gunicorn + threads d'arrière-plan), avec un débordement borné
+et une attente courte : sous une rafale, une requête échoue vite au lieu de
+patienter 20 s. Chaque variable DB_* de l'environnement prime sur le calcul.
+Sur PostgreSQL, statement_timeout est fixé à la connexion (ou par transaction
+derrière PgBouncer), et les événements du pool alimentent des compteurs
+globaux (/admin/pool) et par moteur (primaire, réplica : /metrics).
+"""
+
+import logging
+import os
+import threading
+import time
+import weakref
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool, NullPool
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name, default=None):
+    value = os.environ.get(name)
+    return int(value) if value not in (None, '') else default
+
+
+def _env_flag(name, default=False):
+    value = os.environ.get(name)
+    if value in (None, ''):
+        return default
+    return value.lower() in ('1', 'true', 'yes')
+
+
+class PoolMetrics:
+    """Compteurs d'utilisation du pool (worker courant)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.overflow_checkouts = 0
+        self.timeouts = 0
+        self.waits = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record_wait(self, seconds, overflow):
+        with self._lock:
+            self.waits += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            if overflow:
+                self.overflow_checkouts += 1
+
+    def incr(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self, pool=None):
+        with self._lock:
+            data = {
+                'connects': self.connects,
+                'checkouts': self.checkouts,
+                'checkins': self.checkins,
+                'invalidations': self.invalidations,
+                'overflow_checkouts': self.overflow_checkouts,
+                'timeouts': self.timeouts,
+                'wait_seconds_total': round(self.wait_total, 6),
+                'wait_seconds_max': round(self.wait_max, 6),
+                'wait_seconds_avg': round(self.wait_total / self.waits, 6) if self.waits else 0.0,
+            }
+        if isinstance(pool, QueuePool):
+            data.update({
+                'pool_size': pool.size(),
+                'checked_out': pool.checkedout(),
+                'idle': pool.checkedin(),
+                'overflow': max(pool.overflow(), 0),
+            })
+        return data
+
+
+# Compteurs partagés par le pool instrumenté et les événements (tous moteurs confondus)
+pool_metrics = PoolMetrics()
+
+# Compteurs par moteur : la saturation d'un moteur ne doit pas être masquée par l'autre
+_engine_pool_metrics = weakref.WeakKeyDictionary()
+_engine_pool_metrics_lock = threading.Lock()
+
+
+def pool_metrics_for(engine):
+    """Compteurs du pool d'un moteur (créés au premier appel)"""
+    with _engine_pool_metrics_lock:
+        metrics = _engine_pool_metrics.get(engine)
+        if metrics is None:
+            metrics = _engine_pool_metrics[engine] = PoolMetrics()
+        return metrics
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool mesurant l'attente de chaque emprunt, le débordement et les délais dépassés"""
+
+    # Compteurs du moteur propriétaire (renseignés par register_pool_events)
+    engine_metrics = None
+
+    def _targets(self):
+        if self.engine_metrics is None:
+            return (pool_metrics,)
+        return (pool_metrics, self.engine_metrics)
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            for metrics in self._targets():
+                metrics.incr('timeouts')
+            raise
+        elapsed, overflow = time.perf_counter() - start, self.overflow() > 0
+        for metrics in self._targets():
+            metrics.record_wait(elapsed, overflow)
+        return connection
+
+    def recreate(self):
+        # engine.dispose() remplace le pool : conserver le rattachement aux compteurs du moteur
+        pool = super().recreate()
+        pool.engine_metrics = self.engine_metrics
+        return pool
+
+
+def pool_options(app):
+    """
+    Calcule les options du moteur pour l'environnement courant.
+
+    :return: Dict fusionné dans SQLALCHEMY_ENGINE_OPTIONS
+    """
+    uri = app.config.get('SQLALCHEMY_DATABASE_URI') or ''
+    is_postgres = uri.startswith('postgresql')
+    options = {}
+
+    if not is_postgres:
+        # SQLite (développement, tests) : pool par défaut du dialecte
+        return options
+
+    # Threads d'un worker qui empruntent une connexion
+    web_threads = _env_int('GUNICORN_THREADS', _env_int('WEB_THREADS', 1))
+    background = 0
+    if app.config.get('UPLOAD_ASYNC', True):
+        background += app.config.get('UPLOAD_WORKERS', 2) + 1  # pool d'upload + planificateur
+    if app.config.get('MEDIA_DELETION_ASYNC', True):
+        background += 1
+    pool_size = web_threads + background
+    max_overflow = max(2, pool_size // 2)
+
+    # Plafond global de connexions réparti entre les workers gunicorn
+    max_connections = _env_int('DB_MAX_CONNECTIONS')
+    if max_connections:
+        workers = _env_int('WEB_CONCURRENCY', 1)
+        per_worker = max(1, max_connections // workers)
+        pool_size = min(pool_size, per_worker)
+        max_overflow = min(max_overflow, per_worker - pool_size)
+
+    pgbouncer = _env_flag('DB_PGBOUNCER', app.config.get('DB_PGBOUNCER', False))
+    if pgbouncer and _env_flag('DB_POOL_DISABLED'):
+        # PgBouncer gère déjà le pool : une connexion par emprunt
+        options['poolclass'] = NullPool
+    else:
+        options.update({
+            'poolclass': InstrumentedQueuePool,
+            'pool_size': _env_int('DB_POOL_SIZE', pool_size),
+            'max_overflow': _env_int('DB_MAX_OVERFLOW', max_overflow),
+            'pool_timeout': _env_int('DB_POOL_TIMEOUT', app.config.get('DB_POOL_TIMEOUT', 5)),
+        })
+
+    if pgbouncer:
+        # Mode transaction : pas d'instructions préparées côté serveur
+        # (psycopg 3 ; psycopg2 n'en utilise jamais)
+        if uri.startswith('postgresql+psycopg:'):
+            options['connect_args'] = {'prepare_threshold': None}
+    return options
+
+
+def configure_pool(app):
+    """Fusionne les options calculées dans la configuration (avant db.init_app)"""
+    engine_options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    engine_options.update(pool_options(app))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options
+    if 'pool_size' in engine_options:
+        app.logger.info(f"🔌 Pool de connexions : {engine_options['pool_size']} "
+                        f"(+{engine_options['max_overflow']} en débordement, "
+                        f"attente max {engine_options['pool_timeout']} s)")
+
+
+def register_pool_events(app, engine):
+    """Compteurs du pool et statement_timeout PostgreSQL"""
+    timeout_ms = app.config.get('DB_STATEMENT_TIMEOUT_MS', 0)
+    pgbouncer = _env_flag('DB_PGBOUNCER', app.config.get('DB_PGBOUNCER', False))
+    is_postgres = engine.dialect.name == 'postgresql'
+    engine_metrics = pool_metrics_for(engine)
+    if isinstance(engine.pool, InstrumentedQueuePool):
+        engine.pool.engine_metrics = engine_metrics
+
+    def incr(name):
+        pool_metrics.incr(name)
+        engine_metrics.incr(name)
+
+    @event.listens_for(engine, 'connect')
+    def _on_connect(dbapi_connection, connection_record):
+        incr('connects')
+        if is_postgres and timeout_ms and not pgbouncer:
+            cursor = dbapi_connection.cursor()
+            cursor.execute(f"SET statement_timeout = {int(timeout_ms)}")
+            cursor.close()
+            # Valider le SET : il ne doit pas être annulé par le premier rollback
+            dbapi_connection.commit()
+
+    if is_postgres and timeout_ms and pgbouncer:
+        # Les paramètres de session ne survivent pas au pooling par transaction
+        @event.listens_for(engine, 'begin')
+        def _on_begin(connection):
+            connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(timeout_ms)}")
+
+    @event.listens_for(engine, 'checkout')
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        incr('checkouts')
+
+    @event.listens_for(engine, 'checkin')
+    def _on_checkin(dbapi_connection, connection_record):
+        incr('checkins')
+
+    @event.listens_for(engine, 'invalidate')
+    def _on_invalidate(dbapi_connection, connection_record, exception):
+        incr('invalidations')
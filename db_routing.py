@@ -0,0 +1,167 @@
+"""
+Routage des lectures vers un réplica PostgreSQL (optionnel).
+Quand DATABASE_REPLICA_URL est défini, la session envoie au réplica les requêtes
+des requêtes HTTP sûres (GET/HEAD) des blueprints de consultation ; tout le reste
+(écritures, administration, threads d'arrière-plan) reste sur le primaire.
+Lecture de ses propres écritures : dès qu'une session écrit, elle reste sur le
+primaire, et le navigateur de l'auteur y est maintenu quelques secondes
+(cookie de session) le temps que le réplica rattrape son retard.
+Un réplica injoignable ou trop en retard est écarté temporairement.
+"""
+
+import logging
+import threading
+import time
+
+from flask import has_request_context, request, session as http_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+REPLICA_BIND_KEY = 'replica'
+
+SAFE_METHODS = ('GET', 'HEAD')
+
+# Clé du cookie de session : lectures forcées sur le primaire jusqu'à cet instant
+PRIMARY_UNTIL_KEY = '_db_primary_until'
+
+
+class ReplicaRouter:
+    """Extension Flask : choix du réplica ou du primaire et suivi de santé du réplica"""
+
+    def __init__(self):
+        self.engine = None
+        self.blueprints = ()
+        self.sticky_seconds = 5
+        self.check_interval = 10
+        self.retry_after = 30
+        self.max_lag = 10
+        self._healthy = True
+        self._checked_at = 0.0
+        self._retry_at = 0.0
+        self._check_lock = threading.Lock()
+
+    def init_app(self, app, engine):
+        """
+        :param engine: Moteur du réplica (db.engines['replica']) ou None si non configuré
+        """
+        self.engine = engine
+        self.blueprints = tuple(app.config.get('READ_REPLICA_BLUEPRINTS', ('main', 'listings')))
+        self.sticky_seconds = app.config.get('READ_REPLICA_STICKY_SECONDS', 5)
+        self.check_interval = app.config.get('READ_REPLICA_CHECK_INTERVAL', 10)
+        self.retry_after = app.config.get('READ_REPLICA_RETRY_AFTER', 30)
+        self.max_lag = app.config.get('READ_REPLICA_MAX_LAG', 10)
+        app.extensions['replica_router'] = self
+
+        if engine is not None:
+            event.listen(engine, 'handle_error', self._on_error)
+            app.logger.info("📖 Réplica de lecture activé")
+
+    # === Santé du réplica ===
+
+    def mark_unhealthy(self, reason):
+        if self._healthy:
+            logger.warning(f"Réplica écarté pendant {self.retry_after} s : {reason}")
+        self._healthy = False
+        self._retry_at = time.monotonic() + self.retry_after
+
+    def _on_error(self, exception_context):
+        if exception_context.is_disconnect or exception_context.connection is None:
+            self.mark_unhealthy(exception_context.original_exception)
+
+    def _ping(self):
+        """Vérifie la disponibilité et le retard de réplication"""
+        with self.engine.connect() as connection:
+            if self.engine.dialect.name == 'postgresql':
+                lag = connection.exec_driver_sql(
+                    "SELECT EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())"
+                ).scalar()
+                if lag is not None and lag > self.max_lag:
+                    raise RuntimeError(f"retard de réplication de {lag:.1f} s")
+            else:
+                connection.exec_driver_sql("SELECT 1")
+
+    def is_healthy(self):
+        now = time.monotonic()
+        if not self._healthy and now < self._retry_at:
+            return False
+        if now - self._checked_at < self.check_interval and self._healthy:
+            return True
+        # Un seul thread vérifie ; les autres gardent le dernier état connu
+        if not self._check_lock.acquire(blocking=False):
+            return self._healthy
+        try:
+            self._ping()
+            if not self._healthy:
+                logger.info("Réplica de nouveau disponible")
+            self._healthy = True
+        except Exception as e:
+            self.mark_unhealthy(e)
+        finally:
+            self._checked_at = time.monotonic()
+            self._check_lock.release()
+        return self._healthy
+
+    # === Routage ===
+
+    def use_replica(self, db_session):
+        """Les lectures de cette session peuvent-elles aller au réplica ?"""
+        if self.engine is None or not has_request_context():
+            return False
+        if request.method not in SAFE_METHODS or request.blueprint not in self.blueprints:
+            return False
+        if db_session.info.get('db_primary'):
+            return False
+        if http_session.get(PRIMARY_UNTIL_KEY, 0) > time.time():
+            return False
+        return self.is_healthy()
+
+    def note_write(self, db_session):
+        """Après une écriture : session et navigateur maintenus sur le primaire"""
+        db_session.info['db_primary'] = True
+        if self.engine is not None and has_request_context():
+            http_session[PRIMARY_UNTIL_KEY] = time.time() + self.sticky_seconds
+
+
+# Instance partagée, initialisée dans create_app()
+replica_router = ReplicaRouter()
+
+
+class RoutingSession(Session):
+    """Session Flask-SQLAlchemy qui dirige les lectures éligibles vers le réplica"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            if self._is_write(clause):
+                if getattr(clause, 'is_dml', False):
+                    # INSERT/UPDATE/DELETE en masse : pas de flush, noter l'écriture ici
+                    replica_router.note_write(self)
+            elif replica_router.use_replica(self):
+                return replica_router.engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _is_write(self, clause):
+        if self._flushing or self.new or self.dirty or self.deleted:
+            return True
+        if clause is not None and (getattr(clause, 'is_dml', False)
+                                   or getattr(clause, '_for_update_arg', None) is not None):
+            return True
+        return False
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _after_flush(db_session, flush_context):
+    replica_router.note_write(db_session)
+
+
+def configure_replica(app):
+    """Déclare le bind du réplica (avant db.init_app) si DATABASE_REPLICA_URL est défini"""
+    url = app.config.get('READ_REPLICA_URL')
+    if not url:
+        return
+    if url.startswith('postgres://'):
+        url = url.replace('postgres://', 'postgresql://', 1)
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    binds[REPLICA_BIND_KEY] = url
+    app.config['SQLALCHEMY_BINDS'] = binds
@@ -0,0 +1,119 @@
+"""
+Export en flux des annonces et des utilisateurs (CSV ou JSON Lines).
+Les lignes sont lues par lots via un curseur serveur (yield_per / stream_results)
+et écrites au fil de l'eau dans la réponse : la mémoire reste bornée quelle que
+soit la taille de la table, et les premiers octets partent immédiatement.
+"""
+
+import csv
+import io
+import json
+from datetime import datetime, timezone
+
+from sqlalchemy import func, select
+
+from models import db, User, PropertyListing
+from query_profiles import loader_options
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+# Nombre de lignes lues par aller-retour et écrites par fragment de réponse
+EXPORT_BATCH_SIZE = 1000
+
+LISTING_FIELDS = ('id', 'title', 'description', 'price', 'property_type', 'author',
+                  'author_phone', 'image_urls', 'video_url', 'created_at', 'updated_at')
+
+# Le hash du mot de passe n'est jamais exporté
+USER_FIELDS = ('id', 'username', 'phone', 'is_admin', 'listing_count', 'created_at')
+
+
+def _format_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def listing_rows(batch_size=EXPORT_BATCH_SIZE):
+    """Itère sur toutes les annonces (avec auteur et URLs des médias), par ordre d'id"""
+    stmt = (
+        select(PropertyListing)
+        .options(*loader_options('export'))
+        .order_by(PropertyListing.id)
+        .execution_options(yield_per=batch_size)
+    )
+    for listing in db.session.scalars(stmt):
+        media_items = listing.ready_media
+        yield {
+            'id': listing.id,
+            'title': listing.title,
+            'description': listing.description,
+            'price': listing.price,
+            'property_type': listing.property_type,
+            'author': listing.author.username,
+            'author_phone': listing.author.phone,
+            'image_urls': [m.url for m in media_items if m.file_type == 'image'],
+            'video_url': next((m.url for m in media_items if m.file_type == 'video'), None),
+            'created_at': listing.created_at,
+            'updated_at': listing.updated_at,
+        }
+
+
+def user_rows(batch_size=EXPORT_BATCH_SIZE):
+    """Itère sur tous les utilisateurs avec leur nombre d'annonces, par ordre d'id"""
+    listing_count = (
+        select(func.count(PropertyListing.id))
+        .where(PropertyListing.user_id == User.id)
+        .correlate(User)
+        .scalar_subquery()
+    )
+    stmt = (
+        select(User.id, User.username, User.phone, User.is_admin,
+               listing_count.label('listing_count'), User.created_at)
+        .order_by(User.id)
+        .execution_options(yield_per=batch_size)
+    )
+    for row in db.session.execute(stmt):
+        yield row._asdict()
+
+
+def stream_rows(rows, fields, fmt, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Sérialise des dictionnaires en fragments de texte.
+
+    :param rows: Itérable de dicts
+    :param fields: Colonnes, dans l'ordre
+    :param fmt: 'csv' ou 'jsonl'
+    :return: Générateur de chaînes (un fragment par lot de lignes)
+    """
+    buffer = io.StringIO()
+    if fmt == 'csv':
+        writer = csv.writer(buffer)
+        writer.writerow(fields)
+    pending = 0
+
+    for row in rows:
+        values = [_format_value(row[field]) for field in fields]
+        if fmt == 'csv':
+            # Listes d'URLs séparées par des espaces dans une seule cellule
+            writer.writerow([' '.join(v) if isinstance(v, list) else v for v in values])
+        else:
+            buffer.write(json.dumps(dict(zip(fields, values)), ensure_ascii=False))
+            buffer.write('\n')
+        pending += 1
+        if pending >= batch_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def export_filename(name, fmt):
+    """Nom de fichier horodaté, ex. annonces-20250101-1200.csv"""
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%d-%H%M')
+    return f"{name}-{stamp}.{fmt}"
@@ -0,0 +1,141 @@
+"""
+Filtres à facettes du flux d'annonces : fourchette de prix, type, ancienneté et tri.
+Les filtres sont validés par forms.ListingFilterForm puis composés en une seule requête ;
+les compteurs de facettes sont calculés par une unique requête groupée.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import case, func
+
+from models import db, PropertyListing
+
+# Tranches de prix (FCFA) : (clé, libellé, borne basse incluse, borne haute exclue)
+PRICE_BUCKETS = [
+    ('lt100k', 'Moins de 100 000', None, 100_000),
+    ('100k-500k', '100 000 – 500 000', 100_000, 500_000),
+    ('500k-5m', '500 000 – 5 M', 500_000, 5_000_000),
+    ('5m-50m', '5 M – 50 M', 5_000_000, 50_000_000),
+    ('gte50m', '50 M et plus', 50_000_000, None),
+]
+
+# Tris disponibles : (colonnes de la clé keyset, ordre décroissant)
+SORTS = {
+    'recent': (('created_at', 'id'), True),
+    'price_asc': (('price', 'id'), False),
+    'price_desc': (('price', 'id'), True),
+}
+DEFAULT_SORT = 'recent'
+
+FILTER_FIELDS = ('price_min', 'price_max', 'type', 'posted_since', 'sort')
+
+
+def filters_from_form(form):
+    """
+    Extrait les filtres valides d'un ListingFilterForm.
+    Un champ invalide est ignoré plutôt que de rejeter toute la requête.
+
+    :return: Dict {price_min, price_max, type, posted_since, sort}
+    """
+    form.validate()
+    filters = {}
+    for name in FILTER_FIELDS:
+        field = getattr(form, name)
+        filters[name] = None if field.errors else (field.data or None)
+    if filters['sort'] not in SORTS:
+        filters['sort'] = DEFAULT_SORT
+    return filters
+
+
+def _posted_after(posted_since):
+    return datetime.now(timezone.utc) - timedelta(days=int(posted_since))
+
+
+def _price_conditions(filters):
+    conditions = []
+    if filters.get('price_min') is not None:
+        conditions.append(PropertyListing.price >= filters['price_min'])
+    if filters.get('price_max') is not None:
+        conditions.append(PropertyListing.price <= filters['price_max'])
+    return conditions
+
+
+def _date_conditions(filters):
+    if filters.get('posted_since'):
+        return [PropertyListing.created_at >= _posted_after(filters['posted_since'])]
+    return []
+
+
+def apply_filters(query, filters):
+    """
+    Compose tous les filtres sur une requête d'annonces.
+
+    :param query: Requête de base
+    :param filters: Dict produit par filters_from_form
+    :return: Requête filtrée (sans tri)
+    """
+    conditions = _price_conditions(filters) + _date_conditions(filters)
+    if filters.get('type'):
+        conditions.append(PropertyListing.property_type == filters['type'])
+    return query.filter(*conditions) if conditions else query
+
+
+def sort_keys(filters):
+    """Retourne (colonnes de la clé, ordre décroissant) pour la pagination keyset"""
+    return SORTS[filters.get('sort') or DEFAULT_SORT]
+
+
+def _bucket_expression():
+    whens = [
+        (PropertyListing.price < high, key)
+        for key, _label, _low, high in PRICE_BUCKETS if high is not None
+    ]
+    return case(*whens, else_=PRICE_BUCKETS[-1][0])
+
+
+def facet_counts(filters):
+    """
+    Calcule les compteurs par type et par tranche de prix en une seule requête.
+
+    Chaque facette ignore son propre filtre (les compteurs par type respectent la
+    fourchette de prix, les compteurs par tranche respectent le type) afin que
+    l'utilisateur voie ce qu'il obtiendrait en changeant ce critère.
+
+    :return: Dict {'types': {type: n}, 'prices': [{key, label, count, price_min, price_max}]}
+    """
+    bucket = _bucket_expression().label('bucket')
+    price_conditions = _price_conditions(filters)
+    in_price = func.sum(case((db.and_(*price_conditions), 1), else_=0)) if price_conditions \
+        else func.count()
+
+    query = db.session.query(
+        PropertyListing.property_type,
+        bucket,
+        func.count().label('total'),
+        in_price.label('in_price'),
+    ).filter(*_date_conditions(filters)) \
+        .group_by(PropertyListing.property_type, bucket) \
+        .order_by(PropertyListing.property_type, bucket)
+
+    # Ordre stable : les facettes entrent dans l'ETag du flux
+    types = {}
+    prices = {key: 0 for key, _label, _low, _high in PRICE_BUCKETS}
+    for property_type, bucket_key, total, in_price_count in query:
+        types[property_type] = types.get(property_type, 0) + int(in_price_count or 0)
+        if not filters.get('type') or filters['type'] == property_type:
+            prices[bucket_key] += total
+
+    return {
+        'types': types,
+        'prices': [
+            {
+                'key': key,
+                'label': label,
+                'count': prices[key],
+                'price_min': low,
+                'price_max': high - 1 if high is not None else None,
+            }
+            for key, label, low, high in PRICE_BUCKETS
+        ],
+    }
+
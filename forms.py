@@ -3,18 +3,44 @@ Formulaires WTF pour l'application
 """
 
 from flask_wtf import FlaskForm
-from flask_wtf.file import FileField, FileAllowed, FileRequired
+from flask_wtf.file import FileField, MultipleFileField, FileAllowed, FileRequired
 from wtforms import (
-    StringField, PasswordField, TextAreaField, IntegerField, 
-    SelectField, SubmitField, BooleanField
+    Form, StringField, PasswordField, TextAreaField, IntegerField, 
+    SelectField, SubmitField, BooleanField, HiddenField
 )
 from wtforms.validators import (
     DataRequired, Length, EqualTo, ValidationError, 
-    Optional, Regexp, NumberRange
+    Optional, Regexp, NumberRange, URL
 )
 from models import User
+from media_preprocess import check_budget, MediaRejected
+import json
 import re
 
+# Nombre maximal d'images publiées en une fois (image principale comprise)
+MAX_GALLERY_IMAGES = 12
+
+# Nombre maximal de médias envoyés directement à Cloudinary pour une annonce (images + vidéo)
+MAX_DIRECT_MEDIA = MAX_GALLERY_IMAGES + 1
+
+
+class MediaBudget:
+    """Validateur : taille et dimensions d'un fichier dans les budgets de son type (UPLOAD_MAX_*)"""
+
+    def __init__(self, file_type):
+        self.file_type = file_type
+
+    def __call__(self, form, field):
+        # Champ simple ou multiple (galerie)
+        files = field.data if isinstance(field.data, list) else [field.data]
+        for file_storage in files:
+            if not file_storage or not getattr(file_storage, 'filename', None):
+                continue
+            try:
+                check_budget(file_storage, self.file_type)
+            except MediaRejected as e:
+                raise ValidationError(f"{file_storage.filename} : {e}" if len(files) > 1 else str(e))
+
 
 class RegisterForm(FlaskForm):
     """Formulaire d'inscription"""
@@ -126,30 +152,80 @@ class ListingForm(FlaskForm):
         render_kw={"class": "form-select"}
     )
     
-    # Fichier image (obligatoire)
+    # Fichier image (obligatoire, sauf si elle a été envoyée directement à Cloudinary)
     image_file = FileField(
         'Image principale',
         validators=[
-            FileRequired(message="Une image est obligatoire."),
+            Optional(),
             FileAllowed(['jpg', 'jpeg', 'png', 'gif', 'webp'], 
-                       message="Formats acceptés: JPG, PNG, GIF, WebP")
+                       message="Formats acceptés: JPG, PNG, GIF, WebP"),
+            MediaBudget('image')
         ],
         render_kw={"class": "form-control", "accept": "image/*"}
     )
     
+    # Photos supplémentaires de la galerie, dans l'ordre de sélection (optionnelles)
+    gallery_files = MultipleFileField(
+        'Autres photos (optionnel)',
+        validators=[
+            FileAllowed(['jpg', 'jpeg', 'png', 'gif', 'webp'], 
+                       message="Formats acceptés: JPG, PNG, GIF, WebP"),
+            MediaBudget('image')
+        ],
+        render_kw={"class": "form-control", "accept": "image/*", "multiple": True}
+    )
+    
     # Fichier vidéo (optionnel)
     video_file = FileField(
         'Vidéo (optionnel)',
         validators=[
             Optional(),
             FileAllowed(['mp4', 'mov', 'avi', 'webm'], 
-                       message="Formats acceptés: MP4, MOV, AVI, WebM")
+                       message="Formats acceptés: MP4, MOV, AVI, WebM"),
+            MediaBudget('video')
         ],
         render_kw={"class": "form-control", "accept": "video/*"}
     )
     
+    # Réponses des uploads directs (JSON rempli par static/js/direct-upload.js)
+    uploaded_media = HiddenField()
+    
     submit = SubmitField('Publier l\'annonce', render_kw={"class": "btn btn-primary"})
 
+    @property
+    def direct_media(self):
+        """Réponses d'upload direct (non vérifiées : voir cloudinary_util.verify_direct_upload)"""
+        if not self.uploaded_media.data:
+            return []
+        try:
+            items = json.loads(self.uploaded_media.data)
+        except ValueError:
+            return []
+        return [item for item in items if isinstance(item, dict)] if isinstance(items, list) else []
+
+    def validate_uploaded_media(self, field):
+        if not field.data:
+            return
+        try:
+            items = json.loads(field.data)
+        except ValueError:
+            raise ValidationError("Médias envoyés invalides.")
+        if not isinstance(items, list) or len(items) > MAX_DIRECT_MEDIA:
+            raise ValidationError("Médias envoyés invalides.")
+
+    def validate_gallery_files(self, field):
+        if len([f for f in field.data or () if f]) > MAX_GALLERY_IMAGES - 1:
+            raise ValidationError(f"{MAX_GALLERY_IMAGES - 1} photos supplémentaires au maximum.")
+
+    def validate(self, extra_validators=None):
+        valid = super().validate(extra_validators)
+        has_image = bool(self.image_file.data) or bool(self.gallery_files.data) or any(
+            item.get('resource_type') == 'image' for item in self.direct_media)
+        if not has_image:
+            self.image_file.errors = list(self.image_file.errors) + ["Une image est obligatoire."]
+            return False
+        return valid
+
 
 class EditListingForm(FlaskForm):
     """Formulaire pour modifier une annonce existante"""
@@ -196,7 +272,8 @@ class EditListingForm(FlaskForm):
         'Nouvelle image (optionnel)',
         validators=[
             Optional(),
-            FileAllowed(['jpg', 'jpeg', 'png', 'gif', 'webp'])
+            FileAllowed(['jpg', 'jpeg', 'png', 'gif', 'webp']),
+            MediaBudget('image')
         ],
         render_kw={"class": "form-control", "accept": "image/*"}
     )
@@ -205,9 +282,116 @@ class EditListingForm(FlaskForm):
         'Nouvelle vidéo (optionnel)',
         validators=[
             Optional(),
-            FileAllowed(['mp4', 'mov', 'avi', 'webm'])
+            FileAllowed(['mp4', 'mov', 'avi', 'webm']),
+            MediaBudget('video')
         ],
         render_kw={"class": "form-control", "accept": "video/*"}
     )
     
-    submit = SubmitField('Mettre à jour', render_kw={"class": "btn btn-primary"})
\ No newline at end of file
+    submit = SubmitField('Mettre à jour', render_kw={"class": "btn btn-primary"})
+
+class ListingFilterForm(FlaskForm):
+    """Filtres du flux d'annonces (paramètres GET, sans CSRF)"""
+    class Meta:
+        csrf = False
+
+    price_min = IntegerField(
+        'Prix minimum',
+        validators=[Optional(), NumberRange(min=0, message="Le prix minimum doit être positif.")],
+        render_kw={"placeholder": "Min", "class": "form-control"}
+    )
+    
+    price_max = IntegerField(
+        'Prix maximum',
+        validators=[Optional(), NumberRange(min=0, message="Le prix maximum doit être positif.")],
+        render_kw={"placeholder": "Max", "class": "form-control"}
+    )
+    
+    type = SelectField(
+        'Type',
+        choices=[
+            ('', 'Tous les types'),
+            ('vente', 'Vente'),
+            ('location', 'Location'),
+            ('achat', 'Achat')
+        ],
+        validators=[Optional()],
+        render_kw={"class": "form-select"}
+    )
+    
+    posted_since = SelectField(
+        'Publiée depuis',
+        choices=[
+            ('', 'Toutes les dates'),
+            ('1', 'Dernières 24 heures'),
+            ('7', '7 derniers jours'),
+            ('30', '30 derniers jours')
+        ],
+        validators=[Optional()],
+        render_kw={"class": "form-select"}
+    )
+    
+    sort = SelectField(
+        'Trier par',
+        choices=[
+            ('recent', 'Plus récentes'),
+            ('price_asc', 'Prix croissant'),
+            ('price_desc', 'Prix décroissant')
+        ],
+        default='recent',
+        validators=[Optional()],
+        render_kw={"class": "form-select"}
+    )
+
+    def validate_price_max(self, price_max):
+        """Vérifie la cohérence de la fourchette de prix"""
+        if price_max.data is not None and self.price_min.data is not None \
+                and price_max.data < self.price_min.data:
+            raise ValidationError('Le prix maximum doit être supérieur au prix minimum.')
+
+
+
+class ListingImportRowForm(Form):
+    """
+    Validation d'une ligne d'import en masse (hors requête, sans CSRF).
+    Les champs texte reprennent exactement ceux de ListingForm ; les fichiers
+    sont remplacés par des URLs.
+    """
+    title = ListingForm.title
+    description = ListingForm.description
+    price = ListingForm.price
+    property_type = ListingForm.property_type
+    
+    image_url = StringField(
+        'URL de l\'image',
+        validators=[
+            DataRequired(message="L'URL de l'image est obligatoire."),
+            URL(require_tld=False, message="URL d'image invalide.")
+        ]
+    )
+    
+    video_url = StringField(
+        'URL de la vidéo',
+        validators=[Optional(), URL(require_tld=False, message="URL de vidéo invalide.")]
+    )
+    
+    author = StringField('Auteur', validators=[Optional(), Length(max=50)])
+
+
+class ListingImportForm(FlaskForm):
+    """Formulaire d'import d'annonces en masse (admin)"""
+    import_file = FileField(
+        'Fichier CSV ou JSON Lines',
+        validators=[
+            FileRequired(message="Un fichier est obligatoire."),
+            FileAllowed(['csv', 'jsonl', 'ndjson'], message="Formats acceptés: CSV, JSONL")
+        ],
+        render_kw={"class": "form-control", "accept": ".csv,.jsonl,.ndjson"}
+    )
+    
+    upload_media = BooleanField(
+        'Copier les médias sur Cloudinary',
+        render_kw={"class": "form-check-input"}
+    )
+    
+    submit = SubmitField('Importer', render_kw={"class": "btn btn-primary"})
@@ -8,7 +8,7 @@ import sys
 import logging
 from app import create_app
 from models import db, User
-from werkzeug.security import generate_password_hash
+from passwords import password_hasher
 from sqlalchemy import text
 
 # Configuration du logging
@@ -122,7 +122,7 @@ def create_admin_user():
                 admin = User(
                     username=admin_username,
                     phone=admin_phone,
-                    password=generate_password_hash(admin_password),
+                    password=password_hasher.hash(admin_password),
                     is_admin=True
                 )
                 db.session.add(admin)
@@ -0,0 +1,288 @@
+"""
+Import en masse d'annonces depuis un fichier CSV ou JSON Lines.
+Le fichier est lu ligne à ligne (jamais chargé entièrement en mémoire), chaque
+ligne est validée avec les règles de ListingForm, puis les annonces valides sont
+insérées par lots (un INSERT multi-lignes par lot pour les annonces, un autre
+pour leurs médias). Les erreurs sont rapportées ligne par ligne sans interrompre
+l'import. Les médias peuvent être copiés sur Cloudinary en parallèle.
+"""
+
+import csv
+import io
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from sqlalchemy import insert, select
+from werkzeug.datastructures import MultiDict
+
+from models import db, User, PropertyListing, Media
+from forms import ListingImportRowForm
+from cloudinary_util import upload_file, delete_file, MAX_PARALLEL_UPLOADS
+from cache import page_cache
+from metrics import listings_created
+
+logger = logging.getLogger(__name__)
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+
+# Nombre d'erreurs conservées dans le rapport (les suivantes sont seulement comptées)
+MAX_REPORTED_ERRORS = 500
+
+
+class ImportReport:
+    """Résultat d'un import : lignes insérées et erreurs par ligne"""
+
+    def __init__(self):
+        self.inserted = 0
+        self.failed = 0
+        self.errors = []  # (numéro de ligne, [messages])
+
+    def add_error(self, line, messages):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, messages))
+
+    @property
+    def total(self):
+        return self.inserted + self.failed
+
+    def __repr__(self):
+        return f"<ImportReport {self.inserted} insérée(s), {self.failed} en erreur>"
+
+
+def detect_format(filename):
+    """Déduit le format ('csv' ou 'jsonl') de l'extension du fichier"""
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if extension == 'csv':
+        return 'csv'
+    if extension in ('jsonl', 'ndjson'):
+        return 'jsonl'
+    raise ValueError(f"Format d'import non reconnu : {filename}")
+
+
+def iter_records(stream, fmt):
+    """
+    Lit un flux texte et produit des tuples (numéro de ligne, dict ou erreur).
+
+    :param stream: Flux texte (fichier ouvert, TextIOWrapper...)
+    :param fmt: 'csv' ou 'jsonl'
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for record in reader:
+            # line_num : dernière ligne physique lue (les champs multilignes sont possibles)
+            yield reader.line_num, record
+    elif fmt == 'jsonl':
+        for line_no, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield line_no, f"JSON invalide : {e}"
+                continue
+            if not isinstance(record, dict):
+                yield line_no, "Chaque ligne doit être un objet JSON"
+                continue
+            yield line_no, record
+    else:
+        raise ValueError(f"Format d'import inconnu : {fmt}")
+
+
+def validate_record(record):
+    """
+    Valide une ligne avec les règles de ListingForm.
+
+    :return: Tuple (données nettoyées ou None, liste de messages d'erreur)
+    """
+    formdata = MultiDict({key: '' if value is None else str(value).strip()
+                          for key, value in record.items() if key})
+    form = ListingImportRowForm(formdata=formdata)
+    if not form.validate():
+        messages = [f"{field}: {message}"
+                    for field, field_errors in form.errors.items()
+                    for message in field_errors]
+        return None, messages
+    return {
+        'title': form.title.data,
+        'description': form.description.data,
+        'price': form.price.data,
+        'property_type': form.property_type.data,
+        'image_url': form.image_url.data,
+        'video_url': form.video_url.data or None,
+        'author': form.author.data or None,
+    }, []
+
+
+class ListingImporter:
+    """
+    Pipeline d'import : validation, copie optionnelle des médias, insertion par lots.
+
+    :param default_user: Auteur des lignes sans colonne 'author'
+    :param batch_size: Nombre d'annonces par INSERT
+    :param upload_media: Copier les médias sur Cloudinary (sinon les URLs sont reprises telles quelles)
+    :param max_workers: Uploads simultanés lors de la copie des médias
+    """
+
+    def __init__(self, default_user, batch_size=500, upload_media=False,
+                 max_workers=MAX_PARALLEL_UPLOADS):
+        self.default_user = default_user
+        self.batch_size = max(1, batch_size)
+        self.upload_media = upload_media
+        self.max_workers = max_workers
+        self._authors = {default_user.username: default_user.id}
+
+    def run(self, stream, fmt):
+        """
+        Importe toutes les lignes du flux.
+
+        :return: ImportReport
+        """
+        report = ImportReport()
+        batch = []
+        for line, record in iter_records(stream, fmt):
+            if isinstance(record, str):
+                report.add_error(line, [record])
+                continue
+            data, messages = validate_record(record)
+            if messages:
+                report.add_error(line, messages)
+                continue
+            batch.append((line, data))
+            if len(batch) >= self.batch_size:
+                self._insert_batch(batch, report)
+                batch = []
+        if batch:
+            self._insert_batch(batch, report)
+
+        if report.inserted:
+            page_cache.invalidate('feed')
+        logger.info(f"Import terminé : {report.inserted} annonce(s) insérée(s), "
+                    f"{report.failed} ligne(s) en erreur")
+        return report
+
+    def _resolve_authors(self, batch, report):
+        """Associe chaque ligne à un user_id (une requête par lot pour les auteurs inconnus)"""
+        unknown = {data['author'] for _, data in batch
+                   if data['author'] and data['author'] not in self._authors}
+        if unknown:
+            rows = db.session.execute(
+                select(User.username, User.id).where(User.username.in_(unknown))
+            ).all()
+            self._authors.update({username: user_id for username, user_id in rows})
+
+        resolved = []
+        for line, data in batch:
+            username = data['author'] or self.default_user.username
+            user_id = self._authors.get(username)
+            if user_id is None:
+                report.add_error(line, [f"author: utilisateur inconnu « {username} »"])
+                continue
+            data['user_id'] = user_id
+            resolved.append((line, data))
+        return resolved
+
+    def _copy_media(self, batch, report):
+        """Copie en parallèle les médias du lot sur Cloudinary ; écarte les lignes en échec"""
+        tasks = []
+        for index, (_, data) in enumerate(batch):
+            tasks.append((index, 'image', data['image_url']))
+            if data['video_url']:
+                tasks.append((index, 'video', data['video_url']))
+
+        workers = max(1, min(self.max_workers, len(tasks)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='import') as executor:
+            results = list(executor.map(lambda task: upload_file(task[2], task[1]), tasks))
+
+        uploaded = {}
+        failed = set()
+        for (index, file_type, _), result in zip(tasks, results):
+            if result:
+                uploaded[(index, file_type)] = result
+            else:
+                failed.add(index)
+
+        kept = []
+        for index, (line, data) in enumerate(batch):
+            if index in failed:
+                report.add_error(line, ["Échec de la copie des médias sur Cloudinary"])
+                # Ne pas laisser d'asset orphelin pour une ligne écartée
+                for file_type in ('image', 'video'):
+                    result = uploaded.get((index, file_type))
+                    if result:
+                        delete_file(result['public_id'], file_type)
+                continue
+            data['media'] = [uploaded[(index, file_type)] for file_type in ('image', 'video')
+                             if (index, file_type) in uploaded]
+            kept.append((line, data))
+        return kept
+
+    def _insert_batch(self, batch, report):
+        """Insère un lot : un INSERT multi-lignes pour les annonces, un pour les médias"""
+        batch = self._resolve_authors(batch, report)
+        if batch and self.upload_media:
+            batch = self._copy_media(batch, report)
+        if not batch:
+            return
+
+        for _, data in batch:
+            if 'media' not in data:
+                # URLs reprises telles quelles : pas de public_id, rien à supprimer plus tard
+                data['media'] = [{'public_id': None, 'url': data['image_url'], 'type': 'image'}]
+                if data['video_url']:
+                    data['media'].append({'public_id': None, 'url': data['video_url'], 'type': 'video'})
+
+        now = datetime.now(timezone.utc)
+        try:
+            # Insertion en masse : les événements ORM de Media ne sont pas déclenchés,
+            # cover_url et has_video sont donc renseignés directement
+            listing_ids = db.session.scalars(
+                insert(PropertyListing).returning(PropertyListing.id, sort_by_parameter_order=True),
+                [{
+                    'title': data['title'],
+                    'description': data['description'],
+                    'price': data['price'],
+                    'property_type': data['property_type'],
+                    'user_id': data['user_id'],
+                    'cover_url': data['media'][0]['url'],
+                    'has_video': any(m['type'] == 'video' for m in data['media']),
+                    'created_at': now,
+                    'updated_at': now,
+                } for _, data in batch]
+            ).all()
+
+            db.session.execute(insert(Media), [
+                {
+                    'public_id': media['public_id'],
+                    'url': media['url'],
+                    'file_type': media['type'],
+                    'status': 'ready',
+                    'listing_id': listing_id,
+                    'created_at': now,
+                }
+                for listing_id, (_, data) in zip(listing_ids, batch)
+                for media in data['media']
+            ])
+            db.session.commit()
+            report.inserted += len(batch)
+            listings_created.inc(len(batch), source='import')
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Échec de l'insertion d'un lot d'import : {e}", exc_info=True)
+            for line, data in batch:
+                report.add_error(line, [f"Erreur base de données : {e.__class__.__name__}"])
+                for media in data['media']:
+                    if media['public_id']:
+                        delete_file(media['public_id'], media['type'])
+
+
+def import_listings(stream, fmt, default_user, **options):
+    """Raccourci : importe un flux texte et retourne l'ImportReport"""
+    return ListingImporter(default_user, **options).run(stream, fmt)
+
+
+def open_upload(file_storage):
+    """Flux texte sur un fichier reçu, sans le charger en mémoire (BOM UTF-8 toléré)"""
+    return io.TextIOWrapper(file_storage.stream, encoding='utf-8-sig', newline='')
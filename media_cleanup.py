@@ -0,0 +1,218 @@
+"""
+Suppression différée des fichiers Cloudinary via une table outbox (media_deletion).
+Chaque ligne Media supprimée — annonce, utilisateur ou action groupée — inscrit son
+public_id dans l'outbox au sein de la même transaction : aucun asset n'est oublié,
+même si Cloudinary est indisponible. Un thread d'arrière-plan vide l'outbox par
+lots (un appel API par tranche de 100 fichiers) avec reprise sur erreur.
+"""
+
+import logging
+import random
+import threading
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import event, insert, update
+from sqlalchemy.orm import Session, object_session
+
+from models import db, Media, MediaDeletion
+from cloudinary_util import delete_files
+
+logger = logging.getLogger(__name__)
+
+
+class MediaDeletionOutbox:
+    """Extension Flask : vidage en arrière-plan de l'outbox media_deletion"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = False
+        self._thread = None
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._start_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config.get('MEDIA_DELETION_ASYNC', True)
+        self.batch_size = app.config.get('MEDIA_DELETION_BATCH_SIZE', 500)
+        self.max_attempts = app.config.get('MEDIA_DELETION_MAX_ATTEMPTS', 8)
+        self.retry_base = app.config.get('MEDIA_DELETION_RETRY_BASE', 30)
+        self.retry_max = app.config.get('MEDIA_DELETION_RETRY_MAX', 3600)
+        self.poll_interval = app.config.get('MEDIA_DELETION_POLL_INTERVAL', 60)
+        self.stale_after = app.config.get('MEDIA_DELETION_STALE_AFTER', 300)
+        app.extensions['media_deletion_outbox'] = self
+
+    def kick(self):
+        """
+        Réveille le thread de suppression (après un commit ayant alimenté l'outbox).
+        Mode synchrone (MEDIA_DELETION_ASYNC désactivé) : l'outbox est vidée immédiatement.
+        """
+        if not self.enabled:
+            self.drain()
+            return
+        self._ensure_started()
+        self._wakeup.set()
+
+    def drain(self):
+        """
+        Vide l'outbox dans le thread courant, avec une session dédiée : appelé depuis
+        after_commit, où la session de la requête ne peut plus exécuter de SQL.
+        """
+        try:
+            with Session(db.engine) as session:
+                while self.flush(session) == self.batch_size:
+                    pass  # Lot plein : il reste sans doute des lignes
+        except Exception as e:
+            logger.error(f"Outbox de suppression : {e}", exc_info=True)
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run_loop, name='media-deletion', daemon=True)
+            self._thread.start()
+
+    def shutdown(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def _run_loop(self):
+        while not self._stop.is_set():
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            try:
+                with self.app.app_context():
+                    while self.flush() == self.batch_size:
+                        pass  # Lot plein : il reste sans doute des lignes
+            except Exception as e:
+                logger.error(f"Outbox de suppression : {e}", exc_info=True)
+
+    def _claim(self, session):
+        """Réserve un lot de lignes dues pour ce worker et le retourne"""
+        now = datetime.now(timezone.utc)
+        token = uuid.uuid4().hex
+
+        # Libérer les lignes bloquées par un worker disparu
+        session.execute(
+            update(MediaDeletion)
+            .where(MediaDeletion.status == 'running',
+                   MediaDeletion.locked_at < now - timedelta(seconds=self.stale_after))
+            .values(status='pending', claimed_by=None, locked_at=None)
+        )
+        due_ids = session.scalars(
+            db.select(MediaDeletion.id)
+            .where(MediaDeletion.status == 'pending', MediaDeletion.next_attempt_at <= now)
+            .order_by(MediaDeletion.id)
+            .limit(self.batch_size)
+        ).all()
+        if due_ids:
+            session.execute(
+                update(MediaDeletion)
+                .where(MediaDeletion.id.in_(due_ids), MediaDeletion.status == 'pending')
+                .values(status='running', claimed_by=token, locked_at=now,
+                        attempts=MediaDeletion.attempts + 1),
+                execution_options={'synchronize_session': False}
+            )
+        session.commit()
+        if not due_ids:
+            return []
+        return session.scalars(
+            db.select(MediaDeletion).where(MediaDeletion.claimed_by == token)
+        ).all()
+
+    def _backoff(self, attempts):
+        delay = min(self.retry_base * 2 ** (attempts - 1), self.retry_max)
+        return timedelta(seconds=delay * random.uniform(0.5, 1.5))
+
+    def flush(self, session=None):
+        """
+        Traite un lot de l'outbox.
+
+        :param session: Session à utiliser (db.session par défaut)
+        :return: Nombre de lignes traitées (supprimées ou reportées)
+        """
+        session = session or db.session
+        rows = self._claim(session)
+        if not rows:
+            return 0
+
+        by_type = defaultdict(list)
+        for row in rows:
+            by_type[row.resource_type].append(row)
+
+        now = datetime.now(timezone.utc)
+        done = 0
+        for resource_type, group in by_type.items():
+            outcome = delete_files([row.public_id for row in group], resource_type)
+            for row in group:
+                row.claimed_by = None
+                row.locked_at = None
+                if outcome.get(row.public_id):
+                    row.status = 'done'
+                    row.last_error = None
+                    done += 1
+                elif row.attempts >= self.max_attempts:
+                    row.status = 'failed'
+                    row.last_error = "Nombre maximal de tentatives atteint"
+                else:
+                    row.status = 'pending'
+                    row.last_error = "Échec de la suppression Cloudinary"
+                    row.next_attempt_at = now + self._backoff(row.attempts)
+        session.commit()
+
+        logger.info(f"Outbox de suppression : {done}/{len(rows)} fichier(s) supprimé(s)")
+        return len(rows)
+
+
+# Instance partagée, initialisée dans create_app()
+media_outbox = MediaDeletionOutbox()
+
+
+# === Alimentation de l'outbox ===
+
+def enqueue_deletions(connection, db_session, files):
+    """
+    Inscrit des fichiers dans l'outbox, dans la transaction en cours (une seule requête).
+    Sert aussi aux suppressions groupées (DELETE en masse), qui ne déclenchent pas after_delete.
+
+    :param files: Itérable de tuples (public_id, resource_type)
+    """
+    now = datetime.now(timezone.utc)
+    rows = [{
+        'public_id': public_id,
+        'resource_type': resource_type,
+        'status': 'pending',
+        'attempts': 0,
+        'next_attempt_at': now,
+        'created_at': now
+    } for public_id, resource_type in files if public_id]
+    # Média jamais envoyé (upload en attente ou échoué) : rien à supprimer
+    if not rows:
+        return
+    connection.execute(insert(MediaDeletion.__table__), rows)
+    if db_session is not None:
+        db_session.info['media_deletion_pending'] = True
+
+
+@event.listens_for(Media, 'after_delete')
+def _enqueue_media_deletion(mapper, connection, target):
+    """Inscrit le fichier d'un média supprimé, dans la même transaction"""
+    enqueue_deletions(connection, object_session(target), [(target.public_id, target.file_type)])
+
+
+@event.listens_for(db.session, 'after_commit')
+def _kick_outbox(db_session):
+    """Réveille le thread de suppression une fois la transaction validée"""
+    if db_session.info.pop('media_deletion_pending', False):
+        media_outbox.kick()
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_pending(db_session):
+    db_session.info.pop('media_deletion_pending', None)
@@ -0,0 +1,240 @@
+"""
+Préparation des médias avant l'envoi à Cloudinary.
+Taille et dimensions sont lues dans l'en-tête du fichier (quelques Ko, sans
+décoder l'image) pour appliquer les budgets par type (UPLOAD_MAX_*). Une photo
+plus grande que UPLOAD_IMAGE_MAX_EDGE est réduite et réencodée localement
+(Pillow, optionnel ; décodage JPEG à échelle réduite) : le worker transmet
+moins d'octets et l'upload dure moins longtemps. Le navigateur réduit déjà les
+photos avant l'envoi (static/js/upload-resize.js) ; ce module est le garde-fou
+côté serveur.
+"""
+
+import io
+import logging
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+from werkzeug.datastructures import FileStorage
+
+logger = logging.getLogger(__name__)
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow absent : contrôles seulement, pas de réduction
+    Image = None
+
+# Octets lus pour reconnaître le format (et les dimensions hors JPEG, toujours en tête de fichier)
+HEADER_READ_SIZE = 64 * 1024
+
+# Réductions simultanées (Pillow libère le GIL pendant le décodage et le redimensionnement)
+MAX_PARALLEL_RESIZES = 4
+
+# Formats réencodables : format Pillow, extension, type MIME
+REENCODE_FORMATS = {
+    'jpeg': ('JPEG', 'jpg', 'image/jpeg'),
+    'png': ('PNG', 'png', 'image/png'),
+    'webp': ('WEBP', 'webp', 'image/webp'),
+}
+
+
+class MediaRejected(ValueError):
+    """Fichier hors budget (taille, dimensions) ou illisible"""
+
+
+def file_size(stream):
+    """Taille d'un fichier ouvert, sans le lire"""
+    position = stream.tell()
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(position)
+    return size
+
+
+def _jpeg_dimensions(stream):
+    """
+    Dimensions d'un JPEG : parcours des segments avec seek jusqu'au marqueur SOF,
+    sans lire les segments volumineux (EXIF, ICC, XMP étendu) qui le précèdent.
+    """
+    stream.seek(2, os.SEEK_CUR)  # SOI
+    while True:
+        if stream.read(1) != b'\xff':
+            return None
+        marker = stream.read(1)
+        while marker == b'\xff':  # Octets de remplissage
+            marker = stream.read(1)
+        if not marker:
+            return None
+        marker = marker[0]
+        # Marqueurs sans longueur (RSTn, TEM)
+        if 0xD0 <= marker <= 0xD7 or marker == 0x01:
+            continue
+        header = stream.read(2)
+        if len(header) < 2:
+            return None
+        segment_length = struct.unpack('>H', header)[0]
+        # SOF0..SOF15, sauf DHT (C4), JPG (C8) et DAC (CC)
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            data = stream.read(5)
+            if len(data) < 5:
+                return None
+            height, width = struct.unpack('>HH', data[1:5])
+            return width, height
+        if marker in (0xD9, 0xDA) or segment_length < 2:  # EOI ou début des données : pas de SOF
+            return None
+        stream.seek(segment_length - 2, os.SEEK_CUR)
+
+
+def _pillow_dimensions(stream):
+    """Repli : dimensions lues par Pillow (ouverture paresseuse, sans décoder les pixels)"""
+    if Image is None:
+        return None
+    try:
+        with Image.open(stream) as image:
+            return image.size
+    except Exception:
+        return None
+
+
+def _webp_dimensions(data):
+    chunk = data[12:16]
+    if chunk == b'VP8 ' and len(data) >= 30:
+        width, height = struct.unpack('<HH', data[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b'VP8L' and len(data) >= 25:
+        bits = int.from_bytes(data[21:25], 'little')
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b'VP8X' and len(data) >= 30:
+        return int.from_bytes(data[24:27], 'little') + 1, int.from_bytes(data[27:30], 'little') + 1
+    return None
+
+
+def image_info(stream):
+    """
+    Format et dimensions d'une image d'après son en-tête (le flux est rembobiné).
+
+    :return: Tuple (format, largeur, hauteur) ou None si le format n'est pas reconnu
+    """
+    position = stream.tell()
+    data = stream.read(HEADER_READ_SIZE)
+    stream.seek(position)
+
+    if data.startswith(b'\xff\xd8'):
+        image_format = 'jpeg'
+        try:
+            dimensions = _jpeg_dimensions(stream)
+        finally:
+            stream.seek(position)
+    elif data.startswith(b'\x89PNG\r\n\x1a\n') and data[12:16] == b'IHDR':
+        dimensions, image_format = struct.unpack('>II', data[16:24]), 'png'
+    elif data[:6] in (b'GIF87a', b'GIF89a'):
+        dimensions, image_format = struct.unpack('<HH', data[6:10]), 'gif'
+    elif data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        dimensions, image_format = _webp_dimensions(data), 'webp'
+    else:
+        return None
+    if not dimensions:
+        # En-tête inhabituel : ne pas refuser une image valide pour autant
+        dimensions = _pillow_dimensions(stream)
+        stream.seek(position)
+    if not dimensions:
+        return None
+    return image_format, dimensions[0], dimensions[1]
+
+
+def check_budget(file_storage, file_type, config=None):
+    """
+    Vérifie un fichier reçu contre les budgets de son type.
+
+    :raises MediaRejected: Fichier trop lourd, image illisible ou aux dimensions excessives
+    :return: Tuple (taille en octets, infos image ou None)
+    """
+    config = config or current_app.config
+    stream = file_storage.stream
+    size = file_size(stream)
+    limit = config['UPLOAD_MAX_IMAGE_BYTES'] if file_type == 'image' else config['UPLOAD_MAX_VIDEO_BYTES']
+    if size > limit:
+        raise MediaRejected(f"Fichier trop volumineux ({size / 1_048_576:.1f} Mo, "
+                            f"maximum {limit / 1_048_576:.0f} Mo).")
+    if file_type != 'image':
+        return size, None
+
+    info = image_info(stream)
+    if info is None:
+        raise MediaRejected("Image illisible ou format non pris en charge.")
+    _, width, height = info
+    if width * height > config['UPLOAD_MAX_IMAGE_PIXELS']:
+        raise MediaRejected(f"Image trop grande ({width}×{height} pixels).")
+    return size, info
+
+
+def downscale_image(file_storage, info, max_edge, quality):
+    """
+    Réduit une image dont le plus grand côté dépasse max_edge.
+
+    :return: Nouveau FileStorage (en mémoire), ou None si l'original convient
+    """
+    image_format, width, height = info
+    if Image is None or image_format not in REENCODE_FORMATS or max(width, height) <= max_edge:
+        return None
+
+    pil_format, extension, mimetype = REENCODE_FORMATS[image_format]
+    stream = file_storage.stream
+    stream.seek(0)
+    try:
+        with Image.open(stream) as image:
+            # JPEG : décodage directement à une échelle réduite (1/2, 1/4, 1/8)
+            image.draft('RGB', (max_edge, max_edge))
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+            output = io.BytesIO()
+            options = {'optimize': True}
+            if pil_format in ('JPEG', 'WEBP'):
+                options['quality'] = quality
+                if image.mode not in ('RGB', 'L') and pil_format == 'JPEG':
+                    image = image.convert('RGB')
+            image.save(output, pil_format, **options)
+    except Exception as e:
+        logger.warning(f"Réduction impossible de {file_storage.filename} : {e}")
+        return None
+    finally:
+        stream.seek(0)
+
+    output.seek(0)
+    base = os.path.splitext(file_storage.filename or 'image')[0]
+    logger.info(f"Image réduite : {file_storage.filename} {width}×{height} → "
+                f"{image.width}×{image.height} ({file_size(stream)} → {len(output.getbuffer())} octets)")
+    return FileStorage(stream=output, filename=f"{base}.{extension}", content_type=mimetype)
+
+
+def prepare_uploads(files, config=None, max_workers=MAX_PARALLEL_RESIZES):
+    """
+    Contrôle et prépare les fichiers d'une annonce avant l'envoi.
+    Les budgets sont vérifiés d'abord (lecture d'en-tête), puis les photos d'une
+    galerie sont réduites en parallèle dans un pool de threads borné.
+
+    :param files: Liste de tuples (FileStorage, 'image' | 'video')
+    :param max_workers: Nombre maximal de réductions simultanées
+    :raises MediaRejected: Un fichier dépasse son budget
+    :return: Liste de tuples (FileStorage éventuellement réduit, type), même ordre
+    """
+    config = config or current_app.config
+    infos = [check_budget(file_storage, file_type, config)[1] for file_storage, file_type in files]
+    if not config.get('UPLOAD_DOWNSCALE', True):
+        return list(files)
+
+    def prepare(file_storage, info):
+        if info is None:
+            return file_storage
+        return downscale_image(file_storage, info, config['UPLOAD_IMAGE_MAX_EDGE'],
+                               config['UPLOAD_IMAGE_QUALITY']) or file_storage
+
+    images = sum(1 for info in infos if info is not None)
+    if images <= 1:
+        prepared = [prepare(file_storage, info) for (file_storage, _), info in zip(files, infos)]
+    else:
+        workers = min(max_workers, images)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='resize') as executor:
+            prepared = list(executor.map(prepare, [file_storage for file_storage, _ in files], infos))
+    return [(file_storage, file_type) for file_storage, (_, file_type) in zip(prepared, files)]
@@ -0,0 +1,325 @@
+"""
+Stockage des médias : interface commune et implémentations.
+- CloudinaryStorage : SDK Cloudinary avec un pool de connexions HTTP partagé
+  (keep-alive, taille alignée sur les uploads parallèles), délais de connexion
+  et de lecture distincts, nouvelles tentatives avec attente aléatoire sur les
+  erreurs transitoires, et disjoncteur : après une série d'échecs, les appels
+  échouent immédiatement pendant MEDIA_STORAGE_BREAKER_RESET secondes au lieu
+  d'attendre chacun le délai maximal.
+- LocalStorage / MemoryStorage : substituts hors ligne (développement, tests,
+  tests de charge), avec une latence simulée optionnelle.
+Le backend est choisi par MEDIA_STORAGE_BACKEND ; cloudinary_util délègue ici.
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+
+import cloudinary
+import cloudinary.api
+import cloudinary.uploader
+import cloudinary.utils
+from cloudinary.exceptions import Error as CloudinaryError, GeneralError, RateLimited
+from urllib3 import Timeout
+
+logger = logging.getLogger(__name__)
+
+# Messages du SDK correspondant à une erreur réseau ou à une réponse serveur illisible
+TRANSIENT_MESSAGES = ('Unexpected error', 'Socket error', 'Socket Error', 'Error parsing server response (5')
+
+
+class StorageError(RuntimeError):
+    """Échec d'une opération de stockage (après les éventuelles nouvelles tentatives)"""
+
+
+class StorageUnavailable(StorageError):
+    """Disjoncteur ouvert : le service est considéré indisponible"""
+
+
+class CircuitBreaker:
+    """Disjoncteur : fermé, ouvert après threshold échecs consécutifs, semi-ouvert après reset_timeout"""
+
+    def __init__(self, threshold=5, reset_timeout=30):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        """Un appel peut-il partir ? En semi-ouvert, un seul appel d'essai à la fois."""
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info("Disjoncteur du stockage refermé")
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.failures >= self.threshold:
+                if self.opened_at is None or self.state == 'half-open':
+                    logger.warning(f"Disjoncteur du stockage ouvert pour {self.reset_timeout} s "
+                                   f"({self.failures} échec(s) consécutif(s))")
+                self.opened_at = time.monotonic()
+
+
+def _read_bytes(file):
+    """
+    Contenu d'un fichier reçu (FileStorage, objet fichier, chemin ou bytes).
+
+    :raises StorageError: URL distante (les backends hors ligne ne téléchargent rien)
+    """
+    if isinstance(file, (bytes, bytearray)):
+        return bytes(file)
+    if isinstance(file, str) and file.lower().startswith(('http://', 'https://')):
+        raise StorageError(f"upload : URL distante non prise en charge par le stockage hors ligne ({file})")
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, 'rb') as f:
+            return f.read()
+    stream = getattr(file, 'stream', file)
+    if hasattr(stream, 'seek'):
+        stream.seek(0)
+    return stream.read()
+
+
+def _extension(file, resource_type):
+    name = getattr(file, 'filename', None) or (file if isinstance(file, str) else '')
+    extension = os.path.splitext(name)[1].lower()
+    return extension or ('.jpg' if resource_type == 'image' else '.mp4')
+
+
+class CloudinaryStorage:
+    """Cloudinary via le SDK, avec pool de connexions, nouvelles tentatives et disjoncteur"""
+
+    name = 'cloudinary'
+
+    def __init__(self, timeout=10, connect_timeout=3, retries=2, backoff=0.5, pool_size=8,
+                 breaker_threshold=5, breaker_reset=30):
+        self.timeout = Timeout(connect=connect_timeout, read=timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset)
+
+    def install_connection_pool(self):
+        """
+        Remplace les connecteurs HTTP du SDK (un seul socket réutilisable par hôte par défaut)
+        par un pool dimensionné pour les uploads parallèles.
+        """
+        import cloudinary.api_client.call_api as admin_api
+        options = dict(cloudinary.CERT_KWARGS, maxsize=self.pool_size, block=False)
+        connector = cloudinary.utils.get_http_connector(cloudinary.config(), options)
+        cloudinary.uploader._http = connector
+        admin_api._http = connector
+
+    @staticmethod
+    def is_transient(error):
+        if isinstance(error, (RateLimited, GeneralError)):
+            return True
+        return isinstance(error, CloudinaryError) and str(error).startswith(TRANSIENT_MESSAGES)
+
+    def _call(self, operation, func, *args, rewind=None, **kwargs):
+        """Exécute un appel SDK sous le disjoncteur, avec nouvelles tentatives espacées aléatoirement"""
+        if not self.breaker.allow():
+            raise StorageUnavailable(f"Cloudinary indisponible ({operation} refusé par le disjoncteur)")
+        attempt = 0
+        while True:
+            try:
+                result = func(*args, timeout=self.timeout, **kwargs)
+            except Exception as e:
+                transient = self.is_transient(e)
+                if transient and attempt < self.retries:
+                    # Attente aléatoire (« full jitter ») pour ne pas synchroniser les workers
+                    delay = random.uniform(0, self.backoff * 2 ** attempt)
+                    attempt += 1
+                    logger.warning(f"[Cloudinary] {operation} : erreur transitoire ({e}), "
+                                   f"nouvel essai {attempt}/{self.retries} dans {delay:.2f} s")
+                    time.sleep(delay)
+                    if rewind is not None:
+                        rewind()
+                    continue
+                if transient:
+                    self.breaker.record_failure()
+                else:
+                    # Erreur définitive (fichier refusé...) : le service répond, fermer le disjoncteur
+                    self.breaker.record_success()
+                raise StorageError(f"{operation} : {e}") from e
+            self.breaker.record_success()
+            return result
+
+    def upload(self, file, resource_type, folder=None, preset=None):
+        """
+        :return: Dict avec 'public_id', 'url', 'type'
+        :raises StorageError: Échec définitif ou disjoncteur ouvert
+        """
+        stream = getattr(file, 'stream', file)
+        rewind = stream.seek if hasattr(stream, 'seek') else None
+        result = self._call(
+            'upload', cloudinary.uploader.upload, file,
+            rewind=(lambda: rewind(0)) if rewind else None,
+            resource_type=resource_type,
+            upload_preset=preset,
+            folder=folder,
+            use_filename=True,
+            unique_filename=True,
+            overwrite=False,
+        )
+        return {'public_id': result['public_id'], 'url': result['secure_url'], 'type': resource_type}
+
+    def delete(self, public_id, resource_type):
+        """:return: True si supprimé, False si introuvable"""
+        result = self._call('destroy', cloudinary.uploader.destroy, public_id, resource_type=resource_type)
+        return result.get('result') == 'ok'
+
+    def delete_many(self, public_ids, resource_type):
+        """:return: Dict {public_id: True si supprimé ou déjà absent}"""
+        result = self._call('delete_resources', cloudinary.api.delete_resources, list(public_ids),
+                            resource_type=resource_type)
+        deleted = result.get('deleted', {})
+        return {public_id: deleted.get(public_id) in ('deleted', 'not_found') for public_id in public_ids}
+
+
+class MemoryStorage:
+    """Substitut en mémoire (tests, tests de charge sans réseau)"""
+
+    name = 'memory'
+
+    def __init__(self, base_url='/static/media', latency_ms=0):
+        self.base_url = base_url.rstrip('/')
+        self.latency = latency_ms / 1000
+        self.files = {}
+        self._lock = threading.Lock()
+
+    def _simulate_latency(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _public_id(self, folder):
+        return f"{folder}/{uuid.uuid4().hex}" if folder else uuid.uuid4().hex
+
+    def _store(self, public_id, extension, data):
+        with self._lock:
+            self.files[public_id] = (extension, data)
+
+    def _remove(self, public_id):
+        with self._lock:
+            return self.files.pop(public_id, None) is not None
+
+    def upload(self, file, resource_type, folder=None, preset=None):
+        self._simulate_latency()
+        try:
+            data = _read_bytes(file)
+        except OSError as e:
+            raise StorageError(f"upload : {e}") from e
+        public_id = self._public_id(folder)
+        extension = _extension(file, resource_type)
+        self._store(public_id, extension, data)
+        return {'public_id': public_id, 'url': f"{self.base_url}/{public_id}{extension}", 'type': resource_type}
+
+    def delete(self, public_id, resource_type):
+        self._simulate_latency()
+        return self._remove(public_id)
+
+    def delete_many(self, public_ids, resource_type):
+        self._simulate_latency()
+        for public_id in public_ids:
+            self._remove(public_id)
+        # Comme Cloudinary : un fichier déjà absent compte comme supprimé
+        return {public_id: True for public_id in public_ids}
+
+
+class LocalStorage(MemoryStorage):
+    """Substitut sur disque (développement hors ligne), servi par Flask sous base_url"""
+
+    name = 'local'
+
+    def __init__(self, directory, base_url='/static/media', latency_ms=0):
+        super().__init__(base_url, latency_ms)
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _store(self, public_id, extension, data):
+        path = os.path.join(self.directory, public_id + extension)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    def _remove(self, public_id):
+        directory, name = os.path.split(os.path.join(self.directory, public_id))
+        removed = False
+        if os.path.isdir(directory):
+            for entry in os.scandir(directory):
+                if os.path.splitext(entry.name)[0] == name:
+                    os.unlink(entry.path)
+                    removed = True
+        return removed
+
+
+class MediaStorage:
+    """Extension Flask : backend de stockage choisi par MEDIA_STORAGE_BACKEND"""
+
+    def __init__(self, app=None):
+        self.backend = CloudinaryStorage()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        name = config.get('MEDIA_STORAGE_BACKEND', 'cloudinary')
+        base_url = config.get('MEDIA_STORAGE_URL', '/static/media')
+        latency_ms = config.get('MEDIA_STORAGE_FAKE_LATENCY_MS', 0)
+
+        if name == 'cloudinary':
+            self.backend = CloudinaryStorage(
+                timeout=config.get('MEDIA_STORAGE_TIMEOUT', 10),
+                connect_timeout=config.get('MEDIA_STORAGE_CONNECT_TIMEOUT', 3),
+                retries=config.get('MEDIA_STORAGE_RETRIES', 2),
+                backoff=config.get('MEDIA_STORAGE_RETRY_BACKOFF', 0.5),
+                pool_size=config.get('MEDIA_STORAGE_POOL_SIZE', 8),
+                breaker_threshold=config.get('MEDIA_STORAGE_BREAKER_THRESHOLD', 5),
+                breaker_reset=config.get('MEDIA_STORAGE_BREAKER_RESET', 30),
+            )
+            self.backend.install_connection_pool()
+        elif name == 'local':
+            directory = config.get('MEDIA_STORAGE_DIR') or os.path.join(app.static_folder, 'media')
+            self.backend = LocalStorage(directory, base_url, latency_ms)
+        elif name == 'memory':
+            self.backend = MemoryStorage(base_url, latency_ms)
+        else:
+            raise ValueError(f"Backend de stockage inconnu : {name}")
+
+        app.extensions['media_storage'] = self
+        app.logger.info(f"🖼️ Stockage des médias : {self.backend.name}")
+
+    @property
+    def is_cloudinary(self):
+        return self.backend.name == 'cloudinary'
+
+
+# Instance partagée, initialisée dans create_app()
+media_storage = MediaStorage()
@@ -0,0 +1,93 @@
+"""
+URLs de diffusion des médias Cloudinary aux dimensions d'affichage.
+Une transformation (recadrage, f_auto, q_auto) est insérée dans l'URL de
+livraison : le navigateur reçoit une image au format et à la taille de son
+emplacement (carte, détail, plein écran) au lieu de l'original, et un srcset
+lui laisse choisir la largeur adaptée à l'écran. Les URLs sont de simples
+dérivations de l'URL stockée, mémoïsées par processus. Les URLs qui ne sont pas
+des livraisons Cloudinary (imports d'URLs externes) sont renvoyées telles quelles.
+"""
+
+import re
+from functools import lru_cache
+
+# Segment de livraison : /<cloud>/<image|video>/upload/
+UPLOAD_SEGMENT = re.compile(r'^(https?://res\.cloudinary\.com/[^/]+/(image|video)/upload/)(.+)$')
+
+# Variantes d'affichage : largeur, hauteur (None = proportions d'origine), recadrage
+VARIANTS = {
+    'thumb': {'width': 160, 'height': 80, 'crop': 'fill'},
+    'card': {'width': 400, 'height': 200, 'crop': 'fill'},
+    'detail': {'width': 800, 'height': 400, 'crop': 'fill'},
+    'full': {'width': 1600, 'height': None, 'crop': 'limit'},
+}
+
+# Largeurs proposées dans srcset (le navigateur choisit selon sizes et la densité d'écran)
+SRCSET_WIDTHS = {
+    'thumb': (160, 320),
+    'card': (320, 400, 640, 800),
+    'detail': (480, 800, 1200, 1600),
+    'full': (800, 1200, 1600, 2400),
+}
+
+# Attribut sizes correspondant à la mise en page Bootstrap de chaque emplacement
+SIZES = {
+    'thumb': '160px',
+    'card': '(min-width: 992px) 33vw, (min-width: 768px) 50vw, 100vw',
+    'detail': '(min-width: 992px) 66vw, 100vw',
+    'full': '100vw',
+}
+
+MAX_MEMOIZED_URLS = 8192
+
+
+def _transformation(variant, width=None):
+    spec = VARIANTS[variant]
+    width = width or spec['width']
+    parts = [f"c_{spec['crop']}", f"w_{width}"]
+    if spec['height']:
+        # Hauteur proportionnelle à la largeur demandée (mêmes proportions pour tout le srcset)
+        parts.append(f"h_{round(spec['height'] * width / spec['width'])}")
+        parts.append('g_auto')
+    parts += ['f_auto', 'q_auto']
+    return ','.join(parts)
+
+
+@lru_cache(maxsize=MAX_MEMOIZED_URLS)
+def variant_url(url, variant, width=None):
+    """
+    URL transformée d'un média.
+
+    :param url: URL de livraison Cloudinary (secure_url)
+    :param variant: 'thumb', 'card', 'detail' ou 'full'
+    :param width: Largeur explicite (entrées de srcset), sinon celle de la variante
+    :return: URL transformée, ou url inchangée si ce n'est pas une livraison Cloudinary
+    """
+    if not url:
+        return url
+    if variant not in VARIANTS:
+        raise ValueError(f"Variante d'image inconnue : {variant}")
+    match = UPLOAD_SEGMENT.match(url)
+    if not match:
+        return url
+    prefix, resource_type, path = match.groups()
+    if resource_type == 'video':
+        # Image fixe extraite de la première seconde (vignette ou poster)
+        path = re.sub(r'\.[A-Za-z0-9]+$', '.jpg', path)
+        return f"{prefix}so_0,{_transformation(variant, width)}/{path}"
+    return f"{prefix}{_transformation(variant, width)}/{path}"
+
+
+@lru_cache(maxsize=MAX_MEMOIZED_URLS)
+def srcset(url, variant):
+    """Attribut srcset d'un média (vide si l'URL ne peut pas être transformée)"""
+    if not url or not UPLOAD_SEGMENT.match(url):
+        return ''
+    return ', '.join(f"{variant_url(url, variant, width)} {width}w" for width in SRCSET_WIDTHS[variant])
+
+
+def register_media_helpers(app):
+    """Filtres Jinja : {{ url|media_variant('card') }}, {{ url|media_srcset('card') }}"""
+    app.add_template_filter(variant_url, 'media_variant')
+    app.add_template_filter(srcset, 'media_srcset')
+    app.add_template_global(SIZES, 'media_sizes')
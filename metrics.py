@@ -0,0 +1,445 @@
+"""
+Métriques au format texte Prometheus (/metrics).
+Compteurs et histogrammes en mémoire, mis à jour sous un verrou par métrique
+(quelques instructions). Avec plusieurs workers gunicorn, chaque worker écrit
+périodiquement ses totaux dans METRICS_MULTIPROC_DIR (un fichier par pid) et
+/metrics additionne les fichiers : les compteurs des workers arrêtés restent
+comptés, les jauges ne retiennent que les workers vivants.
+L'accès est réservé aux adresses autorisées (METRICS_ALLOWED_IPS) ou aux
+requêtes portant le jeton METRICS_TOKEN (en-tête Authorization: Bearer).
+"""
+
+import atexit
+import bisect
+import glob
+import hmac
+import ipaddress
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from functools import wraps
+
+from flask import Response, abort, g, request
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# Bornes des histogrammes de latence, en secondes
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Metric:
+    """Valeurs d'une métrique, indexées par tuple de valeurs d'étiquettes"""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Étiquettes attendues pour {self.name} : {self.labelnames}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set_total(self, value, **labels):
+        """Recopie un total tenu ailleurs (compteurs du pool, du cache...)"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # Un compte par borne, plus le seau +Inf, puis la somme
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def samples(self):
+        with self._lock:
+            return [[list(key), [list(counts), total]] for key, (counts, total) in self._values.items()]
+
+
+class MetricsRegistry:
+    """Ensemble ordonné de métriques et de collecteurs appelés avant chaque export"""
+
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+
+    def _register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Métrique déjà déclarée : {metric.name}")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def collect(self):
+        for collector in self.collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.error(f"Collecteur de métriques en échec ({collector.__name__}) : {e}")
+
+    def snapshot(self):
+        """Totaux du worker courant (sérialisables en JSON)"""
+        self.collect()
+        return {name: metric.samples() for name, metric in self.metrics.items()}
+
+    def merge(self, snapshots):
+        """
+        Additionne les instantanés de plusieurs workers.
+
+        :param snapshots: Liste de tuples (instantané, worker vivant)
+        """
+        merged = {name: {} for name in self.metrics}
+        for snapshot, alive in snapshots:
+            for name, samples in snapshot.items():
+                metric = self.metrics.get(name)
+                if metric is None or (metric.kind == 'gauge' and not alive):
+                    continue
+                values = merged[name]
+                for labels, value in samples:
+                    key = tuple(labels)
+                    if metric.kind == 'histogram':
+                        counts, total = values.get(key, [[0] * len(value[0]), 0.0])
+                        if len(counts) != len(value[0]):
+                            continue  # Bornes modifiées entre deux déploiements
+                        values[key] = [[a + b for a, b in zip(counts, value[0])], total + value[1]]
+                    else:
+                        values[key] = values.get(key, 0) + value
+        return merged
+
+    def render(self, merged):
+        """Format d'exposition texte Prometheus"""
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for key, value in sorted(merged.get(name, {}).items()):
+                labels = list(zip(metric.labelnames, key))
+                if metric.kind == 'histogram':
+                    counts, total = value
+                    cumulative = 0
+                    for bound, count in zip(metric.buckets + (float('inf'),), counts):
+                        cumulative += count
+                        le = '+Inf' if bound == float('inf') else _format_value(bound)
+                        lines.append(f"{name}_bucket{_format_labels(labels + [('le', le)])} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+                else:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(round(value, 6))
+    return str(value)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# === Métriques de l'application ===
+
+registry = MetricsRegistry()
+
+http_requests = registry.counter(
+    'immo_http_requests_total', "Requêtes HTTP traitées",
+    ('blueprint', 'endpoint', 'method', 'status'))
+http_request_duration = registry.histogram(
+    'immo_http_request_duration_seconds', "Durée de traitement des requêtes HTTP",
+    ('blueprint', 'endpoint'))
+
+cloudinary_operations = registry.counter(
+    'immo_cloudinary_operations_total', "Appels Cloudinary par opération et résultat",
+    ('operation', 'outcome'))
+cloudinary_duration = registry.histogram(
+    'immo_cloudinary_operation_duration_seconds', "Durée des appels Cloudinary",
+    ('operation',))
+
+listings_created = registry.counter(
+    'immo_listings_created_total', "Annonces créées", ('source',))
+
+cache_requests = registry.counter(
+    'immo_cache_requests_total', "Consultations des caches par résultat", ('cache', 'result'))
+
+db_pool_events = registry.counter(
+    'immo_db_pool_events_total', "Événements du pool de connexions", ('database', 'event'))
+db_pool_wait = registry.counter(
+    'immo_db_pool_wait_seconds_total', "Temps total d'attente d'une connexion du pool", ('database',))
+db_pool_connections = registry.gauge(
+    'immo_db_pool_connections', "Connexions du pool par état", ('database', 'state'))
+
+
+def track_cloudinary(operation, succeeded=bool):
+    """
+    Décorateur : compte et chronomètre un appel Cloudinary.
+
+    :param operation: Étiquette de l'opération ('upload', 'delete'...)
+    :param succeeded: Fonction jugeant le résultat (par défaut : valeur vraie)
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            outcome = 'failure'
+            try:
+                result = func(*args, **kwargs)
+                if succeeded(result):
+                    outcome = 'success'
+                return result
+            finally:
+                cloudinary_duration.observe(time.perf_counter() - start, operation=operation)
+                cloudinary_operations.inc(operation=operation, outcome=outcome)
+        return wrapper
+    return decorator
+
+
+class MetricsExporter:
+    """Extension Flask : mesure des requêtes, agrégation entre workers et route /metrics"""
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.directory = None
+        self.token = None
+        self.allowed_networks = []
+        self.flush_interval = 10
+        self._flushed_at = 0.0
+        self._flush_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app, engines=None):
+        """
+        :param engines: Dict {nom de base: moteur SQLAlchemy} pour les jauges du pool
+        """
+        self.enabled = app.config.get('METRICS_ENABLED', True)
+        app.extensions['metrics'] = self
+        if not self.enabled:
+            return
+
+        self.token = app.config.get('METRICS_TOKEN') or None
+        self.flush_interval = app.config.get('METRICS_FLUSH_INTERVAL', 10)
+        self.allowed_networks = []
+        for value in app.config.get('METRICS_ALLOWED_IPS', ('127.0.0.1', '::1')):
+            try:
+                self.allowed_networks.append(ipaddress.ip_network(value.strip(), strict=False))
+            except ValueError:
+                app.logger.warning(f"Adresse METRICS_ALLOWED_IPS invalide ignorée : {value}")
+
+        self.directory = app.config.get('METRICS_MULTIPROC_DIR') or None
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            atexit.register(self.flush)
+
+        registry.collectors = [_collect_cache_stats]
+        if engines:
+            registry.collectors.append(_pool_collector(engines))
+
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.add_url_rule('/metrics', 'metrics', self.view)
+        app.logger.info(f"📈 Métriques exposées sur /metrics"
+                        f"{' (agrégation multi-workers)' if self.directory else ''}")
+
+    # === Mesure des requêtes ===
+
+    def _start_request(self):
+        g._metrics_start = time.perf_counter()
+
+    def _finish_request(self, response):
+        start = g.pop('_metrics_start', None)
+        if start is None or request.endpoint == 'static':
+            return response
+        blueprint = request.blueprint or 'app'
+        # Les URL inconnues partagent une étiquette (pas d'explosion de cardinalité)
+        endpoint = request.endpoint or 'unmatched'
+        http_requests.inc(blueprint=blueprint, endpoint=endpoint,
+                          method=request.method, status=response.status_code)
+        http_request_duration.observe(time.perf_counter() - start,
+                                      blueprint=blueprint, endpoint=endpoint)
+        if self.directory and time.monotonic() - self._flushed_at >= self.flush_interval:
+            self.flush()
+        return response
+
+    # === Agrégation entre workers ===
+
+    def _path(self, pid=None):
+        return os.path.join(self.directory, f"worker-{pid or os.getpid()}.json")
+
+    def flush(self):
+        """Écrit les totaux du worker courant dans le répertoire partagé"""
+        if not self.directory or not self._flush_lock.acquire(blocking=False):
+            return
+        try:
+            payload = json.dumps(registry.snapshot()).encode('utf-8')
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(payload)
+            os.replace(tmp_path, self._path())
+        except OSError as e:
+            logger.error(f"Écriture des métriques impossible : {e}")
+        finally:
+            self._flushed_at = time.monotonic()
+            self._flush_lock.release()
+
+    def gather(self):
+        """Totaux de tous les workers (ou du worker courant sans répertoire partagé)"""
+        if not self.directory:
+            return registry.merge([(registry.snapshot(), True)])
+
+        self.flush()
+        snapshots = []
+        for path in glob.glob(os.path.join(self.directory, 'worker-*.json')):
+            try:
+                pid = int(os.path.basename(path)[len('worker-'):-len('.json')])
+                with open(path, 'rb') as f:
+                    snapshots.append((json.load(f), _pid_alive(pid)))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Fichier de métriques illisible ignoré ({path}) : {e}")
+        return registry.merge(snapshots)
+
+    # === Route /metrics ===
+
+    def is_authorized(self):
+        if self.token:
+            header = request.headers.get('Authorization', '')
+            if header.startswith('Bearer ') and hmac.compare_digest(header[7:], self.token):
+                return True
+        from rate_limit import rate_limiter
+        try:
+            address = ipaddress.ip_address(rate_limiter.client_ip())
+        except ValueError:
+            return False
+        return any(address in network for network in self.allowed_networks)
+
+    def view(self):
+        if not self.is_authorized():
+            abort(404)
+        response = Response(registry.render(self.gather()), content_type=CONTENT_TYPE)
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+
+
+# Instance partagée, initialisée dans create_app()
+metrics = MetricsExporter()
+
+
+# === Collecteurs ===
+
+def _collect_cache_stats():
+    from cache import page_cache
+    from user_cache import user_cache
+    for name, stats in (('page', page_cache.stats()), ('user', user_cache.stats())):
+        cache_requests.set_total(stats['hits'], cache=name, result='hit')
+        cache_requests.set_total(stats['misses'], cache=name, result='miss')
+
+
+def _pool_collector(engines):
+    from db_pool import pool_metrics_for
+
+    def _collect_pool_stats():
+        # Une série par moteur (primaire, réplica)
+        for database, engine in engines.items():
+            data = pool_metrics_for(engine).snapshot(engine.pool)
+            for state in ('checked_out', 'idle', 'overflow'):
+                if state in data:
+                    db_pool_connections.set(data[state], database=database, state=state)
+            for event_name in ('connects', 'checkouts', 'checkins', 'invalidations',
+                               'overflow_checkouts', 'timeouts'):
+                db_pool_events.set_total(data[event_name], database=database, event=event_name)
+            db_pool_wait.set_total(data['wait_seconds_total'], database=database)
+    return _collect_pool_stats
+
+
+# === Annonces créées (comptées au commit) ===
+
+def register_listing_events(session):
+    """Compte les annonces insérées par l'ORM, une fois la transaction validée"""
+    from models import PropertyListing
+
+    @event.listens_for(session, 'after_flush')
+    def _count_new_listings(db_session, flush_context):
+        created = sum(1 for obj in db_session.new if isinstance(obj, PropertyListing))
+        if created:
+            db_session.info['metrics_listings_created'] = \
+                db_session.info.get('metrics_listings_created', 0) + created
+
+    @event.listens_for(session, 'after_commit')
+    def _record_new_listings(db_session):
+        created = db_session.info.pop('metrics_listings_created', 0)
+        if created:
+            listings_created.inc(created, source='web')
+
+    @event.listens_for(session, 'after_rollback')
+    def _discard_new_listings(db_session):
+        db_session.info.pop('metrics_listings_created', None)
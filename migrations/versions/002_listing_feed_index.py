@@ -0,0 +1,23 @@
+"""Index composite du flux d'annonces (created_at, id)
+
+Revision ID: 002
+Revises: 001
+Create Date: 2026-10-16 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '002'
+down_revision = '001'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Index utilisé par la pagination par curseur de la page d'accueil
+    op.create_index('ix_property_listing_created_at_id', 'property_listing',
+                    ['created_at', 'id'], unique=False)
+
+def downgrade():
+    op.drop_index('ix_property_listing_created_at_id', table_name='property_listing')
@@ -0,0 +1,26 @@
+"""Colonnes dénormalisées cover_url / has_video sur property_listing
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-16 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '003'
+down_revision = '002'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column('property_listing', sa.Column('cover_url', sa.Text(), nullable=True))
+    op.add_column('property_listing', sa.Column('has_video', sa.Boolean(), nullable=False,
+                                                server_default=sa.false()))
+    # Les lignes existantes sont remplies par 'flask listings backfill-covers'
+
+def downgrade():
+    with op.batch_alter_table('property_listing') as batch_op:
+        batch_op.drop_column('has_video')
+        batch_op.drop_column('cover_url')
@@ -0,0 +1,65 @@
+"""Recherche plein texte : tsvector + GIN (PostgreSQL), FTS5 (SQLite)
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-16 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '004'
+down_revision = '003'
+branch_labels = None
+depends_on = None
+
+SQLITE_FTS_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS property_listing_fts USING fts5(
+        title, description,
+        content='property_listing', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS property_listing_fts_ai AFTER INSERT ON property_listing BEGIN
+        INSERT INTO property_listing_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS property_listing_fts_ad AFTER DELETE ON property_listing BEGIN
+        INSERT INTO property_listing_fts(property_listing_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS property_listing_fts_au AFTER UPDATE OF title, description ON property_listing BEGIN
+        INSERT INTO property_listing_fts(property_listing_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO property_listing_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END""",
+    "INSERT INTO property_listing_fts(property_listing_fts) VALUES ('rebuild')",
+]
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+
+    if dialect == 'postgresql':
+        # Colonne générée : maintenue par PostgreSQL à chaque écriture
+        op.execute("""
+            ALTER TABLE property_listing ADD COLUMN search_vector tsvector
+            GENERATED ALWAYS AS (
+                setweight(to_tsvector('french', coalesce(title, '')), 'A') ||
+                setweight(to_tsvector('french', coalesce(description, '')), 'B')
+            ) STORED
+        """)
+        op.create_index('ix_property_listing_search_vector', 'property_listing',
+                        ['search_vector'], postgresql_using='gin')
+    elif dialect == 'sqlite':
+        for statement in SQLITE_FTS_DDL:
+            op.execute(statement)
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+
+    if dialect == 'postgresql':
+        op.drop_index('ix_property_listing_search_vector', table_name='property_listing')
+        op.drop_column('property_listing', 'search_vector')
+    elif dialect == 'sqlite':
+        for trigger in ('property_listing_fts_ai', 'property_listing_fts_ad', 'property_listing_fts_au'):
+            op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        op.execute("DROP TABLE IF EXISTS property_listing_fts")
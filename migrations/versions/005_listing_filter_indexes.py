@@ -0,0 +1,31 @@
+"""Index composites des filtres à facettes (type, prix, date)
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-16 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '005'
+down_revision = '004'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Flux filtré par type, trié par date
+    op.create_index('ix_property_listing_type_created_at_id', 'property_listing',
+                    ['property_type', 'created_at', 'id'], unique=False)
+    # Flux filtré par type, trié par prix + comptage des facettes (index couvrant)
+    op.create_index('ix_property_listing_type_price_id', 'property_listing',
+                    ['property_type', 'price', 'id'], unique=False)
+    # Flux tous types trié / filtré par prix
+    op.create_index('ix_property_listing_price_id', 'property_listing',
+                    ['price', 'id'], unique=False)
+
+def downgrade():
+    op.drop_index('ix_property_listing_price_id', table_name='property_listing')
+    op.drop_index('ix_property_listing_type_price_id', table_name='property_listing')
+    op.drop_index('ix_property_listing_type_created_at_id', table_name='property_listing')
@@ -0,0 +1,51 @@
+"""Upload asynchrone : statut des médias et table upload_job
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-16 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '006'
+down_revision = '005'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Un média en attente n'a pas encore d'URL ni d'identifiant Cloudinary
+    with op.batch_alter_table('media') as batch_op:
+        batch_op.add_column(sa.Column('status', sa.String(length=10), nullable=False,
+                                      server_default='ready'))
+        batch_op.alter_column('public_id', existing_type=sa.String(length=100), nullable=True)
+        batch_op.alter_column('url', existing_type=sa.Text(), nullable=True)
+
+    op.create_table('upload_job',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('media_id', sa.Integer(), nullable=True),
+    sa.Column('file_type', sa.String(length=10), nullable=False),
+    sa.Column('path', sa.Text(), nullable=False),
+    sa.Column('status', sa.String(length=10), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('next_attempt_at', sa.DateTime(), nullable=True),
+    sa.Column('locked_at', sa.DateTime(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['media_id'], ['media.id'], ondelete='SET NULL'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_upload_job_media_id'), 'upload_job', ['media_id'], unique=False)
+    op.create_index('ix_upload_job_status_next_attempt_at', 'upload_job',
+                    ['status', 'next_attempt_at'], unique=False)
+
+def downgrade():
+    op.drop_index('ix_upload_job_status_next_attempt_at', table_name='upload_job')
+    op.drop_index(op.f('ix_upload_job_media_id'), table_name='upload_job')
+    op.drop_table('upload_job')
+    op.execute("DELETE FROM media WHERE status <> 'ready'")
+    with op.batch_alter_table('media') as batch_op:
+        batch_op.alter_column('url', existing_type=sa.Text(), nullable=False)
+        batch_op.alter_column('public_id', existing_type=sa.String(length=100), nullable=False)
+        batch_op.drop_column('status')
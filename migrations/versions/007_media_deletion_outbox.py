@@ -0,0 +1,38 @@
+"""Outbox des suppressions Cloudinary (media_deletion)
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-16 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '007'
+down_revision = '006'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table('media_deletion',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('public_id', sa.String(length=200), nullable=False),
+    sa.Column('resource_type', sa.String(length=10), nullable=False),
+    sa.Column('status', sa.String(length=10), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('claimed_by', sa.String(length=32), nullable=True),
+    sa.Column('next_attempt_at', sa.DateTime(), nullable=True),
+    sa.Column('locked_at', sa.DateTime(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_media_deletion_claimed_by'), 'media_deletion', ['claimed_by'], unique=False)
+    op.create_index('ix_media_deletion_status_next_attempt_at', 'media_deletion',
+                    ['status', 'next_attempt_at'], unique=False)
+
+def downgrade():
+    op.drop_index('ix_media_deletion_status_next_attempt_at', table_name='media_deletion')
+    op.drop_index(op.f('ix_media_deletion_claimed_by'), table_name='media_deletion')
+    op.drop_table('media_deletion')
@@ -0,0 +1,36 @@
+"""Galerie ordonnée : position des médias et index (listing_id, file_type, position)
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-16 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '009'
+down_revision = '008'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    with op.batch_alter_table('media') as batch_op:
+        batch_op.add_column(sa.Column('position', sa.Integer(), nullable=False, server_default='0'))
+
+    # Ordre existant conservé : rang d'insertion au sein de chaque annonce et type
+    op.execute("""
+        UPDATE media SET position = (
+            SELECT COUNT(*) FROM media AS previous
+            WHERE previous.listing_id = media.listing_id
+              AND previous.file_type = media.file_type
+              AND previous.id < media.id
+        )
+    """)
+    op.create_index('ix_media_listing_type_position', 'media',
+                    ['listing_id', 'file_type', 'position'], unique=False)
+
+def downgrade():
+    op.drop_index('ix_media_listing_type_position', table_name='media')
+    with op.batch_alter_table('media') as batch_op:
+        batch_op.drop_column('position')
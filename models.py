@@ -4,11 +4,16 @@ Modèles de base de données pour l'application immobilière
 
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
-from werkzeug.security import check_password_hash
+from sqlalchemy import event, select, update, exists, false
+from sqlalchemy.orm import object_session
+from sqlalchemy.orm.attributes import set_committed_value
 from datetime import datetime, timezone
+from passwords import password_hasher
+from db_routing import RoutingSession
+from media_urls import variant_url, srcset
 
 # Instance de base de données
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 
 class User(UserMixin, db.Model):
@@ -28,7 +33,7 @@ class User(UserMixin, db.Model):
 
     def check_password(self, password):
         """Vérifie si le mot de passe fourni correspond au hash stocké"""
-        return check_password_hash(self.password, password)
+        return password_hasher.verify(self.password, password)
 
     def __repr__(self):
         return f"<User {self.username} ({'Admin' if self.is_admin else 'User'})>"
@@ -37,6 +42,14 @@ class User(UserMixin, db.Model):
 class PropertyListing(db.Model):
     """Modèle pour les annonces immobilières"""
     __tablename__ = 'property_listing'
+    __table_args__ = (
+        # Index du flux paginé par curseur (created_at, id)
+        db.Index('ix_property_listing_created_at_id', 'created_at', 'id'),
+        # Index des filtres à facettes (type, prix, tri)
+        db.Index('ix_property_listing_type_created_at_id', 'property_type', 'created_at', 'id'),
+        db.Index('ix_property_listing_type_price_id', 'property_type', 'price', 'id'),
+        db.Index('ix_property_listing_price_id', 'price', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)  # Augmenté pour plus de flexibilité
@@ -47,28 +60,61 @@ class PropertyListing(db.Model):
     updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), 
                           onupdate=lambda: datetime.now(timezone.utc))
     
+    # Colonnes dénormalisées, maintenues par les événements de Media
+    cover_url = db.Column(db.Text, nullable=True)  # URL de la première image
+    has_video = db.Column(db.Boolean, nullable=False, default=False, server_default=false())
+    
     # Clé étrangère
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
 
     # Relations
+    # Médias dans l'ordre de la galerie (position choisie par l'auteur)
     media = db.relationship('Media', backref='listing', lazy=True, 
-                           cascade="all, delete-orphan")
+                           cascade="all, delete-orphan",
+                           order_by='[Media.position, Media.id]')
+
+    def _first_media(self, file_type):
+        """
+        Premier média disponible d'un type : lu dans la collection si elle est déjà
+        chargée (triée par position), sinon par l'index (listing_id, file_type, position).
+        """
+        if 'media' not in db.inspect(self).unloaded:
+            return next((media_item for media_item in self.media
+                         if media_item.file_type == file_type and media_item.is_ready), None)
+        return db.session.scalars(first_media_query(self.id, file_type)).first()
 
     @property
     def main_image(self):
-        """Retourne la première image de l'annonce"""
-        for media_item in self.media:
-            if media_item.file_type == 'image':
-                return media_item
-        return None
+        """Retourne l'image de couverture (première image de la galerie)"""
+        if self.cover_url is None:
+            return None
+        return self._first_media('image')
 
     @property
     def video(self):
-        """Retourne la première vidéo de l'annonce"""
-        for media_item in self.media:
-            if media_item.file_type == 'video':
-                return media_item
-        return None
+        """Retourne la première vidéo disponible de l'annonce"""
+        if not self.has_video:
+            return None
+        return self._first_media('video')
+
+    @property
+    def ready_media(self):
+        """Médias déjà disponibles sur Cloudinary"""
+        return [media_item for media_item in self.media if media_item.is_ready]
+
+    @property
+    def has_pending_media(self):
+        """Au moins un média est encore en cours d'envoi"""
+        return any(media_item.status == 'pending' for media_item in self.media)
+
+    @property
+    def cover_card_url(self):
+        """Couverture redimensionnée pour les cartes du flux (sans charger les médias)"""
+        return variant_url(self.cover_url, 'card')
+
+    @property
+    def cover_card_srcset(self):
+        return srcset(self.cover_url, 'card')
 
     def __repr__(self):
         return f"<PropertyListing '{self.title}' by {self.author.username}>"
@@ -79,14 +125,227 @@ class Media(db.Model):
     __tablename__ = 'media'
 
     id = db.Column(db.Integer, primary_key=True)
-    public_id = db.Column(db.String(200), nullable=False)  # ID Cloudinary
-    url = db.Column(db.Text, nullable=False)  # URL complète
+    public_id = db.Column(db.String(200), nullable=True)  # ID Cloudinary (vide tant que l'upload est en attente)
+    url = db.Column(db.Text, nullable=True)  # URL complète (vide tant que l'upload est en attente)
     file_type = db.Column(db.String(10), nullable=False)  # 'image' ou 'video'
+    position = db.Column(db.Integer, nullable=False, default=0,
+                         server_default='0')  # Rang dans la galerie (0 = couverture)
+    status = db.Column(db.String(10), nullable=False, default='ready',
+                       server_default='ready')  # 'pending', 'ready' ou 'failed'
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
     
     # Clé étrangère
     listing_id = db.Column(db.Integer, db.ForeignKey('property_listing.id'), 
                           nullable=False, index=True)
 
+    # Couverture et galerie d'une annonce lues dans l'ordre de l'index
+    __table_args__ = (
+        db.Index('ix_media_listing_type_position', 'listing_id', 'file_type', 'position'),
+    )
+
+    @property
+    def is_ready(self):
+        """Le fichier est disponible sur Cloudinary"""
+        return self.status == 'ready'
+
+    # URLs transformées (voir media_urls.VARIANTS) ; pour une vidéo, image extraite
+    @property
+    def thumb_url(self):
+        return variant_url(self.url, 'thumb')
+
+    @property
+    def card_url(self):
+        return variant_url(self.url, 'card')
+
+    @property
+    def detail_url(self):
+        return variant_url(self.url, 'detail')
+
+    @property
+    def full_url(self):
+        return variant_url(self.url, 'full')
+
+    @property
+    def detail_srcset(self):
+        return srcset(self.url, 'detail')
+
+    def __repr__(self):
+        return f"<Media {self.file_type}: {self.public_id} ({self.status})>"
+
+
+class UploadJob(db.Model):
+    """Tâche d'upload différé d'un média vers Cloudinary"""
+    __tablename__ = 'upload_job'
+    __table_args__ = (
+        # Sélection des tâches à exécuter par le planificateur
+        db.Index('ix_upload_job_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    media_id = db.Column(db.Integer, db.ForeignKey('media.id', ondelete='SET NULL'),
+                         nullable=True, index=True)
+    file_type = db.Column(db.String(10), nullable=False)  # 'image' ou 'video'
+    path = db.Column(db.Text, nullable=False)  # Fichier local en attente d'envoi
+    status = db.Column(db.String(10), nullable=False, default='pending')  # pending/running/done/failed/cancelled
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text, nullable=True)
+    next_attempt_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    locked_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+    def __repr__(self):
+        return f"<UploadJob #{self.id} {self.file_type} {self.status} ({self.attempts} essai(s))>"
+
+
+
+class MediaDeletion(db.Model):
+    """Outbox des fichiers Cloudinary à supprimer (hors du cycle de requête)"""
+    __tablename__ = 'media_deletion'
+    __table_args__ = (
+        db.Index('ix_media_deletion_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    public_id = db.Column(db.String(200), nullable=False)
+    resource_type = db.Column(db.String(10), nullable=False, default='image')
+    status = db.Column(db.String(10), nullable=False, default='pending')  # pending/running/done/failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text, nullable=True)
+    claimed_by = db.Column(db.String(32), nullable=True, index=True)
+    next_attempt_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    locked_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
     def __repr__(self):
-        return f"<Media {self.file_type}: {self.public_id}>"
\ No newline at end of file
+        return f"<MediaDeletion {self.resource_type}: {self.public_id} ({self.status})>"
+
+
+class StatsSnapshot(db.Model):
+    """Instantané d'agrégats coûteux (tableau de bord admin), recalculé périodiquement"""
+    __tablename__ = 'stats_snapshot'
+
+    key = db.Column(db.String(50), primary_key=True)
+    payload = db.Column(db.Text, nullable=False)  # JSON
+    computed_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+
+    def __repr__(self):
+        return f"<StatsSnapshot {self.key} ({self.computed_at})>"
+
+# === Maintenance de cover_url / has_video ===
+
+def first_media_query(listing_id, file_type, columns=(Media,)):
+    """Premier média disponible d'un type (parcours de ix_media_listing_type_position)"""
+    return (
+        select(*columns)
+        .where(Media.listing_id == listing_id, Media.file_type == file_type, Media.status == 'ready')
+        .order_by(Media.position, Media.id)
+        .limit(1)
+    )
+
+
+def next_media_positions(listing_id):
+    """
+    Positions libres à la suite de la galerie d'une annonce (une seule requête groupée).
+
+    :return: Dict {file_type: position}
+    """
+    rows = db.session.execute(
+        select(Media.file_type, db.func.max(Media.position))
+        .where(Media.listing_id == listing_id)
+        .group_by(Media.file_type)
+    ).all()
+    positions = {'image': 0, 'video': 0}
+    positions.update({file_type: last + 1 for file_type, last in rows})
+    return positions
+
+
+def media_summary(connection, listing_id):
+    """
+    Calcule la couverture et la présence de vidéo d'une annonce.
+
+    :return: Tuple (cover_url, has_video)
+    """
+    cover_url = connection.execute(first_media_query(listing_id, 'image', (Media.url,))).scalar()
+    has_video = connection.execute(
+        select(exists().where(Media.listing_id == listing_id, Media.file_type == 'video',
+                              Media.status == 'ready'))
+    ).scalar()
+    return cover_url, bool(has_video)
+
+
+def _sync_listing_media_summary(connection, session, listing_id):
+    """Recalcule les colonnes dénormalisées de l'annonce d'un média"""
+    if listing_id is None:
+        return
+
+    listing = None
+    if session is not None:
+        key = PropertyListing.__mapper__.identity_key_from_primary_key((listing_id,))
+        listing = session.identity_map.get(key)
+        # L'annonce elle-même est en cours de suppression : rien à maintenir
+        if listing is not None and listing in session.deleted:
+            return
+
+    cover_url, has_video = media_summary(connection, listing_id)
+    # updated_at suit aussi les médias : il sert de validateur HTTP à la page de détail
+    updated_at = datetime.now(timezone.utc)
+    connection.execute(
+        update(PropertyListing.__table__)
+        .where(PropertyListing.__table__.c.id == listing_id)
+        .values(cover_url=cover_url, has_video=has_video, updated_at=updated_at)
+    )
+
+    # Garder l'objet en mémoire cohérent sans le marquer comme modifié
+    if listing is not None:
+        set_committed_value(listing, 'cover_url', cover_url)
+        set_committed_value(listing, 'has_video', has_video)
+        set_committed_value(listing, 'updated_at', updated_at)
+
+
+def sync_media_summary(session, listing_id):
+    """
+    Recalcule cover_url et has_video après une mise à jour groupée des médias
+    (les requêtes UPDATE/DELETE en masse ne déclenchent pas les événements ci-dessous).
+    """
+    _sync_listing_media_summary(session.connection(), session, listing_id)
+
+
+@event.listens_for(Media, 'after_insert')
+def _media_after_insert(mapper, connection, target):
+    _sync_listing_media_summary(connection, object_session(target), target.listing_id)
+
+
+@event.listens_for(Media, 'after_delete')
+def _media_after_delete(mapper, connection, target):
+    _sync_listing_media_summary(connection, object_session(target), target.listing_id)
+
+
+@event.listens_for(Media, 'after_update')
+def _media_after_update(mapper, connection, target):
+    history = db.inspect(target).attrs.listing_id.history
+    # Média déplacé vers une autre annonce : mettre à jour l'ancienne aussi
+    for old_listing_id in history.deleted or ():
+        _sync_listing_media_summary(connection, object_session(target), old_listing_id)
+    _sync_listing_media_summary(connection, object_session(target), target.listing_id)
+
+
+def backfill_media_summaries(connection):
+    """
+    Recalcule cover_url et has_video pour toutes les annonces en une seule requête.
+
+    :return: Nombre de lignes mises à jour
+    """
+    listing = PropertyListing.__table__
+    media = Media.__table__
+    cover = (
+        select(media.c.url)
+        .where(media.c.listing_id == listing.c.id, media.c.file_type == 'image',
+               media.c.status == 'ready')
+        .order_by(media.c.position, media.c.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    video = exists().where(media.c.listing_id == listing.c.id, media.c.file_type == 'video',
+                           media.c.status == 'ready')
+    result = connection.execute(update(listing).values(cover_url=cover, has_video=video))
+    return result.rowcount
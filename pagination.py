@@ -0,0 +1,178 @@
+"""
+Pagination par curseur (keyset) pour les flux d'annonces.
+Le tri est fait sur un tuple de colonnes terminé par id, (created_at, id) par défaut :
+une page profonde coûte autant que la première et l'ordre reste stable malgré
+les insertions concurrentes.
+"""
+
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+# Bornes de la taille de page
+DEFAULT_PER_PAGE = 24
+MAX_PER_PAGE = 100
+
+# Clé de tri par défaut du flux
+DEFAULT_KEYS = ('created_at', 'id')
+
+
+class InvalidCursor(ValueError):
+    """Curseur illisible ou falsifié"""
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    return value
+
+
+def _decode_value(value, python_type=None):
+    """Valeur décodée, vérifiée contre le type Python de sa colonne (si connu)"""
+    if isinstance(value, dict):
+        value = datetime.fromisoformat(value['dt'])
+    if python_type is None:
+        return value
+    if python_type is float and isinstance(value, int):
+        value = float(value)
+    # bool est une sous-classe d'int : refusé explicitement pour les colonnes entières
+    if not isinstance(value, python_type) or (python_type is not bool and isinstance(value, bool)):
+        raise TypeError(f"valeur {value!r} incompatible avec {python_type.__name__}")
+    return value
+
+
+def _python_type(column):
+    try:
+        return column.type.python_type
+    except NotImplementedError:
+        return None
+
+
+def encode_cursor(*values):
+    """
+    Encode une position (valeurs des colonnes de tri) en curseur opaque.
+
+    :param values: Valeurs de la clé de tri, ex. (created_at, id)
+    :return: Chaîne base64 utilisable dans une URL
+    """
+    payload = json.dumps([_encode_value(v) for v in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, size=len(DEFAULT_KEYS), types=None):
+    """
+    Décode un curseur opaque.
+
+    :param cursor: Chaîne produite par encode_cursor
+    :param size: Nombre de valeurs attendues
+    :param types: Types Python attendus pour chaque valeur (ex. (datetime, int)), sinon non vérifiés
+    :return: Tuple des valeurs de la clé de tri
+    :raises InvalidCursor: si le curseur est invalide
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if not isinstance(values, list) or len(values) != size:
+            raise ValueError("taille inattendue")
+        types = types or (None,) * size
+        return tuple(_decode_value(v, t) for v, t in zip(values, types))
+    except (ValueError, TypeError, KeyError, UnicodeError) as e:
+        raise InvalidCursor(f"Curseur invalide : {cursor!r}") from e
+
+
+def clamp_per_page(value, default=DEFAULT_PER_PAGE):
+    """Ramène une taille de page demandée dans les bornes autorisées"""
+    if not value or value < 1:
+        return default
+    return min(value, MAX_PER_PAGE)
+
+
+class KeysetPage:
+    """Une page de résultats avec ses curseurs de navigation"""
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None, per_page=DEFAULT_PER_PAGE):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.per_page = per_page
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+
+def paginate_keyset(query, model, after=None, before=None, per_page=DEFAULT_PER_PAGE,
+                    keys=DEFAULT_KEYS, descending=True):
+    """
+    Pagine une requête selon une clé de tri composite.
+
+    :param query: Requête SQLAlchemy (filtres déjà appliqués, sans order_by)
+    :param model: Modèle portant les colonnes de la clé
+    :param after: Curseur « page suivante »
+    :param before: Curseur « page précédente »
+    :param per_page: Nombre d'éléments par page
+    :param keys: Noms des colonnes de tri, le dernier doit être unique (id)
+    :param descending: Sens du flux (décroissant par défaut)
+    :return: KeysetPage
+    :raises InvalidCursor: si un curseur est invalide
+    """
+    columns = [getattr(model, name) for name in keys]
+    key = tuple_(*columns)
+    # Un curseur forgé ne doit pas atteindre la base avec des valeurs du mauvais type
+    types = tuple(_python_type(column) for column in columns)
+
+    def forward(q):
+        return q.order_by(*[c.desc() if descending else c.asc() for c in columns])
+
+    def backward(q):
+        return q.order_by(*[c.asc() if descending else c.desc() for c in columns])
+
+    def after_position(cursor):
+        position = tuple_(*decode_cursor(cursor, len(keys), types))
+        return key < position if descending else key > position
+
+    def before_position(cursor):
+        position = tuple_(*decode_cursor(cursor, len(keys), types))
+        return key > position if descending else key < position
+
+    if before:
+        # Remonter vers le début du flux, puis remettre dans l'ordre d'affichage
+        rows = backward(query.filter(before_position(before))).limit(per_page + 1).all()
+        has_more = len(rows) > per_page
+        items = list(reversed(rows[:per_page]))
+        has_newer, has_older = has_more, True
+    else:
+        if after:
+            query = query.filter(after_position(after))
+        rows = forward(query).limit(per_page + 1).all()
+        items = rows[:per_page]
+        has_newer, has_older = bool(after), len(rows) > per_page
+
+    if not items:
+        return KeysetPage([], per_page=per_page)
+
+    def cursor_for(item):
+        return encode_cursor(*[getattr(item, name) for name in keys])
+
+    first, last = items[0], items[-1]
+    return KeysetPage(
+        items,
+        next_cursor=cursor_for(last) if has_older else None,
+        prev_cursor=cursor_for(first) if has_newer else None,
+        per_page=per_page
+    )
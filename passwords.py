@@ -0,0 +1,238 @@
+"""
+Politique de hachage des mots de passe.
+L'algorithme (scrypt ou pbkdf2, via Werkzeug) et son coût sont configurables ;
+sans coût imposé, un court banc d'essai (lancé en arrière-plan au démarrage)
+choisit, sans descendre sous le coût par défaut, le coût le plus élevé qui tient
+dans le budget de latence (PASSWORD_HASH_TARGET_MS) et, pour scrypt, dans le
+budget mémoire des hachages simultanés (PASSWORD_HASH_MAX_MEMORY). Les hachages
+s'exécutent dans un petit pool de threads borné : une rafale de connexions attend son tour
+au lieu de saturer le worker, et les hash plus faibles que la politique (autre
+algorithme, coût inférieur) sont recalculés à la connexion suivante.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+logger = logging.getLogger(__name__)
+
+# Coût par algorithme : (minimum de sécurité, valeur par défaut, maximum)
+# scrypt : log2(N) avec r=8, p=1 ; pbkdf2 : nombre d'itérations SHA-256
+COST_BOUNDS = {
+    'scrypt': (14, 15, 17),
+    'pbkdf2': (200_000, 600_000, 2_000_000),
+}
+
+BENCHMARK_PASSWORD = 'benchmark-password'
+
+# Mémoire d'un hachage scrypt : 128 * r * N octets (r = 8)
+SCRYPT_BLOCK_BYTES = 128 * 8
+
+
+class HashingBusy(RuntimeError):
+    """Trop de hachages en attente : la requête doit être refusée (503)"""
+
+
+def method_for(algorithm, cost):
+    """Chaîne de méthode Werkzeug pour un algorithme et un coût"""
+    if algorithm == 'scrypt':
+        return f"scrypt:{2 ** cost}:8:1"
+    if algorithm == 'pbkdf2':
+        return f"pbkdf2:sha256:{cost}"
+    raise ValueError(f"Algorithme de hachage inconnu : {algorithm}")
+
+
+def stored_method(password_hash):
+    """Paramètres d'un hash stocké (partie avant le premier '$')"""
+    return password_hash.split('$', 1)[0] if password_hash else ''
+
+
+def stored_cost(password_hash):
+    """
+    Algorithme et coût d'un hash stocké, dans les unités de COST_BOUNDS.
+
+    :return: Tuple (algorithme, coût), ou (None, None) si le format n'est pas reconnu
+    """
+    parts = stored_method(password_hash).split(':')
+    try:
+        if parts[0] == 'scrypt' and len(parts) >= 2:
+            return 'scrypt', int(parts[1]).bit_length() - 1
+        if parts[0] == 'pbkdf2' and len(parts) >= 3:
+            return 'pbkdf2', int(parts[2])
+    except ValueError:
+        pass
+    return None, None
+
+
+def scrypt_memory(cost):
+    """Mémoire utilisée par un hachage scrypt de coût donné (octets)"""
+    return SCRYPT_BLOCK_BYTES * 2 ** cost
+
+
+def max_cost_for_memory(algorithm, max_memory, workers):
+    """
+    Coût maximal tel que workers hachages simultanés tiennent dans max_memory octets
+    (jamais sous le minimum de sécurité ; sans objet pour pbkdf2).
+    """
+    minimum, _, maximum = COST_BOUNDS[algorithm]
+    if algorithm != 'scrypt' or not max_memory:
+        return maximum
+    cost = maximum
+    while cost > minimum and scrypt_memory(cost) * workers > max_memory:
+        cost -= 1
+    return cost
+
+
+def benchmark_cost(algorithm, target_ms, max_cost=None):
+    """
+    Mesure le coût le plus élevé qui reste sous le budget de latence.
+
+    :param max_cost: Plafond supplémentaire (budget mémoire), sinon le maximum de COST_BOUNDS
+    :return: Tuple (coût retenu, durée mesurée en ms)
+    """
+    minimum, _, maximum = COST_BOUNDS[algorithm]
+    if max_cost is not None:
+        maximum = max(minimum, min(maximum, max_cost))
+
+    def measure(cost):
+        start = time.perf_counter()
+        generate_password_hash(BENCHMARK_PASSWORD, method=method_for(algorithm, cost))
+        return (time.perf_counter() - start) * 1000
+
+    if algorithm == 'scrypt':
+        # Chaque cran double le temps (et la mémoire) : on monte tant que le budget tient
+        cost, elapsed = minimum, measure(minimum)
+        while cost < maximum:
+            candidate = measure(cost + 1)
+            if candidate > target_ms:
+                break
+            cost, elapsed = cost + 1, candidate
+        return cost, elapsed
+
+    # pbkdf2 : temps linéaire en nombre d'itérations, une mesure suffit
+    elapsed = measure(minimum)
+    cost = int(minimum * target_ms / max(elapsed, 0.001)) // 10_000 * 10_000
+    cost = max(minimum, min(cost, maximum))
+    return cost, elapsed * cost / minimum
+
+
+class PasswordHasher:
+    """Extension Flask : hachage et vérification des mots de passe selon la politique"""
+
+    def __init__(self, app=None):
+        self.algorithm = 'scrypt'
+        self.cost = None
+        self.max_cost = COST_BOUNDS['scrypt'][2]
+        self._executor = None
+        self._slots = None
+        self._benchmark_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.algorithm = app.config.get('PASSWORD_HASH_ALGORITHM', 'scrypt')
+        if self.algorithm not in COST_BOUNDS:
+            raise ValueError(f"Algorithme de hachage inconnu : {self.algorithm}")
+        self.cost = app.config.get('PASSWORD_HASH_COST')
+        self.target_ms = app.config.get('PASSWORD_HASH_TARGET_MS', 250)
+        self.benchmark = app.config.get('PASSWORD_HASH_BENCHMARK', True)
+        self.queue_timeout = app.config.get('PASSWORD_HASH_QUEUE_TIMEOUT', 10)
+
+        workers = app.config.get('PASSWORD_HASH_WORKERS', 2)
+        queue_size = app.config.get('PASSWORD_HASH_QUEUE_SIZE', 8)
+        # Plafond mémoire : les workers peuvent hacher en même temps
+        self.max_cost = max_cost_for_memory(self.algorithm,
+                                            app.config.get('PASSWORD_HASH_MAX_MEMORY'), workers)
+        if self.cost is not None and self.algorithm == 'scrypt' and self.cost > self.max_cost:
+            logger.warning(f"PASSWORD_HASH_COST={self.cost} dépasse le budget mémoire "
+                           f"({workers} × {scrypt_memory(self.cost) // 1_048_576} Mo)")
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        # En cours + en attente : au-delà, les nouvelles demandes patientent puis échouent
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        app.extensions['password_hasher'] = self
+
+        if self.cost is None and self.benchmark:
+            # Banc d'essai au démarrage, hors du chemin de la première connexion
+            threading.Thread(target=self.warm_up, name='password-hash-benchmark', daemon=True).start()
+
+    def warm_up(self):
+        """Choisit le coût si ce n'est pas déjà fait (les appels concurrents l'attendent)"""
+        try:
+            self.current_cost
+        except Exception as e:
+            logger.error(f"Banc d'essai du hachage impossible : {e}", exc_info=True)
+
+    @property
+    def current_cost(self):
+        """Coût courant (attend le banc d'essai s'il est en cours, le lance si nécessaire)"""
+        if self.cost is None:
+            with self._benchmark_lock:
+                if self.cost is None:
+                    self.cost = self._choose_cost()
+        return self.cost
+
+    @property
+    def method(self):
+        """Méthode Werkzeug courante"""
+        return method_for(self.algorithm, self.current_cost)
+
+    def _choose_cost(self):
+        minimum, default, _ = COST_BOUNDS[self.algorithm]
+        # Plancher : le coût par défaut (dans la limite du budget mémoire). Le banc d'essai
+        # ne peut que l'augmenter, il ne descend pas selon la charge du moment.
+        floor = min(default, self.max_cost)
+        if not self.benchmark:
+            return floor
+        cost, elapsed = benchmark_cost(self.algorithm, self.target_ms, self.max_cost)
+        if cost < floor:
+            logger.warning(f"Hachage {self.algorithm} : coût {floor} conservé, au-dessus du budget "
+                           f"de {self.target_ms} ms (coût {cost} mesuré à {elapsed:.0f} ms)")
+            return floor
+        if cost == minimum and elapsed > self.target_ms:
+            logger.warning(f"Hachage {self.algorithm} : le coût minimal ({minimum}) dépasse "
+                           f"le budget de {self.target_ms} ms ({elapsed:.0f} ms)")
+        logger.info(f"Hachage des mots de passe : {self.algorithm}, coût {cost} (~{elapsed:.0f} ms)")
+        return cost
+
+    def _run(self, func, *args):
+        """Exécute un calcul dans le pool borné"""
+        if self._executor is None:
+            return func(*args)
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise HashingBusy("File de hachage saturée")
+        try:
+            return self._executor.submit(func, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        """Hache un mot de passe avec les paramètres courants"""
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        """Vérifie un mot de passe contre le hash stocké (quels que soient ses paramètres)"""
+        if not password_hash:
+            return False
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """
+        Le hash stocké est-il plus faible que la politique courante ? Autre algorithme ou
+        coût inférieur seulement : un hash plus coûteux n'est jamais affaibli, et deux
+        workers calibrés différemment ne le font pas osciller.
+        """
+        algorithm, cost = stored_cost(password_hash)
+        if algorithm != self.algorithm:
+            return True
+        return cost < self.current_cost
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+
+# Instance partagée, initialisée dans create_app()
+password_hasher = PasswordHasher()
@@ -0,0 +1,256 @@
+"""
+Instrumentation des requêtes (optionnelle, PROFILING_ENABLED).
+Pour chaque requête : temps passé en base (et nombre de requêtes SQL), rendu
+des templates et appels Cloudinary, renvoyés dans l'en-tête Server-Timing.
+Les requêtes SQL lentes sont journalisées avec leurs paramètres, et les
+latences sont agrégées par endpoint dans des histogrammes en mémoire
+(p50/p95/p99 sur /admin/perf).
+"""
+
+import logging
+import math
+import threading
+import time
+from functools import wraps
+
+from flask import g, has_request_context, request, template_rendered, before_render_template
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# Histogramme logarithmique : chaque seau couvre +10 %, de 0,1 ms à ~10 min
+BUCKET_GROWTH = 1.1
+BUCKET_BASE_MS = 0.1
+
+# Longueur maximale des paramètres SQL journalisés
+MAX_LOGGED_PARAMS = 500
+
+
+class LatencyHistogram:
+    """Histogramme de latences à seaux logarithmiques (erreur relative < 10 %)"""
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    @staticmethod
+    def bucket_index(value_ms):
+        if value_ms <= BUCKET_BASE_MS:
+            return 0
+        return int(math.log(value_ms / BUCKET_BASE_MS, BUCKET_GROWTH)) + 1
+
+    @staticmethod
+    def bucket_upper_bound(index):
+        return BUCKET_BASE_MS * BUCKET_GROWTH ** index
+
+    def add(self, value_ms):
+        index = self.bucket_index(value_ms)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += value_ms
+        self.max = max(self.max, value_ms)
+
+    def percentile(self, fraction):
+        """Borne supérieure du seau contenant le percentile demandé (0 < fraction <= 1)"""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(fraction * self.count))
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(self.bucket_upper_bound(index), self.max)
+        return self.max
+
+
+class EndpointStats:
+    """Latence totale et ventilation par composant pour un endpoint"""
+
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.db_ms = 0.0
+        self.db_queries = 0
+        self.template_ms = 0.0
+        self.cloudinary_ms = 0.0
+        self.errors = 0
+
+    def summary(self):
+        count = self.latency.count or 1
+        return {
+            'count': self.latency.count,
+            'errors': self.errors,
+            'avg_ms': round(self.latency.total / count, 2),
+            'p50_ms': round(self.latency.percentile(0.50), 2),
+            'p95_ms': round(self.latency.percentile(0.95), 2),
+            'p99_ms': round(self.latency.percentile(0.99), 2),
+            'max_ms': round(self.latency.max, 2),
+            'db_ms_avg': round(self.db_ms / count, 2),
+            'queries_avg': round(self.db_queries / count, 1),
+            'template_ms_avg': round(self.template_ms / count, 2),
+            'cloudinary_ms_avg': round(self.cloudinary_ms / count, 2),
+        }
+
+
+class RequestProfiler:
+    """Extension Flask : mesure des requêtes et agrégation par endpoint"""
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.endpoints = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app, engines=()):
+        """
+        :param engines: Moteurs SQLAlchemy à instrumenter (primaire, réplica...)
+        """
+        self.enabled = app.config.get('PROFILING_ENABLED', False)
+        self.slow_query_ms = app.config.get('PROFILING_SLOW_QUERY_MS', 200)
+        self.server_timing = app.config.get('PROFILING_SERVER_TIMING', True)
+        app.extensions['request_profiler'] = self
+        if not self.enabled:
+            return
+
+        for engine in engines:
+            event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+            event.listen(engine, 'handle_error', self._handle_error)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.logger.info(f"⏱️ Instrumentation activée (requêtes lentes > {self.slow_query_ms} ms)")
+
+    # === Mesures ===
+
+    @staticmethod
+    def _current():
+        """Compteurs de la requête en cours, ou None hors requête"""
+        if not has_request_context():
+            return None
+        return g.get('_perf')
+
+    def _start_request(self):
+        g._perf = {
+            'start': time.perf_counter(),
+            'db_ms': 0.0,
+            'db_queries': 0,
+            'template_ms': 0.0,
+            'templates': [],
+            'cloudinary_ms': 0.0,
+            'cloudinary_depth': 0,
+        }
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('_query_start', []).append(time.perf_counter())
+        if context is not None:
+            context._perf_started = True
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('_query_start')
+        if not starts:
+            return
+        elapsed_ms = (time.perf_counter() - starts.pop()) * 1000
+
+        perf = self._current()
+        if perf is not None:
+            perf['db_ms'] += elapsed_ms
+            perf['db_queries'] += 1
+
+        if elapsed_ms >= self.slow_query_ms:
+            if 'password' in statement.lower():
+                logged_params = '<masqués>'
+            else:
+                logged_params = repr(parameters)
+                if len(logged_params) > MAX_LOGGED_PARAMS:
+                    logged_params = logged_params[:MAX_LOGGED_PARAMS] + '…'
+            endpoint = request.endpoint if has_request_context() else 'hors requête'
+            logger.warning(f"Requête SQL lente ({elapsed_ms:.1f} ms, {endpoint}) : "
+                           f"{' '.join(statement.split())} | paramètres : {logged_params}")
+
+    def _handle_error(self, context):
+        """Requête en échec : retirer son heure de début, sinon les suivantes seraient décalées"""
+        execution = context.execution_context
+        if context.connection is None or not getattr(execution, '_perf_started', False):
+            return
+        starts = context.connection.info.get('_query_start')
+        if starts:
+            starts.pop()
+
+    def _before_render(self, sender, template, context, **extra):
+        perf = self._current()
+        if perf is not None:
+            perf['templates'].append(time.perf_counter())
+
+    def _after_render(self, sender, template, context, **extra):
+        perf = self._current()
+        if perf is not None and perf['templates']:
+            perf['template_ms'] += (time.perf_counter() - perf['templates'].pop()) * 1000
+
+    def track_external(self, func):
+        """
+        Décorateur : temps passé dans un appel Cloudinary (appels imbriqués comptés une fois).
+        Les appels faits depuis les threads d'arrière-plan ne sont pas attribués à une requête.
+        """
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            perf = self._current() if self.enabled else None
+            if perf is None:
+                return func(*args, **kwargs)
+            perf['cloudinary_depth'] += 1
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                perf['cloudinary_depth'] -= 1
+                if perf['cloudinary_depth'] == 0:
+                    perf['cloudinary_ms'] += (time.perf_counter() - start) * 1000
+        return wrapper
+
+    def _finish_request(self, response):
+        perf = g.pop('_perf', None)
+        if perf is None or request.endpoint == 'static':
+            return response
+        total_ms = (time.perf_counter() - perf['start']) * 1000
+        endpoint = request.endpoint or f"<{response.status_code}>"
+
+        with self._lock:
+            stats = self.endpoints.get(endpoint)
+            if stats is None:
+                stats = self.endpoints[endpoint] = EndpointStats()
+            stats.latency.add(total_ms)
+            stats.db_ms += perf['db_ms']
+            stats.db_queries += perf['db_queries']
+            stats.template_ms += perf['template_ms']
+            stats.cloudinary_ms += perf['cloudinary_ms']
+            if response.status_code >= 500:
+                stats.errors += 1
+
+        if self.server_timing:
+            metrics = [
+                f'db;dur={perf["db_ms"]:.1f};desc="{perf["db_queries"]} SQL"',
+                f'tpl;dur={perf["template_ms"]:.1f}',
+            ]
+            if perf['cloudinary_ms']:
+                metrics.append(f'cdn;dur={perf["cloudinary_ms"]:.1f}')
+            metrics.append(f'total;dur={total_ms:.1f}')
+            response.headers.add('Server-Timing', ', '.join(metrics))
+        return response
+
+    def summary(self):
+        """Statistiques par endpoint, triées par latence p95 décroissante"""
+        with self._lock:
+            rows = [dict(endpoint=endpoint, **stats.summary())
+                    for endpoint, stats in self.endpoints.items()]
+        return sorted(rows, key=lambda row: row['p95_ms'], reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self.endpoints.clear()
+
+
+# Instance partagée, initialisée dans create_app()
+profiler = RequestProfiler()
@@ -0,0 +1,92 @@
+"""
+Profils de chargement des relations (eager loading) pour les requêtes d'annonces.
+Chaque vue déclare le profil dont elle a besoin au lieu de laisser les templates
+déclencher un chargement paresseux (N+1) par carte ou par ligne.
+"""
+
+import logging
+
+from flask import has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.orm import selectinload, joinedload
+
+from models import PropertyListing
+
+logger = logging.getLogger(__name__)
+
+
+class LazyLoadError(RuntimeError):
+    """Chargement paresseux déclenché pendant une requête HTTP"""
+
+
+# Profils nommés : chaque entrée retourne la liste des options de chargement
+LOADER_PROFILES = {
+    # Carte du flux : la couverture est dénormalisée (cover_url), seul l'auteur est joint
+    'card': lambda: [
+        joinedload(PropertyListing.author),
+    ],
+    # Page de détail : tous les médias + coordonnées de l'auteur
+    'detail': lambda: [
+        selectinload(PropertyListing.media),
+        joinedload(PropertyListing.author),
+    ],
+    # Ligne d'un tableau d'administration : auteur uniquement
+    'admin_row': lambda: [
+        joinedload(PropertyListing.author),
+    ],
+    # Export complet : compatible avec yield_per (selectinload par lot, auteur joint)
+    'export': lambda: [
+        selectinload(PropertyListing.media),
+        joinedload(PropertyListing.author),
+    ],
+}
+
+
+def loader_options(profile):
+    """
+    Retourne les options SQLAlchemy d'un profil.
+
+    :param profile: Nom du profil ('card', 'detail', 'admin_row', 'export')
+    :return: Liste d'options utilisables avec Query.options()
+    """
+    try:
+        return LOADER_PROFILES[profile]()
+    except KeyError:
+        raise ValueError(f"Profil de chargement inconnu : {profile}") from None
+
+
+def with_profile(query, profile):
+    """Applique un profil de chargement à une requête"""
+    return query.options(*loader_options(profile))
+
+
+def register_lazy_load_guard(app, session):
+    """
+    Surveille les chargements paresseux déclenchés pendant une requête HTTP.
+
+    Le comportement est piloté par LAZY_LOAD_GUARD :
+    'log' journalise un avertissement, 'raise' lève LazyLoadError,
+    toute autre valeur désactive la surveillance.
+    """
+    mode = app.config.get('LAZY_LOAD_GUARD')
+    if mode not in ('log', 'raise'):
+        return
+
+    @event.listens_for(session, 'do_orm_execute')
+    def _guard_lazy_load(orm_execute_state):
+        # lazy_loaded_from n'est renseigné que pour les chargements paresseux,
+        # pas pour selectinload/joinedload
+        if not orm_execute_state.is_select or not has_request_context():
+            return
+        if orm_execute_state.lazy_loaded_from is None:
+            return
+
+        instance = orm_execute_state.lazy_loaded_from
+        message = (f"Chargement paresseux sur {instance.class_.__name__} "
+                   f"#{instance.identity[0] if instance.identity else '?'} "
+                   f"pendant {request.endpoint}")
+        if mode == 'raise':
+            raise LazyLoadError(message)
+        logger.warning(message)
+
+    app.logger.info(f"🔍 Surveillance des chargements paresseux activée ({mode})")
@@ -0,0 +1,234 @@
+"""
+Limitation de débit des routes sensibles (connexion, inscription).
+Compteurs à fenêtre glissante (approximation par deux fenêtres fixes pondérées),
+indexés par adresse IP et par nom d'utilisateur. Deux stockages : dictionnaire
+en mémoire (par worker) ou fichiers verrouillés partagés entre les workers
+gunicorn (RATE_LIMIT_DIR, idéalement sous /dev/shm).
+Le décorateur refuse la requête (429) avant toute lecture en base ou tout hachage.
+"""
+
+import fcntl
+import hashlib
+import logging
+import math
+import os
+import random
+import re
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import request, current_app
+from werkzeug.exceptions import TooManyRequests
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+LIMIT_PATTERN = re.compile(r'^\s*(\d+)\s*/\s*(\d*)\s*(second|minute|hour|day)?s?\s*$')
+
+
+def parse_limit(value):
+    """
+    Convertit une limite textuelle en (nombre, fenêtre en secondes).
+
+    Formats acceptés : '10/minute', '5/15minutes', '100/3600' (secondes).
+    """
+    match = LIMIT_PATTERN.match(value.lower())
+    if not match:
+        raise ValueError(f"Limite de débit invalide : {value}")
+    count, multiplier, unit = match.groups()
+    if not unit:
+        if not multiplier:
+            raise ValueError(f"Limite de débit invalide : {value}")
+        return int(count), int(multiplier)
+    return int(count), int(multiplier or 1) * PERIODS[unit]
+
+
+def slide(state, now, limit, window):
+    """
+    Applique une tentative à l'état (index de fenêtre, compte précédent, compte courant).
+
+    :return: Tuple (nouvel état, autorisé, délai avant nouvel essai en secondes)
+    """
+    index = int(now // window)
+    last_index, previous, current = state
+    if last_index == index - 1:
+        previous, current = current, 0
+    elif last_index != index:
+        previous, current = 0, 0
+
+    elapsed = now - index * window
+    weight = (window - elapsed) / window
+    if previous * weight + current + 1 <= limit:
+        return (index, previous, current + 1), True, 0
+
+    # Refus : délai jusqu'à ce que la part de la fenêtre précédente ait assez décru
+    if current + 1 > limit or previous == 0:
+        retry_after = window - elapsed
+    else:
+        needed_weight = (limit - 1 - current) / previous
+        retry_after = (1 - needed_weight) * window - elapsed
+    return (index, previous, current), False, max(1, math.ceil(retry_after))
+
+
+class MemoryStore:
+    """Compteurs en mémoire (par worker), bornés en nombre de clés"""
+
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key, limit, window, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            state = self._states.get(key, (0, 0, 0))
+            state, allowed, retry_after = slide(state, now, limit, window)
+            self._states[key] = state
+            self._states.move_to_end(key)
+            while len(self._states) > self.max_keys:
+                self._states.popitem(last=False)
+        return allowed, retry_after
+
+    def reset(self, key=None):
+        with self._lock:
+            if key is None:
+                self._states.clear()
+            else:
+                self._states.pop(key, None)
+
+
+class FileSystemStore:
+    """Compteurs dans des fichiers verrouillés (flock), partagés entre les workers"""
+
+    _format = struct.Struct('<qqq')
+
+    def __init__(self, directory, max_age=86400):
+        self.directory = directory
+        self.max_age = max_age
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest())
+
+    def hit(self, key, limit, window, now=None):
+        now = time.time() if now is None else now
+        fd = os.open(self._path(key), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            raw = os.read(fd, self._format.size)
+            state = self._format.unpack(raw) if len(raw) == self._format.size else (0, 0, 0)
+            state, allowed, retry_after = slide(state, now, limit, window)
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.write(fd, self._format.pack(*state))
+        finally:
+            os.close(fd)  # Libère aussi le verrou
+
+        # Nettoyage occasionnel des compteurs inactifs
+        if random.random() < 0.001:
+            self.prune()
+        return allowed, retry_after
+
+    def prune(self):
+        limit = time.time() - self.max_age
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.stat().st_mtime < limit:
+                    os.unlink(entry.path)
+            except OSError:
+                pass
+
+    def reset(self, key=None):
+        paths = [self._path(key)] if key is not None else \
+            [entry.path for entry in os.scandir(self.directory)]
+        for path in paths:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+
+class RateLimiter:
+    """Extension Flask : décorateur de limitation de débit par IP et par nom d'utilisateur"""
+
+    def __init__(self, app=None):
+        self.store = None
+        self.enabled = False
+        self.proxy_count = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('RATE_LIMIT_ENABLED', True)
+        self.proxy_count = app.config.get('RATE_LIMIT_PROXY_COUNT', 0)
+        storage = app.config.get('RATE_LIMIT_STORAGE', 'memory')
+
+        if storage == 'filesystem':
+            default_dir = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+            directory = app.config.get('RATE_LIMIT_DIR') or os.path.join(default_dir, 'immo-ratelimit')
+            self.store = FileSystemStore(directory)
+        else:
+            self.store = MemoryStore(max_keys=app.config.get('RATE_LIMIT_MAX_KEYS', 10000))
+
+        app.extensions['rate_limiter'] = self
+
+    def client_ip(self):
+        """Adresse du client, en tenant compte des proxys de confiance (RATE_LIMIT_PROXY_COUNT)"""
+        if self.proxy_count:
+            route = request.access_route
+            if len(route) >= self.proxy_count:
+                return route[-self.proxy_count]
+        return request.remote_addr or 'unknown'
+
+    def _rules(self, scope, ip, username):
+        """Limites effectives : arguments du décorateur, sinon RATE_LIMITS[scope]"""
+        configured = current_app.config.get('RATE_LIMITS', {}).get(scope, {})
+        return {
+            'ip': ip or configured.get('ip'),
+            'username': username or configured.get('username'),
+        }
+
+    def check(self, scope, ip=None, username=None, username_field='username'):
+        """
+        Comptabilise la requête courante et lève TooManyRequests si une limite est atteinte.
+        """
+        rules = self._rules(scope, ip, username)
+        keys = []
+        if rules['ip']:
+            keys.append((f"{scope}:ip:{self.client_ip()}", rules['ip']))
+        submitted = (request.form.get(username_field) or '').strip().lower()
+        if rules['username'] and submitted:
+            keys.append((f"{scope}:user:{submitted}", rules['username']))
+
+        for key, rule in keys:
+            limit, window = parse_limit(rule)
+            allowed, retry_after = self.store.hit(key, limit, window)
+            if not allowed:
+                logger.warning(f"Limite de débit atteinte ({key}), nouvel essai dans {retry_after} s")
+                raise TooManyRequests(retry_after=retry_after)
+
+    def limit(self, scope, ip=None, username=None, methods=('POST',), username_field='username'):
+        """
+        Décorateur de route.
+
+        :param scope: Nom de la limite (clé de RATE_LIMITS et préfixe des compteurs)
+        :param ip: Limite par adresse IP, ex. '20/minute' (défaut : configuration)
+        :param username: Limite par nom d'utilisateur soumis, ex. '5/15minute'
+        :param methods: Méthodes HTTP comptabilisées
+        """
+        def decorator(f):
+            @wraps(f)
+            def decorated_function(*args, **kwargs):
+                if self.enabled and request.method in methods:
+                    self.check(scope, ip=ip, username=username, username_field=username_field)
+                return f(*args, **kwargs)
+            return decorated_function
+        return decorator
+
+
+# Instance partagée, initialisée dans create_app()
+rate_limiter = RateLimiter()
@@ -2,10 +2,23 @@
 Routes d'administration - Réservées aux administrateurs
 """
 
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import (Blueprint, render_template, redirect, url_for, flash, request, jsonify,
+                   current_app, Response, stream_with_context, abort)
 from flask_login import login_required, current_user
 from functools import wraps
+from sqlalchemy.orm import selectinload
 from models import db, User, PropertyListing
+from query_profiles import with_profile
+from cache import page_cache
+from db_pool import pool_metrics
+from profiling import profiler
+from user_cache import user_cache
+from admin_stats import get_dashboard_stats, refresh_snapshot, recent_users_with_counts
+from exports import (EXPORT_FORMATS, LISTING_FIELDS, USER_FIELDS, listing_rows, user_rows,
+                     stream_rows, export_filename)
+from forms import ListingImportForm
+from listing_import import import_listings, detect_format, open_upload
+import click
 
 admin = Blueprint('admin', __name__)
 
@@ -14,7 +27,7 @@ def admin_required(f):
     """Décorateur pour restreindre l'accès aux administrateurs"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if not current_user.is_authenticated or not current_user.is_admin:
+        if not user_cache.is_admin(current_user):
             flash('Accès refusé : vous devez être administrateur.', 'error')
             return redirect(url_for('main.index'))
         return f(*args, **kwargs)
@@ -26,30 +39,21 @@ def admin_required(f):
 @admin_required
 def dashboard():
     """Tableau de bord administrateur"""
-    # Statistiques générales
-    total_users = User.query.count()
-    total_listings = PropertyListing.query.count()
-    total_admins = User.query.filter_by(is_admin=True).count()
+    # Agrégats en un seul aller-retour, lus depuis l'instantané s'il est récent
+    stats = get_dashboard_stats(max_age=current_app.config['ADMIN_STATS_SNAPSHOT_TTL'])
     
     # Dernières annonces
-    recent_listings = PropertyListing.query.order_by(
-        PropertyListing.created_at.desc()
-    ).limit(5).all()
-    
-    # Derniers utilisateurs
-    recent_users = User.query.order_by(
-        User.id.desc()
+    recent_listings = with_profile(PropertyListing.query, 'admin_row').order_by(
+        PropertyListing.created_at.desc(), PropertyListing.id.desc()
     ).limit(5).all()
     
-    stats = {
-        'total_users': total_users,
-        'total_listings': total_listings,
-        'total_admins': total_admins,
-        'recent_listings': recent_listings,
-        'recent_users': recent_users
-    }
+    # Derniers utilisateurs, avec leur nombre d'annonces
+    recent_users = recent_users_with_counts(limit=5)
     
-    return render_template('admin/dashboard.html', **stats)
+    return render_template('admin/dashboard.html',
+                           stats=stats,
+                           recent_listings=recent_listings,
+                           recent_users=recent_users)
 
 
 @admin.route('/users')
@@ -86,6 +90,7 @@ def toggle_admin(user_id):
         flash(f'Utilisateur {user.username} {action}.', 'success')
     except Exception as e:
         db.session.rollback()
+        current_app.logger.error(f"Erreur modification statut admin (utilisateur {user_id}) : {e}")
         flash('Erreur lors de la modification du statut.', 'error')
     
     return redirect(url_for('admin.users'))
@@ -97,7 +102,7 @@ def toggle_admin(user_id):
 def listings():
     """Gestion des annonces"""
     page = request.args.get('page', 1, type=int)
-    listings = PropertyListing.query.order_by(
+    listings = with_profile(PropertyListing.query, 'admin_row').order_by(
         PropertyListing.created_at.desc()
     ).paginate(
         page=page,
@@ -112,15 +117,10 @@ def listings():
 @admin_required
 def delete_listing(listing_id):
     """Supprimer une annonce (admin)"""
-    listing = PropertyListing.query.get_or_404(listing_id)
+    listing = with_profile(PropertyListing.query, 'detail').filter_by(id=listing_id).first_or_404()
     
     try:
-        # Supprimer les médias de Cloudinary
-        for media in listing.media:
-            from cloudinary_util import delete_file
-            delete_file(media.public_id)
-        
-        # Supprimer de la base de données
+        # Les fichiers Cloudinary partent dans l'outbox media_deletion
         title = listing.title
         db.session.delete(listing)
         db.session.commit()
@@ -128,6 +128,165 @@ def delete_listing(listing_id):
         flash(f'Annonce "{title}" supprimée avec succès.', 'success')
     except Exception as e:
         db.session.rollback()
+        current_app.logger.error(f"Erreur suppression annonce {listing_id} (admin) : {e}")
         flash('Erreur lors de la suppression.', 'error')
     
-    return redirect(url_for('admin.listings'))
\ No newline at end of file
+    return redirect(url_for('admin.listings'))
+
+
+@admin.route('/listings/bulk-delete', methods=['POST'])
+@login_required
+@admin_required
+def bulk_delete_listings():
+    """Supprimer plusieurs annonces en une seule transaction"""
+    listing_ids = request.form.getlist('listing_ids', type=int)
+    if not listing_ids:
+        flash('Aucune annonce sélectionnée.', 'warning')
+        return redirect(url_for('admin.listings'))
+    
+    listings = with_profile(PropertyListing.query, 'detail').filter(
+        PropertyListing.id.in_(listing_ids)
+    ).all()
+    
+    try:
+        for listing in listings:
+            db.session.delete(listing)
+        db.session.commit()
+        flash(f'{len(listings)} annonce(s) supprimée(s).', 'success')
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Erreur suppression groupée d'annonces (admin) : {e}")
+        flash('Erreur lors de la suppression groupée.', 'error')
+    
+    return redirect(url_for('admin.listings'))
+
+
+@admin.route('/users/<int:id>/delete', methods=['POST'])
+@login_required
+@admin_required
+def delete_user(id):
+    """Supprimer un utilisateur, ses annonces et leurs médias"""
+    user = User.query.options(
+        selectinload(User.listings).selectinload(PropertyListing.media)
+    ).filter_by(id=id).first_or_404()
+    
+    if user.id == current_user.id:
+        flash('Vous ne pouvez pas supprimer votre propre compte.', 'error')
+        return redirect(url_for('admin.users'))
+    if user.is_admin:
+        flash('Retirez d\'abord les droits administrateur de cet utilisateur.', 'error')
+        return redirect(url_for('admin.users'))
+    
+    try:
+        # La cascade supprime annonces et médias ; les fichiers partent dans l'outbox
+        username = user.username
+        db.session.delete(user)
+        db.session.commit()
+        flash(f'Utilisateur {username} supprimé avec ses annonces.', 'success')
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Erreur suppression utilisateur {id} (admin) : {e}")
+        flash('Erreur lors de la suppression de l\'utilisateur.', 'error')
+    
+    return redirect(url_for('admin.users'))
+
+
+def _export_response(name, rows, fields):
+    """Réponse en flux pour un export CSV/JSONL (format choisi par ?format=)"""
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        abort(400)
+    current_app.logger.info(f"📤 Export {name} ({fmt}) demandé par {current_user.username}")
+    return Response(
+        stream_with_context(stream_rows(rows(), fields, fmt)),
+        mimetype=EXPORT_FORMATS[fmt],
+        headers={
+            'Content-Disposition': f'attachment; filename="{export_filename(name, fmt)}"',
+            'Cache-Control': 'no-store',
+            # Désactiver la mise en tampon des proxys : les lots partent dès qu'ils sont prêts
+            'X-Accel-Buffering': 'no',
+        }
+    )
+
+
+@admin.route('/export/listings')
+@login_required
+@admin_required
+def export_listings():
+    """Exporter toutes les annonces (CSV ou JSON Lines)"""
+    return _export_response('annonces', listing_rows, LISTING_FIELDS)
+
+
+@admin.route('/export/users')
+@login_required
+@admin_required
+def export_users():
+    """Exporter tous les utilisateurs (CSV ou JSON Lines)"""
+    return _export_response('utilisateurs', user_rows, USER_FIELDS)
+
+
+@admin.route('/import', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def import_listings_view():
+    """Importer des annonces en masse (CSV ou JSON Lines)"""
+    form = ListingImportForm()
+    report = None
+    
+    if form.validate_on_submit():
+        upload = form.import_file.data
+        try:
+            report = import_listings(
+                open_upload(upload), detect_format(upload.filename), current_user,
+                batch_size=current_app.config['IMPORT_BATCH_SIZE'],
+                upload_media=form.upload_media.data
+            )
+            current_app.logger.info(f"📥 Import par {current_user.username} : "
+                                    f"{report.inserted} insérée(s), {report.failed} en erreur")
+            category = 'success' if not report.failed else 'warning'
+            flash(f'{report.inserted} annonce(s) importée(s), {report.failed} ligne(s) en erreur.', category)
+        except (ValueError, UnicodeDecodeError) as e:
+            flash(f'Fichier illisible : {e}', 'error')
+    
+    return render_template('admin/import.html', form=form, report=report)
+
+
+@admin.route('/cache')
+@login_required
+@admin_required
+def cache_stats():
+    """Compteurs du cache de pages (worker courant)"""
+    return jsonify(page_cache.stats())
+
+
+@admin.route('/pool')
+@login_required
+@admin_required
+def pool_stats():
+    """Compteurs du pool de connexions (worker courant)"""
+    return jsonify(pool_metrics.snapshot(db.engine.pool))
+
+
+@admin.route('/perf', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def perf():
+    """Latences par endpoint (p50/p95/p99) et ventilation base/templates/Cloudinary"""
+    if request.method == 'POST':
+        profiler.reset()
+        flash('Statistiques de performance réinitialisées.', 'info')
+        return redirect(url_for('admin.perf'))
+    
+    rows = profiler.summary()
+    if request.args.get('format') == 'json':
+        return jsonify(enabled=profiler.enabled, endpoints=rows)
+    return render_template('admin/perf.html', rows=rows, enabled=profiler.enabled,
+                           slow_query_ms=profiler.slow_query_ms)
+
+
+@admin.cli.command('refresh-stats')
+def refresh_stats():
+    """Recalcule l'instantané des statistiques du tableau de bord (à planifier en cron)"""
+    stats = refresh_snapshot()
+    click.echo(f"✅ Statistiques recalculées : {stats['total_listings']} annonce(s), "
+               f"{stats['total_users']} utilisateur(s)")
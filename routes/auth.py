@@ -2,16 +2,18 @@
 Routes d'authentification (inscription, connexion, déconnexion)
 """
 
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app
 from flask_login import login_user, logout_user, login_required, current_user
-from werkzeug.security import generate_password_hash
 from models import db, User
 from forms import LoginForm, RegisterForm
+from passwords import password_hasher, HashingBusy
+from rate_limit import rate_limiter
 
 auth = Blueprint('auth', __name__)
 
 
 @auth.route('/login', methods=['GET', 'POST'])
+@rate_limiter.limit('login')
 def login():
     """Page de connexion"""
     if current_user.is_authenticated:
@@ -22,7 +24,22 @@ def login():
     if form.validate_on_submit():
         user = User.query.filter_by(username=form.username.data).first()
         
-        if user and user.check_password(form.password.data):
+        try:
+            valid = user is not None and user.check_password(form.password.data)
+        except HashingBusy:
+            flash('Service momentanément surchargé, veuillez réessayer dans un instant.', 'warning')
+            return render_template('auth/login.html', form=form), 503
+        
+        if valid:
+            # Hash calculé avec d'anciens paramètres : le mettre à jour tant qu'on a le mot de passe
+            if password_hasher.needs_rehash(user.password):
+                try:
+                    user.password = password_hasher.hash(form.password.data)
+                    db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    current_app.logger.warning(f"Rehachage du mot de passe de {user.username} reporté : {e}")
+            
             login_user(user, remember=form.remember.data)
             flash('Connexion réussie !', 'success')
             
@@ -36,6 +53,7 @@ def login():
 
 
 @auth.route('/register', methods=['GET', 'POST'])
+@rate_limiter.limit('register')
 def register():
     """Page d'inscription"""
     if current_user.is_authenticated:
@@ -50,10 +68,15 @@ def register():
             flash('Ce nom d\'utilisateur est déjà pris.', 'error')
         else:
             # Créer le nouvel utilisateur
+            try:
+                password_hash = password_hasher.hash(form.password.data)
+            except HashingBusy:
+                flash('Service momentanément surchargé, veuillez réessayer dans un instant.', 'warning')
+                return render_template('auth/register.html', form=form), 503
             user = User(
                 username=form.username.data,
                 phone=form.phone.data,
-                password=generate_password_hash(form.password.data)
+                password=password_hash
             )
             db.session.add(user)
             db.session.commit()
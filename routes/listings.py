@@ -2,21 +2,127 @@
 Routes pour la gestion des annonces immobilières
 """
 
-from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, abort, jsonify
 from flask_login import login_required, current_user
-from models import db, PropertyListing, Media
-from forms import ListingForm
-from cloudinary_util import upload_file, detect_resource_type
+from models import (db, User, PropertyListing, Media, backfill_media_summaries,
+                    next_media_positions, sync_media_summary)
+from forms import ListingForm, MAX_DIRECT_MEDIA, MAX_GALLERY_IMAGES
+from cloudinary_util import (upload_files, delete_file, detect_resource_type, is_configured,
+                             sign_direct_upload, verify_direct_upload, DirectUploadError)
+from query_profiles import with_profile
+from cache import page_cache, listing_tags
+from conditional import make_etag, not_modified, with_validators, viewer_key
+from upload_queue import upload_queue
+from media_cleanup import media_outbox, enqueue_deletions
+from listing_import import import_listings, detect_format, IMPORT_FORMATS
+from media_preprocess import prepare_uploads, MediaRejected
+from rate_limit import rate_limiter
+from media_storage import media_storage
+from user_cache import user_cache
+from sqlalchemy import case, delete, select, update
 import os
+import click
 
 listings = Blueprint('listings', __name__)
 
+# Nombre maximal de médias réordonnés ou supprimés en une requête
+MAX_MEDIA_BATCH = 100
+
+
+def _direct_upload_enabled():
+    return current_app.config.get('UPLOAD_DIRECT', True) and media_storage.is_cloudinary and is_configured()
+
+
+def _next_position(positions, file_type):
+    """Réserve la prochaine position de la galerie pour un type de média"""
+    position = positions[file_type]
+    positions[file_type] += 1
+    return position
+
+
+def _attach_direct_uploads(listing, items, positions, verified):
+    """
+    Vérifie les réponses d'upload direct et crée les médias de l'annonce (sans commit).
+
+    :param positions: Positions libres par type (voir next_media_positions), mises à jour
+    :param verified: Liste complétée au fil de la vérification par les fichiers authentiques
+                     et libres : ceux à supprimer si l'annonce n'est finalement pas enregistrée
+    :raises DirectUploadError: Réponse invalide ou fichier déjà rattaché à une annonce
+    :return: Liste des résultats vérifiés (public_id, url, type)
+    """
+    max_age = current_app.config.get('UPLOAD_DIRECT_MAX_AGE', 900)
+    results = []
+    for item in items:
+        results.append(verify_direct_upload(item, max_age))
+        verified.append(results[-1])
+    public_ids = [result['public_id'] for result in results]
+    already_used = set(db.session.scalars(
+        select(Media.public_id).where(Media.public_id.in_(public_ids))
+    ))
+    if already_used or len(set(public_ids)) != len(public_ids):
+        # Fichiers d'une autre annonce : ne jamais les supprimer
+        verified[:] = [result for result in verified if result['public_id'] not in already_used]
+        raise DirectUploadError("Fichier déjà associé à une annonce")
+    for result in results:
+        db.session.add(Media(
+            public_id=result['public_id'],
+            url=result['url'],
+            file_type=result['type'],
+            position=_next_position(positions, result['type']),
+            listing_id=listing.id
+        ))
+    return results
+
+
+def _discard_direct_uploads(results):
+    """
+    Inscrit dans l'outbox de suppression les fichiers déjà envoyés par le navigateur
+    d'une annonce non enregistrée (à appeler après le rollback).
+    """
+    files = {(result['public_id'], result['type']) for result in results}
+    if not files:
+        return
+    try:
+        enqueue_deletions(db.session.connection(), db.session, files)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Fichiers envoyés orphelins ({len(files)}) : {e}")
+
+
+def _editable_listing(id):
+    """
+    Annonce modifiable par l'utilisateur courant (API JSON de gestion des médias).
+
+    :return: Tuple (annonce, None) ou (None, réponse d'erreur)
+    """
+    listing = db.session.get(PropertyListing, id)
+    if listing is None:
+        abort(404)
+    if listing.user_id != current_user.id and not user_cache.is_admin(current_user):
+        return None, (jsonify(error="Vous ne pouvez pas modifier cette annonce."), 403)
+    return listing, None
+
+
+def _media_ids(key):
+    """Liste d'identifiants de médias du corps JSON, ou None si elle est invalide"""
+    ids = (request.get_json(silent=True) or {}).get(key)
+    if not isinstance(ids, list) or not ids or len(ids) > MAX_MEDIA_BATCH:
+        return None
+    if not all(isinstance(media_id, int) and not isinstance(media_id, bool) for media_id in ids):
+        return None
+    if len(set(ids)) != len(ids):
+        return None
+    return ids
+
 
 @listings.route('/add', methods=['GET', 'POST'])
 @login_required
 def add_listing():
     """Ajouter une nouvelle annonce"""
     form = ListingForm()
+    jobs = []
+    uploaded_files = []
     
     if form.validate_on_submit():
         try:
@@ -31,57 +137,211 @@ def add_listing():
             db.session.add(listing)
             db.session.flush()  # Pour obtenir l'ID de l'annonce
             
-            # Upload des fichiers
-            uploaded_files = []
+            # Fichiers reçus, dans l'ordre de la galerie : image principale,
+            # autres photos, puis vidéo (optionnelle)
+            files = []
+            for field, file_type in (('image_file', 'image'), ('gallery_files', 'image'),
+                                     ('video_file', 'video')):
+                for file_storage in request.files.getlist(field):
+                    if file_storage and file_storage.filename:
+                        files.append((file_storage, file_type))
+            # Nouvelle annonce : la galerie commence à la position 0
+            positions = {'image': 0, 'video': 0}
             
-            # Traiter l'image principale
-            if 'image_file' in request.files:
-                image_file = request.files['image_file']
-                if image_file and image_file.filename:
-                    result = upload_file(image_file, 'image')
-                    if result:
-                        media = Media(
-                            public_id=result['public_id'],
-                            url=result['url'],
-                            file_type='image',
-                            listing_id=listing.id
-                        )
-                        db.session.add(media)
-                        uploaded_files.append(result['public_id'])
+            # Fichiers déjà envoyés par le navigateur directement à Cloudinary : vérifiés
+            # en premier, pour être supprimés si la suite échoue
+            if form.direct_media:
+                _attach_direct_uploads(listing, form.direct_media, positions, uploaded_files)
             
-            # Traiter la vidéo (optionnelle)
-            if 'video_file' in request.files:
-                video_file = request.files['video_file']
-                if video_file and video_file.filename:
-                    result = upload_file(video_file, 'video')
-                    if result:
-                        media = Media(
-                            public_id=result['public_id'],
-                            url=result['url'],
-                            file_type='video',
-                            listing_id=listing.id
-                        )
-                        db.session.add(media)
-                        uploaded_files.append(result['public_id'])
+            # Budgets par type et réduction des photos trop grandes avant l'envoi
+            files = prepare_uploads(files)
+            
+            if upload_queue.enabled:
+                # Upload différé : les médias restent « en attente » jusqu'à la fin de l'envoi
+                for file_storage, file_type in files:
+                    media = Media(file_type=file_type, status='pending', listing_id=listing.id,
+                                  position=_next_position(positions, file_type))
+                    db.session.add(media)
+                    jobs.append(upload_queue.create_job(media, file_storage))
+            else:
+                # Uploads simultanés (pool borné) : la durée est celle des plus longs, pas leur somme
+                results = upload_files(files)
+                if results is None:
+                    raise RuntimeError("Échec de l'upload des médias")
+                for result in results:
+                    media = Media(
+                        public_id=result['public_id'],
+                        url=result['url'],
+                        file_type=result['type'],
+                        position=_next_position(positions, result['type']),
+                        listing_id=listing.id
+                    )
+                    db.session.add(media)
+                    uploaded_files.append(result)
             
             db.session.commit()
+            upload_queue.enqueue([job.id for job in jobs])
             
             flash(f'Annonce "{listing.title}" publiée avec succès !', 'success')
+            if jobs:
+                flash('Vos médias sont en cours d\'envoi et apparaîtront dans quelques instants.', 'info')
             return redirect(url_for('listings.listing_detail', id=listing.id))
             
+        except (MediaRejected, DirectUploadError) as e:
+            # Rien n'a été envoyé par le serveur ni mis en file ; les fichiers authentiques
+            # déjà envoyés par le navigateur seraient orphelins : les supprimer
+            db.session.rollback()
+            _discard_direct_uploads(uploaded_files)
+            form.uploaded_media.data = ''  # Fichiers supprimés : à renvoyer
+            current_app.logger.warning(f"Médias refusés : {e}")
+            flash(str(e) if isinstance(e, MediaRejected) else 'Médias envoyés invalides ou expirés.', 'error')
         except Exception as e:
             db.session.rollback()
+            for job in jobs:
+                upload_queue.discard(job.path)
+            # Annonce non créée : supprimer les fichiers déjà envoyés
+            for result in uploaded_files:
+                delete_file(result['public_id'], result['type'])
             current_app.logger.error(f"Erreur création annonce : {e}")
             flash('Erreur lors de la publication. Veuillez réessayer.', 'error')
     
-    return render_template('listings/add_listing.html', form=form)
+    return render_template('listings/add_listing.html', form=form,
+                           direct_upload=_direct_upload_enabled(),
+                           max_gallery_images=MAX_GALLERY_IMAGES)
+
+
+@listings.route('/uploads/sign', methods=['POST'])
+@login_required
+@rate_limiter.limit('upload_sign')
+def sign_upload():
+    """Signature d'un upload direct navigateur → Cloudinary (JSON)"""
+    if not _direct_upload_enabled():
+        abort(404)
+    payload = request.get_json(silent=True) or request.form
+    resource_type = payload.get('resource_type')
+    try:
+        params = sign_direct_upload(resource_type, current_app.config['CLOUDINARY_UPLOAD_API_URL'])
+    except DirectUploadError as e:
+        return jsonify(error=str(e)), 400
+    
+    params['max_bytes'] = current_app.config['UPLOAD_MAX_IMAGE_BYTES' if resource_type == 'image'
+                                             else 'UPLOAD_MAX_VIDEO_BYTES']
+    response = jsonify(params)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+@listings.route('/<int:id>/media/confirm', methods=['POST'])
+@login_required
+def confirm_uploads(id):
+    """Rattache à une annonce des fichiers envoyés directement à Cloudinary (JSON)"""
+    listing, error = _editable_listing(id)
+    if error:
+        return error
+    
+    items = (request.get_json(silent=True) or {}).get('media')
+    if not isinstance(items, list) or not items or len(items) > MAX_DIRECT_MEDIA \
+            or not all(isinstance(item, dict) for item in items):
+        return jsonify(error="Liste de médias invalide."), 400
+    
+    verified = []
+    try:
+        # Nouveaux fichiers ajoutés à la fin de la galerie
+        results = _attach_direct_uploads(listing, items, next_media_positions(listing.id), verified)
+        db.session.commit()
+    except DirectUploadError as e:
+        db.session.rollback()
+        _discard_direct_uploads(verified)
+        current_app.logger.warning(f"Confirmation d'upload refusée (annonce {id}) : {e}")
+        return jsonify(error=str(e)), 400
+    
+    return jsonify(media=results), 201
+
+
+@listings.route('/<int:id>/media/reorder', methods=['POST'])
+@login_required
+def reorder_media(id):
+    """
+    Réordonne la galerie d'une annonce (JSON {"order": [id, ...]}) en une seule requête UPDATE.
+    Le premier élément devient la couverture ; les médias absents de la liste gardent leur position.
+    """
+    listing, error = _editable_listing(id)
+    if error:
+        return error
+    ids = _media_ids('order')
+    if ids is None:
+        return jsonify(error="Ordre des médias invalide."), 400
+    
+    result = db.session.execute(
+        update(Media)
+        .where(Media.listing_id == listing.id, Media.id.in_(ids))
+        .values(position=case({media_id: rank for rank, media_id in enumerate(ids)}, value=Media.id)),
+        execution_options={'synchronize_session': False}
+    )
+    if result.rowcount != len(ids):
+        db.session.rollback()
+        return jsonify(error="Médias inconnus pour cette annonce."), 400
+    
+    # UPDATE en masse : les événements de Media ne sont pas déclenchés
+    sync_media_summary(db.session, listing.id)
+    db.session.commit()
+    page_cache.invalidate('feed', *listing_tags(listing.id))
+    return jsonify(order=ids, cover_url=listing.cover_url)
+
+
+@listings.route('/<int:id>/media/delete', methods=['POST'])
+@login_required
+def delete_media(id):
+    """Supprime des médias d'une annonce (JSON {"ids": [id, ...]}) en une seule requête DELETE"""
+    listing, error = _editable_listing(id)
+    if error:
+        return error
+    ids = _media_ids('ids')
+    if ids is None:
+        return jsonify(error="Liste de médias invalide."), 400
+    
+    condition = (Media.listing_id == listing.id) & Media.id.in_(ids)
+    files = db.session.execute(select(Media.public_id, Media.file_type).where(condition)).all()
+    if len(files) != len(ids):
+        return jsonify(error="Médias inconnus pour cette annonce."), 400
+    
+    try:
+        # DELETE en masse : outbox et colonnes dénormalisées sont alimentées explicitement
+        db.session.execute(delete(Media).where(condition),
+                           execution_options={'synchronize_session': False})
+        enqueue_deletions(db.session.connection(), db.session, files)
+        sync_media_summary(db.session, listing.id)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Erreur suppression des médias (annonce {id}) : {e}")
+        return jsonify(error="Erreur lors de la suppression."), 500
+    
+    page_cache.invalidate('feed', *listing_tags(listing.id))
+    return jsonify(deleted=ids, cover_url=listing.cover_url)
 
 
 @listings.route('/<int:id>')
+@page_cache.cached_page(tags=lambda id: listing_tags(id))
 def listing_detail(id):
     """Afficher les détails d'une annonce"""
-    listing = PropertyListing.query.get_or_404(id)
-    return render_template('listings/listing_detail.html', listing=listing)
+    # Lecture légère de updated_at pour répondre 304 sans charger l'annonce
+    stamp = db.session.query(PropertyListing.updated_at).filter_by(id=id).first()
+    if stamp is None:
+        abort(404)
+    last_modified = stamp.updated_at
+    etag = make_etag('listing', id, last_modified, viewer_key())
+    early = not_modified(etag, last_modified,
+                         max_age=current_app.config['HTTP_CACHE_DETAIL_MAX_AGE'])
+    if early is not None:
+        return early
+    
+    listing = with_profile(PropertyListing.query, 'detail').filter_by(id=id).first_or_404()
+    return with_validators(
+        render_template('listings/listing_detail.html', listing=listing),
+        etag, last_modified,
+        max_age=current_app.config['HTTP_CACHE_DETAIL_MAX_AGE']
+    )
 
 
 @listings.route('/edit/<int:id>', methods=['GET', 'POST'])
@@ -91,7 +351,7 @@ def edit_listing(id):
     listing = PropertyListing.query.get_or_404(id)
     
     # Vérifier que l'utilisateur est le propriétaire ou admin
-    if listing.user_id != current_user.id and not current_user.is_admin:
+    if listing.user_id != current_user.id and not user_cache.is_admin(current_user):
         flash('Vous ne pouvez pas modifier cette annonce.', 'error')
         return redirect(url_for('main.index'))
     
@@ -115,20 +375,16 @@ def edit_listing(id):
 @login_required
 def delete_listing(id):
     """Supprimer une annonce"""
-    listing = PropertyListing.query.get_or_404(id)
+    listing = with_profile(PropertyListing.query, 'detail').filter_by(id=id).first_or_404()
     
     # Vérifier les permissions
-    if listing.user_id != current_user.id and not current_user.is_admin:
+    if listing.user_id != current_user.id and not user_cache.is_admin(current_user):
         flash('Vous ne pouvez pas supprimer cette annonce.', 'error')
         return redirect(url_for('main.index'))
     
     try:
-        # Supprimer les médias de Cloudinary
-        for media in listing.media:
-            from cloudinary_util import delete_file
-            delete_file(media.public_id)
-        
-        # Supprimer de la base de données
+        # Les fichiers Cloudinary sont inscrits dans l'outbox media_deletion
+        # et supprimés en arrière-plan après le commit
         db.session.delete(listing)
         db.session.commit()
         
@@ -138,4 +394,68 @@ def delete_listing(id):
         current_app.logger.error(f"Erreur suppression annonce : {e}")
         flash('Erreur lors de la suppression.', 'error')
     
-    return redirect(url_for('main.index'))
\ No newline at end of file
+    return redirect(url_for('main.index'))
+
+
+@listings.cli.command('backfill-covers')
+def backfill_covers():
+    """Recalcule cover_url et has_video pour toutes les annonces existantes"""
+    with db.engine.begin() as connection:
+        count = backfill_media_summaries(connection)
+    click.echo(f"✅ {count} annonce(s) mise(s) à jour")
+
+
+@listings.cli.command('process-uploads')
+def process_uploads():
+    """Exécute immédiatement les uploads de médias en attente"""
+    count = upload_queue.run_due()
+    click.echo(f"✅ {count} média(s) finalisé(s)")
+
+
+@listings.cli.command('process-deletions')
+def process_deletions():
+    """Vide immédiatement l'outbox des fichiers Cloudinary à supprimer"""
+    total = 0
+    while True:
+        count = media_outbox.flush()
+        total += count
+        if count < media_outbox.batch_size:
+            break
+    click.echo(f"✅ {total} suppression(s) traitée(s)")
+
+
+@listings.cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--user', 'username', required=True,
+              help="Auteur des lignes sans colonne 'author'")
+@click.option('--format', 'fmt', type=click.Choice(IMPORT_FORMATS),
+              help="Format du fichier (déduit de l'extension par défaut)")
+@click.option('--batch-size', type=int, default=None, help="Annonces insérées par lot")
+@click.option('--upload-media', is_flag=True,
+              help="Copier les médias sur Cloudinary au lieu de reprendre les URLs")
+def import_command(path, username, fmt, batch_size, upload_media):
+    """Importe des annonces depuis un fichier CSV ou JSON Lines"""
+    if upload_media and not media_storage.is_cloudinary:
+        # Les backends hors ligne (memory, local) ne téléchargent pas les URLs distantes
+        raise click.ClickException(
+            f"--upload-media nécessite le stockage Cloudinary (backend actuel : {media_storage.backend.name})")
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        raise click.ClickException(f"Utilisateur inconnu : {username}")
+    try:
+        fmt = fmt or detect_format(path)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    
+    with open(path, encoding='utf-8-sig', newline='') as stream:
+        report = import_listings(
+            stream, fmt, user,
+            batch_size=batch_size or current_app.config['IMPORT_BATCH_SIZE'],
+            upload_media=upload_media
+        )
+    
+    for line, messages in report.errors:
+        click.echo(f"❌ Ligne {line} : {'; '.join(messages)}", err=True)
+    if report.failed > len(report.errors):
+        click.echo(f"… et {report.failed - len(report.errors)} autre(s) erreur(s)", err=True)
+    click.echo(f"✅ {report.inserted} annonce(s) importée(s), {report.failed} ligne(s) en erreur")
@@ -1,15 +1,89 @@
-from flask import Blueprint, render_template, request
+from flask import Blueprint, render_template, request, current_app
 from models import PropertyListing
+from forms import ListingFilterForm
+from filters import filters_from_form, apply_filters, sort_keys, facet_counts, DEFAULT_SORT
+from pagination import paginate_keyset, clamp_per_page, InvalidCursor
+from query_profiles import with_profile
+from search import search_query
+from cache import page_cache
+from conditional import make_etag, not_modified, with_validators, viewer_key
 
 main = Blueprint('main', __name__)
 
 @main.route('/')
+@page_cache.cached_page(tags=lambda: ('feed',))
 def index():
+    form = ListingFilterForm(request.args)
+    filters = filters_from_form(form)
+    per_page = clamp_per_page(
+        request.args.get('per_page', type=int),
+        default=current_app.config['LISTINGS_PER_PAGE']
+    )
+    keys, descending = sort_keys(filters)
+    
+    query = apply_filters(with_profile(PropertyListing.query, 'card'), filters)
+    
+    try:
+        listings = paginate_keyset(
+            query, PropertyListing,
+            after=request.args.get('after'),
+            before=request.args.get('before'),
+            per_page=per_page,
+            keys=keys,
+            descending=descending
+        )
+    except InvalidCursor:
+        # Curseur corrompu : on repart de la première page
+        listings = paginate_keyset(query, PropertyListing, per_page=per_page,
+                                   keys=keys, descending=descending)
+    
+    facets = page_cache.get_or_set(
+        f"facets:{sorted((k, v) for k, v in filters.items() if k != 'sort')}",
+        ('feed',),
+        lambda: facet_counts(filters)
+    )
+    
+    # Validateur HTTP : contenu de la page (ids + updated_at max) et facettes.
+    # Pas de Last-Modified : une suppression ne fait pas avancer updated_at max,
+    # un client revalidant avec If-Modified-Since seul recevrait une page périmée.
+    stamps = [item.updated_at for item in listings if item.updated_at is not None]
+    etag = make_etag(
+        'feed', request.query_string.decode('utf-8', 'replace'), viewer_key(),
+        [item.id for item in listings], max(stamps) if stamps else None, facets
+    )
+    early = not_modified(etag)
+    if early is not None:
+        return early
+    
+    # Paramètres à conserver dans les liens de pagination
+    filter_args = {name: value for name, value in filters.items()
+                   if value is not None and not (name == 'sort' and value == DEFAULT_SORT)}
+    if per_page != current_app.config['LISTINGS_PER_PAGE']:
+        filter_args['per_page'] = per_page
+    
+    return with_validators(render_template(
+        'index.html',
+        listings=listings,
+        form=form,
+        filters=filters,
+        filter_args=filter_args,
+        facets=facets,
+        current_type=filters['type'] or ''
+    ), etag)
+
+
+@main.route('/search')
+def search():
+    terms = request.args.get('q', '').strip()
     type_filter = request.args.get('type', '')
+    page = request.args.get('page', 1, type=int)
+    per_page = current_app.config['LISTINGS_PER_PAGE']
     
+    query = with_profile(PropertyListing.query, 'card')
     if type_filter:
-        listings = PropertyListing.query.filter_by(property_type=type_filter).order_by(PropertyListing.created_at.desc()).all()
-    else:
-        listings = PropertyListing.query.order_by(PropertyListing.created_at.desc()).all()
+        query = query.filter_by(property_type=type_filter)
+    
+    ranked = search_query(terms, query)
+    results = ranked.paginate(page=page, per_page=per_page, error_out=False) if ranked is not None else None
     
-    return render_template('index.html', listings=listings, current_type=type_filter)
\ No newline at end of file
+    return render_template('search.html', results=results, terms=terms, current_type=type_filter)
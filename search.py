@@ -0,0 +1,139 @@
+"""
+Recherche plein texte sur les annonces (titre + description).
+PostgreSQL : colonne tsvector générée (configuration 'french') + index GIN.
+SQLite (développement/tests) : table virtuelle FTS5 synchronisée par triggers.
+"""
+
+import logging
+import re
+
+from sqlalchemy import column, event, func, literal_column, table, text
+
+from models import db, PropertyListing
+
+logger = logging.getLogger(__name__)
+
+# Configuration linguistique PostgreSQL
+TS_CONFIG = 'french'
+
+# Table virtuelle FTS5 (SQLite uniquement)
+FTS_TABLE = 'property_listing_fts'
+
+# DDL PostgreSQL : colonne tsvector générée et index GIN (mêmes objets que la migration 004)
+POSTGRES_SEARCH_DDL = [
+    f"""ALTER TABLE property_listing ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('{TS_CONFIG}', coalesce(title, '')), 'A') ||
+            setweight(to_tsvector('{TS_CONFIG}', coalesce(description, '')), 'B')
+        ) STORED""",
+    """CREATE INDEX IF NOT EXISTS ix_property_listing_search_vector
+        ON property_listing USING gin (search_vector)""",
+]
+
+# DDL SQLite : créée par la migration 004, ou à chaque db.create_all() (voir plus bas)
+SQLITE_FTS_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, description,
+        content='property_listing', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS property_listing_fts_ai AFTER INSERT ON property_listing BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS property_listing_fts_ad AFTER DELETE ON property_listing BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS property_listing_fts_au AFTER UPDATE OF title, description ON property_listing BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END""",
+]
+
+_fts = table(FTS_TABLE, column('rowid'), column('rank'))
+
+# Mots de la requête utilisateur (lettres, chiffres, accents)
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def create_search_index(connection):
+    """Crée l'index plein texte du moteur de la connexion (idempotent)"""
+    dialect = connection.dialect.name
+    if dialect == 'postgresql':
+        for statement in POSTGRES_SEARCH_DDL:
+            connection.execute(text(statement))
+    elif dialect == 'sqlite':
+        exists = connection.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type='table' AND name=:name"),
+            {'name': FTS_TABLE}
+        ).first()
+        for statement in SQLITE_FTS_DDL:
+            connection.execute(text(statement))
+        if not exists:
+            # Indexer les annonces déjà présentes
+            connection.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+
+
+def ensure_search_index(engine):
+    """
+    Crée l'index plein texte d'une base existante (tables créées avant son ajout).
+    Les bases créées par db.create_all() le reçoivent déjà via l'événement after_create.
+    """
+    with engine.begin() as connection:
+        create_search_index(connection)
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _create_search_index(target, connection, **kw):
+    """db.create_all() (développement, tests) : même index que la migration 004"""
+    create_search_index(connection)
+
+
+@event.listens_for(db.metadata, 'before_drop')
+def _drop_search_index(target, connection, **kw):
+    """db.drop_all() : la table FTS5 n'est pas connue des métadonnées, la supprimer aussi"""
+    if connection.dialect.name == 'sqlite':
+        connection.execute(text(f"DROP TABLE IF EXISTS {FTS_TABLE}"))
+
+
+def _fts5_query(terms):
+    """Construit une expression MATCH FTS5 sûre : chaque mot en préfixe, tous requis"""
+    return ' '.join(f'"{word}"*' for word in _WORD_RE.findall(terms))
+
+
+def search_query(terms, query=None):
+    """
+    Filtre et trie une requête d'annonces par pertinence.
+
+    :param terms: Texte saisi par l'utilisateur
+    :param query: Requête de base (PropertyListing.query par défaut)
+    :return: Requête triée par pertinence, ou None si la recherche est vide
+    """
+    if query is None:
+        query = PropertyListing.query
+
+    terms = (terms or '').strip()
+    if not _WORD_RE.search(terms):
+        return None
+
+    dialect = db.session.get_bind().dialect.name
+
+    if dialect == 'postgresql':
+        vector = literal_column('property_listing.search_vector')
+        ts_query = func.websearch_to_tsquery(TS_CONFIG, terms)
+        return query.filter(vector.op('@@')(ts_query)) \
+            .order_by(func.ts_rank(vector, ts_query).desc(), PropertyListing.id.desc())
+
+    if dialect == 'sqlite':
+        # rank FTS5 = bm25 : plus petit = plus pertinent
+        return query.join(_fts, _fts.c.rowid == PropertyListing.id) \
+            .filter(literal_column(FTS_TABLE).op('MATCH')(_fts5_query(terms))) \
+            .order_by(_fts.c.rank, PropertyListing.id.desc())
+
+    # Autres moteurs : repli sans index
+    logger.warning(f"Recherche plein texte non supportée pour {dialect}, repli sur LIKE")
+    pattern = f"%{terms}%"
+    return query.filter(
+        PropertyListing.title.ilike(pattern) | PropertyListing.description.ilike(pattern)
+    ).order_by(PropertyListing.created_at.desc(), PropertyListing.id.desc())
@@ -0,0 +1,102 @@
+/*
+ * Upload direct des médias vers Cloudinary.
+ * À l'envoi d'un formulaire <form data-direct-upload="URL de signature">, chaque
+ * fichier choisi (champs data-resource-type, simples ou multiples) est envoyé
+ * directement à Cloudinary avec des paramètres signés par le serveur ; les réponses sont placées dans le
+ * champ caché uploaded_media et le formulaire part sans les fichiers.
+ * Les fichiers dont l'upload direct échoue restent dans leur champ et partent
+ * normalement avec le formulaire (upload via le serveur), sans perdre les autres.
+ */
+(function () {
+    'use strict';
+
+    function postJSON(url, data) {
+        return fetch(url, {
+            method: 'POST',
+            credentials: 'same-origin',
+            headers: { 'Content-Type': 'application/json', 'Accept': 'application/json' },
+            body: JSON.stringify(data)
+        }).then(function (response) {
+            if (!response.ok) { throw new Error('Signature refusée (' + response.status + ')'); }
+            return response.json();
+        });
+    }
+
+    function uploadFile(signUrl, file, resourceType) {
+        return postJSON(signUrl, { resource_type: resourceType }).then(function (params) {
+            if (params.max_bytes && file.size > params.max_bytes) {
+                throw new Error('Fichier trop volumineux');
+            }
+            var body = new FormData();
+            ['api_key', 'timestamp', 'signature', 'folder', 'upload_preset'].forEach(function (name) {
+                if (params[name] !== undefined && params[name] !== null) { body.append(name, params[name]); }
+            });
+            body.append('file', file);
+            return fetch(params.upload_url, { method: 'POST', body: body });
+        }).then(function (response) {
+            if (!response.ok) { throw new Error('Upload refusé (' + response.status + ')'); }
+            return response.json();
+        }).then(function (result) {
+            return {
+                public_id: result.public_id,
+                version: result.version,
+                signature: result.signature,
+                resource_type: resourceType,
+                secure_url: result.secure_url
+            };
+        });
+    }
+
+    function handleSubmit(event) {
+        var form = event.target;
+        if (form.dataset.directUploadDone) { return; }
+        var inputs = form.querySelectorAll('input[type="file"][data-resource-type]');
+        var pending = [];
+        for (var i = 0; i < inputs.length; i++) {
+            if (inputs[i].files && inputs[i].files.length) { pending.push(inputs[i]); }
+        }
+        // DataTransfer permet de ne laisser dans un champ que les fichiers en échec
+        if (!pending.length || !window.fetch || !window.FormData || !window.DataTransfer) { return; }
+
+        event.preventDefault();
+        var submit = form.querySelector('[type="submit"]');
+        var label = submit && submit.value;
+        if (submit) { submit.disabled = true; submit.value = 'Envoi des médias…'; }
+
+        // Un envoi par fichier ; les réponses gardent l'ordre des champs puis de sélection
+        var uploads = [];
+        pending.forEach(function (input) {
+            Array.prototype.forEach.call(input.files, function (file) {
+                uploads.push(uploadFile(form.dataset.directUpload, file, input.dataset.resourceType)
+                    .catch(function () { return null; }));
+            });
+        });
+        Promise.all(uploads).then(function (results) {
+            var field = form.querySelector('input[name="uploaded_media"]');
+            var done = [];
+            try { done = JSON.parse(field.value || '[]'); } catch (e) { done = []; }
+            var index = 0;
+            pending.forEach(function (input) {
+                // Fichiers déjà chez Cloudinary retirés ; les échecs passent par le serveur
+                var failed = new DataTransfer();
+                Array.prototype.forEach.call(input.files, function (file) {
+                    var result = results[index++];
+                    if (result) { done.push(result); } else { failed.items.add(file); }
+                });
+                input.files = failed.files;
+            });
+            field.value = done.length ? JSON.stringify(done) : '';
+        }).then(function () {
+            form.dataset.directUploadDone = '1';
+            if (submit) { submit.disabled = false; submit.value = label; }
+            form.submit();
+        });
+    }
+
+    document.addEventListener('DOMContentLoaded', function () {
+        var forms = document.querySelectorAll('form[data-direct-upload]');
+        for (var i = 0; i < forms.length; i++) {
+            forms[i].addEventListener('submit', handleSubmit);
+        }
+    });
+})();
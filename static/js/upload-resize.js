@@ -0,0 +1,93 @@
+/*
+ * Réduction des photos dans le navigateur avant l'envoi.
+ * Les champs <input type="file" data-max-edge="..."> (simples ou multiples) voient
+ * leurs images remplacées par une version dont le plus grand côté ne dépasse pas data-max-edge
+ * (même format que l'original, qualité data-quality pour JPEG et WebP : la transparence
+ * des PNG/WebP est conservée). Le serveur contrôle de toute façon la taille
+ * et réduit à nouveau si nécessaire (media_preprocess.py).
+ */
+(function () {
+    'use strict';
+
+    var RESIZABLE_TYPES = ['image/jpeg', 'image/png', 'image/webp'];
+    var EXTENSIONS = { 'image/jpeg': '.jpg', 'image/png': '.png', 'image/webp': '.webp' };
+
+    function loadBitmap(file) {
+        if (window.createImageBitmap) {
+            return createImageBitmap(file, { imageOrientation: 'from-image' });
+        }
+        return new Promise(function (resolve, reject) {
+            var img = new Image();
+            img.onload = function () { URL.revokeObjectURL(img.src); resolve(img); };
+            img.onerror = reject;
+            img.src = URL.createObjectURL(file);
+        });
+    }
+
+    function resize(file, maxEdge, quality) {
+        return loadBitmap(file).then(function (bitmap) {
+            var scale = maxEdge / Math.max(bitmap.width, bitmap.height);
+            if (scale >= 1) {
+                return file;
+            }
+            var canvas = document.createElement('canvas');
+            canvas.width = Math.round(bitmap.width * scale);
+            canvas.height = Math.round(bitmap.height * scale);
+            canvas.getContext('2d').drawImage(bitmap, 0, 0, canvas.width, canvas.height);
+            return new Promise(function (resolve) {
+                canvas.toBlob(function (blob) {
+                    if (!blob || blob.size >= file.size) {
+                        resolve(file);
+                        return;
+                    }
+                    // Navigateur sans encodeur pour ce format : blob.type indique le format réel
+                    var name = blob.type === file.type ? file.name
+                        : file.name.replace(/\.[^.]+$/, '') + (EXTENSIONS[blob.type] || '');
+                    resolve(new File([blob], name, { type: blob.type, lastModified: Date.now() }));
+                }, file.type, quality);
+            });
+        });
+    }
+
+    function handleChange(event) {
+        var input = event.target;
+        var files = Array.prototype.slice.call(input.files || []);
+        if (!files.length || !window.DataTransfer) {
+            return;
+        }
+        var maxEdge = parseInt(input.dataset.maxEdge, 10);
+        var quality = (parseInt(input.dataset.quality, 10) || 85) / 100;
+        var form = input.form;
+        var submit = form && form.querySelector('[type="submit"]');
+        if (submit) { submit.disabled = true; }
+
+        // Ordre de sélection conservé : il devient l'ordre de la galerie
+        Promise.all(files.map(function (file) {
+            if (RESIZABLE_TYPES.indexOf(file.type) === -1) {
+                return file;
+            }
+            return resize(file, maxEdge, quality).catch(function () {
+                // Image illisible par le navigateur : envoi de l'original
+                return file;
+            });
+        })).then(function (results) {
+            var changed = results.some(function (result, i) { return result !== files[i]; });
+            if (changed) {
+                var transfer = new DataTransfer();
+                results.forEach(function (result) { transfer.items.add(result); });
+                input.files = transfer.files;
+            }
+        }).catch(function () {
+            // Échec inattendu : les fichiers d'origine restent dans le champ
+        }).then(function () {
+            if (submit) { submit.disabled = false; }
+        });
+    }
+
+    document.addEventListener('DOMContentLoaded', function () {
+        var inputs = document.querySelectorAll('input[type="file"][data-max-edge]');
+        for (var i = 0; i < inputs.length; i++) {
+            inputs[i].addEventListener('change', handleChange);
+        }
+    });
+})();
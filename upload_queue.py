@@ -0,0 +1,233 @@
+"""
+File d'attente d'upload des médias, découplée du thread de requête.
+Les fichiers reçus sont déposés sur le disque local et une tâche durable (UploadJob)
+est créée dans la même transaction que l'annonce. Un pool de threads envoie ensuite
+les fichiers vers Cloudinary et finalise les lignes Media ; les échecs sont
+réessayés avec un délai exponentiel, et un planificateur reprend les tâches
+orphelines après un redémarrage du worker.
+"""
+
+import logging
+import os
+import random
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import update
+from werkzeug.utils import secure_filename
+
+from models import db, Media, UploadJob
+from cloudinary_util import upload_file, delete_file
+
+logger = logging.getLogger(__name__)
+
+
+class UploadQueue:
+    """Extension Flask : exécution asynchrone des tâches UploadJob"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = False
+        self._executor = None
+        self._poller = None
+        self._stop = threading.Event()
+        self._start_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config.get('UPLOAD_ASYNC', True)
+        self.spool_dir = app.config.get('UPLOAD_SPOOL_DIR') or \
+            os.path.join(tempfile.gettempdir(), 'immo-uploads')
+        self.max_workers = app.config.get('UPLOAD_WORKERS', 2)
+        self.max_attempts = app.config.get('UPLOAD_MAX_ATTEMPTS', 5)
+        self.retry_base = app.config.get('UPLOAD_RETRY_BASE', 5)
+        self.retry_max = app.config.get('UPLOAD_RETRY_MAX', 600)
+        self.poll_interval = app.config.get('UPLOAD_POLL_INTERVAL', 15)
+        self.stale_after = app.config.get('UPLOAD_STALE_AFTER', 300)
+
+        app.extensions['upload_queue'] = self
+        if self.enabled:
+            os.makedirs(self.spool_dir, exist_ok=True)
+            # Démarrage paresseux : pas de threads pour les commandes CLI (flask db upgrade...)
+            app.before_request(self._ensure_started)
+
+    # === Côté requête ===
+
+    def spool(self, file_storage):
+        """
+        Dépose un fichier reçu sur le disque local.
+
+        :param file_storage: FileStorage de request.files
+        :return: Chemin du fichier déposé
+        """
+        filename = secure_filename(file_storage.filename or '') or 'upload'
+        path = os.path.join(self.spool_dir, f"{uuid.uuid4().hex}_{filename}")
+        file_storage.save(path)
+        return path
+
+    def create_job(self, media, file_storage):
+        """
+        Dépose le fichier d'un média en attente et crée sa tâche d'upload (sans commit).
+
+        :param media: Media déjà ajouté à la session, statut 'pending'
+        :param file_storage: Fichier reçu
+        :return: UploadJob
+        """
+        path = self.spool(file_storage)
+        db.session.flush()  # Pour obtenir media.id
+        job = UploadJob(media_id=media.id, file_type=media.file_type, path=path)
+        db.session.add(job)
+        return job
+
+    def enqueue(self, job_ids):
+        """Soumet des tâches au pool (à appeler après le commit)"""
+        if not self.enabled:
+            return
+        self._ensure_started()
+        for job_id in job_ids:
+            self._executor.submit(self._run_in_context, job_id)
+
+    # === Côté worker ===
+
+    def _ensure_started(self):
+        if self._executor is not None:
+            return
+        with self._start_lock:
+            if self._executor is not None:
+                return
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                thread_name_prefix='upload')
+            self._poller = threading.Thread(target=self._poll_loop, name='upload-poller', daemon=True)
+            self._poller.start()
+            logger.info(f"File d'upload démarrée ({self.max_workers} thread(s))")
+
+    def shutdown(self, wait=True):
+        self._stop.set()
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+
+    def _poll_loop(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                with self.app.app_context():
+                    job_ids = self.due_job_ids()
+                for job_id in job_ids:
+                    self._executor.submit(self._run_in_context, job_id)
+            except Exception as e:
+                logger.error(f"Planificateur d'upload : {e}", exc_info=True)
+
+    def _run_in_context(self, job_id):
+        with self.app.app_context():
+            try:
+                self.run_job(job_id)
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Tâche d'upload #{job_id} interrompue : {e}", exc_info=True)
+
+    def due_job_ids(self):
+        """Tâches à (re)lancer, après avoir libéré celles bloquées par un worker disparu"""
+        now = datetime.now(timezone.utc)
+        db.session.execute(
+            update(UploadJob)
+            .where(UploadJob.status == 'running',
+                   UploadJob.locked_at < now - timedelta(seconds=self.stale_after))
+            .values(status='pending', locked_at=None)
+        )
+        db.session.commit()
+        return db.session.scalars(
+            db.select(UploadJob.id)
+            .where(UploadJob.status == 'pending', UploadJob.next_attempt_at <= now)
+            .order_by(UploadJob.next_attempt_at)
+        ).all()
+
+    def _claim(self, job_id):
+        """Réserve une tâche ; un seul worker peut y parvenir"""
+        now = datetime.now(timezone.utc)
+        claimed = db.session.execute(
+            update(UploadJob)
+            .where(UploadJob.id == job_id, UploadJob.status == 'pending',
+                   UploadJob.next_attempt_at <= now)
+            .values(status='running', locked_at=now, attempts=UploadJob.attempts + 1)
+        ).rowcount
+        db.session.commit()
+        return claimed == 1
+
+    def _backoff(self, attempts):
+        delay = min(self.retry_base * 2 ** (attempts - 1), self.retry_max)
+        return timedelta(seconds=delay * random.uniform(0.5, 1.5))
+
+    @staticmethod
+    def discard(path):
+        """Supprime un fichier déposé (tâche terminée ou annulée)"""
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    def run_job(self, job_id):
+        """
+        Exécute une tâche d'upload.
+
+        :return: True si le média a été finalisé
+        """
+        if not self._claim(job_id):
+            return False
+
+        job = db.session.get(UploadJob, job_id)
+        media = db.session.get(Media, job.media_id) if job.media_id else None
+
+        # Annonce supprimée entre-temps : rien à envoyer
+        if media is None:
+            job.status = 'cancelled'
+            db.session.commit()
+            self.discard(job.path)
+            return False
+
+        result = upload_file(job.path, job.file_type)
+
+        if result:
+            media.public_id = result['public_id']
+            media.url = result['url']
+            media.status = 'ready'
+            job.status = 'done'
+            job.last_error = None
+            try:
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                # Ne pas laisser d'asset orphelin sur Cloudinary
+                delete_file(result['public_id'], job.file_type)
+                raise
+            self.discard(job.path)
+            logger.info(f"Média #{media.id} finalisé ({result['public_id']})")
+            return True
+
+        if job.attempts >= self.max_attempts:
+            job.status = 'failed'
+            job.last_error = "Nombre maximal de tentatives atteint"
+            media.status = 'failed'
+            db.session.commit()
+            self.discard(job.path)
+            logger.error(f"Upload du média #{media.id} abandonné après {job.attempts} tentative(s)")
+            return False
+
+        job.status = 'pending'
+        job.locked_at = None
+        job.last_error = "Échec de l'upload Cloudinary"
+        job.next_attempt_at = datetime.now(timezone.utc) + self._backoff(job.attempts)
+        db.session.commit()
+        logger.warning(f"Upload du média #{media.id} reporté (tentative {job.attempts})")
+        return False
+
+    def run_due(self):
+        """Exécute immédiatement toutes les tâches dues (commande CLI)"""
+        return sum(1 for job_id in self.due_job_ids() if self.run_job(job_id))
+
+
+# Instance partagée, initialisée dans create_app()
+upload_queue = UploadQueue()
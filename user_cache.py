@@ -0,0 +1,158 @@
+"""
+Cache des identités pour Flask-Login.
+Le user_loader lisait la table user à chaque requête authentifiée ; il renvoie
+désormais un instantané en lecture seule (id, username, is_admin, phone) gardé
+dans un LRU borné avec TTL. L'objet ORM n'est rechargé qu'à la demande
+(UserSnapshot.to_orm()). Toute modification d'un utilisateur validée par un
+commit invalide son entrée ; dans les autres workers, le TTL borne l'écart.
+Les droits d'administration ne se fient pas au cache : is_admin() relit la base.
+"""
+
+import logging
+import threading
+
+from flask_login import UserMixin
+from sqlalchemy import event
+
+from models import db, User
+from cache import MemoryBackend
+
+logger = logging.getLogger(__name__)
+
+
+class UserSnapshot(UserMixin):
+    """Copie légère et immuable d'un utilisateur, suffisante pour current_user"""
+
+    __slots__ = ('id', 'username', 'is_admin', 'phone')
+
+    def __init__(self, id, username, is_admin, phone):
+        object.__setattr__(self, 'id', id)
+        object.__setattr__(self, 'username', username)
+        object.__setattr__(self, 'is_admin', bool(is_admin))
+        object.__setattr__(self, 'phone', phone)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("UserSnapshot est en lecture seule : utilisez to_orm() pour modifier")
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(user.id, user.username, user.is_admin, user.phone)
+
+    def to_orm(self):
+        """Recharge l'utilisateur ORM (relations, mot de passe, modifications)"""
+        return db.session.get(User, self.id)
+
+    def __repr__(self):
+        return f"<UserSnapshot {self.username} ({'Admin' if self.is_admin else 'User'})>"
+
+
+class UserCache:
+    """Extension Flask : LRU + TTL des instantanés d'utilisateurs, par id"""
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.ttl = 60
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config.get('USER_CACHE_TTL', 60)
+        max_entries = app.config.get('USER_CACHE_MAX_ENTRIES', 1024)
+        self.backend = MemoryBackend(max_entries=max_entries) if self.ttl > 0 else None
+        app.extensions['user_cache'] = self
+
+    def load(self, user_id):
+        """
+        Retourne l'instantané d'un utilisateur, depuis le cache ou la base.
+
+        :param user_id: Identifiant (int)
+        :return: UserSnapshot ou None si l'utilisateur n'existe pas
+        """
+        if self.backend is not None:
+            snapshot = self.backend.get(user_id)
+            self._count(snapshot is not None)
+            if snapshot is not None:
+                return snapshot
+
+        row = db.session.execute(
+            db.select(User.id, User.username, User.is_admin, User.phone).where(User.id == user_id)
+        ).first()
+        if row is None:
+            return None
+        snapshot = UserSnapshot(*row)
+        if self.backend is not None:
+            self.backend.set(user_id, snapshot, self.ttl)
+        return snapshot
+
+    def is_admin(self, user):
+        """
+        Droits d'administration relus en base, sans passer par le cache.
+        L'invalidation après commit ne touche que le worker courant : un
+        instantané d'un autre worker peut garder un droit retiré jusqu'au TTL.
+
+        :param user: current_user (UserSnapshot ou anonyme)
+        :return: True si l'utilisateur est administrateur en base
+        """
+        if not getattr(user, 'is_authenticated', False):
+            return False
+        is_admin = bool(db.session.execute(
+            db.select(User.is_admin).where(User.id == user.id)
+        ).scalar())
+        if is_admin != user.is_admin:
+            self.invalidate(user.id)
+        return is_admin
+
+    def _count(self, hit):
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        """Compteurs de succès/échecs du worker courant"""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+        }
+
+    def invalidate(self, *user_ids):
+        if self.backend is None:
+            return
+        for user_id in user_ids:
+            self.backend.delete(user_id)
+
+    def clear(self):
+        if self.backend is not None:
+            self.backend.clear()
+
+
+# Instance partagée, initialisée dans create_app()
+user_cache = UserCache()
+
+
+# === Invalidation après commit ===
+
+@event.listens_for(db.session, 'after_flush')
+def _collect_user_ids(db_session, flush_context):
+    user_ids = db_session.info.setdefault('user_cache_ids', set())
+    for obj in list(db_session.dirty) + list(db_session.deleted):
+        if isinstance(obj, User) and obj.id is not None:
+            user_ids.add(obj.id)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_users(db_session):
+    user_ids = db_session.info.pop('user_cache_ids', None)
+    if user_ids:
+        user_cache.invalidate(*user_ids)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_user_ids(db_session):
+    db_session.info.pop('user_cache_ids', None)